@@ -0,0 +1,228 @@
+"""
+Jeux de données des benchmarks, dimensionnés comme la production.
+
+Deux populations :
+    - la masse des passagers (profil, abonnement, quelques paiements) qui
+      pèse sur les Scan des rapports admin et les index par statut
+    - quelques passagers « actifs » dont l'historique (wallet, trajets,
+      paiements, tickets) a la taille des plus gros comptes réels ; les
+      requêtes mesurées tournent sur ces comptes
+
+Les données sont déterministes (graine fixe) pour que deux exécutions soient
+comparables ; les dates sont relatives à l'heure courante (abonnements actifs,
+tickets expirés).
+"""
+
+import math
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+PROFILES = {
+    # Itération rapide en local
+    'small': {
+        'users': 200, 'hot_users': 5, 'routes': 8, 'stops_per_route': 15,
+        'schedules_per_route': 10, 'buses': 10, 'connections_per_route': 20,
+        'wallet_tx': 60, 'trips': 40, 'payments': 20, 'tickets': 30, 'bus_trips': 300,
+    },
+    # Ordres de grandeur de la production
+    'production': {
+        'users': 5000, 'hot_users': 20, 'routes': 40, 'stops_per_route': 30,
+        'schedules_per_route': 48, 'buses': 120, 'connections_per_route': 250,
+        'wallet_tx': 600, 'trips': 400, 'payments': 120, 'tickets': 250, 'bus_trips': 8000,
+    },
+}
+
+NOW = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+SEED = 20260601
+
+
+def _iso(dt):
+    return dt.isoformat()
+
+
+def _write(dynamodb, table_name, items):
+    table = dynamodb.Table(table_name)
+    with table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    return len(items)
+
+
+def _routes(rng, size):
+    routes, stops, schedules = [], [], []
+    for r in range(size['routes']):
+        route_id = f"ROUTE#bench-{r:03d}"
+        routes.append({
+            'routeId': route_id, 'stopIndex': 'METADATA', 'name': f"Ligne {r + 1}",
+            'code': f"L{r + 1}", 'isActive': True, 'color': '#3B82F6',
+            'price': Decimal(rng.choice([25, 35, 50])), 'estimatedDuration': rng.randint(20, 90),
+            'createdAt': _iso(NOW - timedelta(days=400)), 'updatedAt': _iso(NOW - timedelta(days=30)),
+        })
+        # Tracé plausible: arrêts tous les ~400 m dans une direction donnée
+        latitude, longitude = 18.50 + rng.random() / 10, -72.35 + rng.random() / 10
+        heading = rng.uniform(0, 2 * math.pi)
+        for s in range(size['stops_per_route']):
+            heading += rng.uniform(-0.4, 0.4)
+            latitude += 0.0036 * math.cos(heading)
+            longitude += 0.0036 * math.sin(heading)
+            stops.append({
+                'routeId': route_id, 'stopIndex': f"STOP#{s:03d}", 'name': f"Arrêt {r + 1}.{s + 1}",
+                'latitude': Decimal(str(round(latitude, 6))),
+                'longitude': Decimal(str(round(longitude, 6))),
+                'order': s, 'estimatedTime': s * 3,
+            })
+        for d in range(size['schedules_per_route']):
+            schedules.append({
+                'scheduleId': f"SCHEDULE#bench-{r:03d}-{d:03d}", 'type': 'DEPARTURE', 'routeId': route_id,
+                'departureTime': f"{5 + d * 16 // size['schedules_per_route']:02d}:{(d * 20) % 60:02d}",
+                'days': ['MON', 'TUE', 'WED', 'THU', 'FRI'], 'isActive': True,
+                'createdAt': _iso(NOW - timedelta(days=200)),
+            })
+    return routes, stops, schedules
+
+
+def _user(rng, index, hot):
+    sub = f"bench-{'hot' if hot else 'user'}-{index:05d}"
+    created = NOW - timedelta(days=rng.randint(1, 700))
+    profile = {
+        'userId': f"USER#{sub}", 'type': 'PROFILE', 'email': f"{sub}@example.com",
+        'name': f"Passager {index}", 'phone': f"+509{30000000 + index}", 'role': 'PASSENGER',
+        'isActive': True, 'createdAt': _iso(created),
+    }
+    # Le wallet utilise le sub brut comme userId (voir shared/ledger)
+    wallet = {
+        'userId': sub, 'type': 'PROFILE', 'walletBalance': Decimal(rng.randint(0, 5000)),
+        'walletCurrency': 'HTG', 'walletEntriesSinceSnapshot': 0, 'lastWalletUpdate': _iso(NOW),
+    }
+    subscription = {
+        'userId': f"USER#{sub}", 'subscriptionId': f"SUB#{sub}", 'status': 'ACTIVE',
+        'type': rng.choice(['MONTHLY', 'WEEKLY']), 'startDate': _iso(NOW - timedelta(days=10)),
+        'endDate': _iso(NOW + timedelta(days=rng.randint(1, 60))), 'paymentId': f"PAY#{sub}-sub",
+        'createdAt': _iso(NOW - timedelta(days=10)),
+    }
+    return sub, [profile, wallet], subscription
+
+
+def _payments(rng, sub, count):
+    items = []
+    for p in range(count):
+        submitted = NOW - timedelta(hours=p * 30 + rng.randint(0, 20))
+        status = rng.choice(['APPROVED'] * 8 + ['PENDING', 'REJECTED'])
+        items.append({
+            'userId': sub, 'paymentId': f"PAY#{sub}-{p:04d}", 'amount': Decimal(rng.choice([250, 500, 1000, 1500])),
+            'currency': 'HTG', 'type': rng.choice(['subscription', 'wallet_recharge']), 'status': status,
+            'submittedAt': _iso(submitted), 'timestamp': _iso(submitted),
+        })
+    return items
+
+
+def _wallet_entries(rng, sub, count):
+    items = []
+    for t in range(count):
+        created = NOW - timedelta(hours=(count - t) * 7)
+        credit = t % 5 == 0
+        items.append({
+            'userId': sub, 'transactionId': f"tx-{created.strftime('%Y%m%d%H%M%S')}-{t:06x}",
+            'type': 'credit' if credit else 'debit', 'amount': Decimal(500 if credit else rng.choice([25, 35, 50])),
+            'description': 'Recharge wallet' if credit else 'Trajet', 'createdAt': _iso(created),
+        })
+    return items
+
+
+def _passenger_trips(rng, sub, count, route_ids):
+    items = []
+    for t in range(count):
+        boarded = NOW - timedelta(hours=t * 11 + rng.randint(0, 8))
+        items.append({
+            'passengerId': sub, 'tripId': f"TRIP#{sub}-{t:05d}", 'date': _iso(boarded),
+            'routeId': rng.choice(route_ids), 'boardedAt': _iso(boarded),
+            'alightedAt': _iso(boarded + timedelta(minutes=rng.randint(5, 60))),
+            'boardedStopName': 'Arrêt A', 'alightedStopName': 'Arrêt B',
+            'fare': Decimal(rng.choice([25, 35, 50])), 'paymentMethod': rng.choice(['subscription', 'wallet']),
+        })
+    return items
+
+
+def _tickets(rng, sub, count, subscription_id):
+    items = []
+    for t in range(count):
+        created = NOW - timedelta(hours=t * 13)
+        items.append({
+            'ticketId': f"bench-ticket-{sub}-{t:05d}", 'createdAt': _iso(created), 'userId': f"USER#{sub}",
+            'subscriptionId': subscription_id, 'status': rng.choice(['USED', 'EXPIRED', 'USED']),
+            'expiresAt': _iso(created + timedelta(minutes=15)),
+            'ttl': int((created + timedelta(minutes=15)).timestamp()),
+        })
+    return items
+
+
+def seed_routes(dynamodb, profile='small', routes=None, rng=None, counts=None):
+    """Lignes, arrêts et horaires seuls (`routes` remplace le nombre de lignes du profil)."""
+    size = dict(PROFILES[profile])
+    if routes:
+        size['routes'] = routes
+    rng = rng or random.Random(SEED)
+    counts = {} if counts is None else counts
+
+    routes, stops, schedules = _routes(rng, size)
+    counts['limajs-routes'] = _write(dynamodb, 'limajs-routes', routes + stops)
+    counts['limajs-schedules'] = _write(dynamodb, 'limajs-schedules', schedules)
+    return [route['routeId'] for route in routes]
+
+
+def seed(dynamodb, profile='small'):
+    """
+    Peuple les tables du stand-in. Retourne le contexte utilisé par les
+    scénarios : {'hot_users', 'routes', 'buses', 'counts'}.
+    """
+    size = PROFILES[profile]
+    rng = random.Random(SEED)
+    counts = {}
+
+    route_ids = seed_routes(dynamodb, profile, rng=rng, counts=counts)
+
+    buses = [f"BUS#bench-{b:03d}" for b in range(size['buses'])]
+    counts['limajs-buses'] = _write(dynamodb, 'limajs-buses', [
+        {'busId': bus_id, 'type': 'METADATA', 'status': 'ACTIVE', 'plateNumber': f"AA-{b:04d}"}
+        for b, bus_id in enumerate(buses)
+    ])
+
+    users, subscriptions, payments = [], [], []
+    wallet, trips, tickets = [], [], []
+    hot_users = []
+    for index in range(size['users']):
+        hot = index < size['hot_users']
+        sub, profile_items, subscription = _user(rng, index, hot)
+        users += profile_items
+        subscriptions.append(subscription)
+        if hot:
+            hot_users.append(sub)
+            payments += _payments(rng, sub, size['payments'])
+            wallet += _wallet_entries(rng, sub, size['wallet_tx'])
+            trips += _passenger_trips(rng, sub, size['trips'], route_ids)
+            tickets += _tickets(rng, sub, size['tickets'], subscription['subscriptionId'])
+        else:
+            payments += _payments(rng, sub, rng.randint(1, 4))
+
+    counts['limajs-users'] = _write(dynamodb, 'limajs-users', users)
+    counts['limajs-subscriptions'] = _write(dynamodb, 'limajs-subscriptions', subscriptions)
+    counts['limajs-payments'] = _write(dynamodb, 'limajs-payments', payments)
+    counts['limajs-wallet-transactions'] = _write(dynamodb, 'limajs-wallet-transactions', wallet)
+    counts['limajs-passenger-trips'] = _write(dynamodb, 'limajs-passenger-trips', trips)
+    counts['limajs-tickets'] = _write(dynamodb, 'limajs-tickets', tickets)
+
+    counts['limajs-trips'] = _write(dynamodb, 'limajs-trips', [
+        {'tripId': f"TRIP#bench-{t:06d}", 'type': 'METADATA', 'routeId': rng.choice(route_ids),
+         'busId': rng.choice(buses), 'status': 'COMPLETED', 'passengerCount': rng.randint(5, 60),
+         'timestamp': _iso(NOW - timedelta(minutes=t * 7))}
+        for t in range(size['bus_trips'])
+    ])
+
+    counts['limajs-websocket-connections'] = _write(dynamodb, 'limajs-websocket-connections', [
+        {'connectionId': f"conn-{r:03d}-{c:04d}", 'routeId': route_id, 'connectedAt': _iso(NOW)}
+        for r, route_id in enumerate(route_ids)
+        for c in range(size['connections_per_route'])
+    ])
+
+    return {'hot_users': hot_users, 'routes': route_ids, 'buses': buses, 'counts': counts}
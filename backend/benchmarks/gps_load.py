@@ -0,0 +1,288 @@
+"""
+Générateur de charge GPS -> WebSocket à l'échelle d'une ville.
+
+Simule une flotte de bus roulant le long des tracés des lignes (arrêts de
+limajs-routes, dans l'ordre) et des passagers abonnés aux lignes par
+WebSocket, contre le stand-in local (benchmarks/local_aws.py) :
+
+    bus --POST /gps/batch--> gps/ingest --(EventBridge)--> websocket/broadcast
+        --PostToConnection--> passagers
+
+Chaque position émise est suivie jusqu'à sa livraison aux clients : la
+latence bout en bout (position -> client) et le débit (positions/s,
+messages/s) sont mesurés. Les livraisons PostToConnection sont interceptées
+en process (événement botocore before-call), ce qui mesure le coût des
+handlers et non celui d'un faux réseau ; --churn simule des connexions
+mortes (GoneException).
+
+Deux modes :
+    - rejeu (défaut) : les pings sont traités aussi vite que possible, on
+      mesure le débit maximal atteint
+    - --realtime : les pings sont émis au rythme réel (--interval) ; si le
+      traitement ne suit pas, le retard apparaît dans la latence bout en bout
+
+Usage:
+    python benchmarks/gps_load.py                                     # 30 bus, 2 000 passagers
+    python benchmarks/gps_load.py --buses 300 --riders 20000 --interval 2 --duration 20
+    python benchmarks/gps_load.py --buses 300 --riders 20000 --skew 1.2 --realtime
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(__file__))
+
+from local_aws import LocalAWS
+from datasets import PROFILES, SEED, seed_routes
+from run import Context, http_event, percentile
+
+EARTH_RADIUS_M = 6371000
+
+
+def distance_m(a, b):
+    """Distance haversine entre deux points (lat, lon)."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+class Polyline:
+    """Tracé d'une ligne, parcouru en aller-retour."""
+
+    def __init__(self, points):
+        self.points = points
+        self.cumulative = [0.0]
+        for a, b in zip(points, points[1:]):
+            self.cumulative.append(self.cumulative[-1] + distance_m(a, b))
+        self.length = self.cumulative[-1] or 1.0
+
+    def position(self, distance):
+        """Point à `distance` mètres du départ (aller puis retour)."""
+        distance %= 2 * self.length
+        if distance > self.length:
+            distance = 2 * self.length - distance
+        for i in range(1, len(self.cumulative)):
+            if distance <= self.cumulative[i]:
+                segment = (self.cumulative[i] - self.cumulative[i - 1]) or 1.0
+                t = (distance - self.cumulative[i - 1]) / segment
+                (lat1, lon1), (lat2, lon2) = self.points[i - 1], self.points[i]
+                return lat1 + (lat2 - lat1) * t, lon1 + (lon2 - lon1) * t
+        return self.points[-1]
+
+
+def load_polylines(dynamodb):
+    """Tracés depuis limajs-routes (arrêts STOP#, triés par ordre)."""
+    stops = {}
+    table = dynamodb.Table('limajs-routes')
+    kwargs = {}
+    while True:
+        response = table.scan(**kwargs)
+        for item in response['Items']:
+            if item['stopIndex'].startswith('STOP#'):
+                stops.setdefault(item['routeId'], []).append(item)
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return {
+        route_id: Polyline([(float(s['latitude']), float(s['longitude'])) for s in sorted(items, key=lambda s: s['order'])])
+        for route_id, items in stops.items()
+    }
+
+
+def route_weights(route_ids, skew):
+    """Part des passagers par ligne (loi de Zipf, skew=0: uniforme)."""
+    weights = [1 / (rank + 1) ** skew for rank in range(len(route_ids))]
+    total = sum(weights)
+    return [w / total for w in weights]
+
+
+def seed_riders(dynamodb, route_ids, riders, skew, rng):
+    """Connexions WebSocket abonnées aux lignes ; retourne {routeId: nombre}."""
+    weights = route_weights(route_ids, skew)
+    per_route = {route_id: 0 for route_id in route_ids}
+    with dynamodb.Table('limajs-websocket-connections').batch_writer() as batch:
+        for index, route_id in enumerate(rng.choices(route_ids, weights=weights, k=riders)):
+            per_route[route_id] += 1
+            batch.put_item(Item={
+                'connectionId': f"rider-{index:06d}", 'routeId': route_id,
+                'connectedAt': datetime.utcnow().isoformat()
+            })
+    return per_route
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+
+class Deliveries:
+    """
+    Stand-in des clients WebSocket : intercepte PostToConnection, note
+    l'heure de livraison de chaque position et simule les connexions mortes.
+    """
+
+    def __init__(self, churn, rng):
+        self.churn = churn
+        self.rng = rng
+        self.emitted = {}    # (busId, timestamp) -> perf_counter à l'émission
+        self.latencies = []  # ms, une valeur par message livré
+        self.delivered = 0
+        self.gone = 0
+        self._lock = threading.Lock()
+
+    def emit(self, bus_id, timestamp, at):
+        with self._lock:
+            self.emitted[(bus_id, timestamp)] = at
+
+    def __call__(self, params, **kwargs):
+        now = time.perf_counter()
+        # `params` est la requête sérialisée : Data est le corps brut
+        data = json.loads(params['body'])['data']
+        with self._lock:
+            if self.churn and self.rng.random() < self.churn:
+                self.gone += 1
+                return _Response(410), {'Error': {'Code': 'GoneException', 'Message': 'Gone'}}
+            emitted = self.emitted.get((data['busId'], data['timestamp']))
+            self.delivered += 1
+            if emitted is not None:
+                self.latencies.append((now - emitted) * 1000)
+        return _Response(200), {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+
+class Fleet:
+    """Bus affectés aux lignes, chacun à une vitesse et une position de départ propres."""
+
+    def __init__(self, polylines, buses, rng):
+        route_ids = sorted(polylines)
+        self.buses = []
+        for b in range(buses):
+            route_id = route_ids[b % len(route_ids)]
+            polyline = polylines[route_id]
+            self.buses.append({
+                'busId': f"BUS#load-{b:04d}",
+                'routeId': route_id,
+                'polyline': polyline,
+                'speed': rng.uniform(4, 11),  # m/s (15-40 km/h)
+                'offset': rng.uniform(0, 2 * polyline.length),
+            })
+
+    def ping(self, bus, elapsed, sample_time):
+        latitude, longitude = bus['polyline'].position(bus['offset'] + bus['speed'] * elapsed)
+        return {
+            'latitude': round(latitude, 6), 'longitude': round(longitude, 6),
+            'speed': round(bus['speed'] * 3.6, 1), 'heading': 0, 'accuracy': 8,
+            'timestamp': sample_time.isoformat(timespec='milliseconds'),
+        }
+
+
+def run_load(args):
+    rng = random.Random(SEED)
+    with LocalAWS() as aws:
+        route_ids = seed_routes(aws.dynamodb, args.profile, routes=args.routes)
+        polylines = load_polylines(aws.dynamodb)
+        per_route = seed_riders(aws.dynamodb, route_ids, args.riders, args.skew, rng)
+        fleet = Fleet(polylines, args.buses, rng)
+
+        deliveries = Deliveries(args.churn, rng)
+        import boto3
+        boto3.DEFAULT_SESSION.events.register('before-call.apigatewaymanagementapi.PostToConnection', deliveries)
+
+        spec = importlib.util.spec_from_file_location('router', os.path.join(BACKEND_DIR, 'lambda', 'router', 'main.py'))
+        router = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(router)
+        broadcast = router.load_function('websocket/broadcast', 'lambda_handler')
+
+        busiest = max(per_route.values())
+        print(f"🚌 {args.buses} bus sur {len(route_ids)} lignes, ping toutes les {args.interval}s "
+              f"pendant {args.duration}s ({'temps réel' if args.realtime else 'rejeu'})")
+        print(f"👥 {args.riders} passagers connectés (ligne la plus suivie: {busiest}, skew {args.skew})")
+
+        ingest_ms, broadcast_ms, errors = [], [], []
+        lock = threading.Lock()
+
+        def process(bus, position, emitted_at):
+            """Une position: ingestion puis diffusion (relai EventBridge simulé en direct)."""
+            event = http_event('POST', '/gps/batch', f"driver-{bus['busId']}", groups='DRIVER',
+                               body={'busId': bus['busId'], 'routeId': bus['routeId'], 'positions': [position]})
+            started = time.perf_counter()
+            deliveries.emit(bus['busId'], position['timestamp'], emitted_at or started)
+            ingested = router.lambda_handler(event, Context())
+            ingested_at = time.perf_counter()
+            sent = broadcast({'detail': {'busId': bus['busId'], 'routeId': bus['routeId'], **position}}, Context())
+            finished = time.perf_counter()
+            with lock:
+                ingest_ms.append((ingested_at - started) * 1000)
+                broadcast_ms.append((finished - ingested_at) * 1000)
+                if ingested.get('statusCode', 500) >= 400 or sent.get('statusCode', 500) >= 400:
+                    errors.append(f"{ingested.get('statusCode')}/{sent.get('statusCode')}")
+
+        ticks = max(1, int(args.duration / args.interval))
+        start_sample = datetime.utcnow()
+        started = time.perf_counter()
+        futures = []
+        # Sortie des handlers masquée pour toute la durée du tir (redirect_stdout n'est pas par thread)
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for tick in range(ticks):
+                elapsed = tick * args.interval
+                if args.realtime:
+                    delay = started + elapsed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                sample_time = start_sample + timedelta(seconds=elapsed)
+                for bus in fleet.buses:
+                    # En temps réel, la latence part de l'heure prévue du ping (retard compris) ;
+                    # en rejeu, du début du traitement (sans l'attente dans la file)
+                    emitted_at = started + elapsed if args.realtime else None
+                    futures.append(pool.submit(process, bus, fleet.ping(bus, elapsed, sample_time), emitted_at))
+            for future in futures:
+                future.result()
+        wall = time.perf_counter() - started
+
+    pings = len(ingest_ms)
+    # Chaque passager reçoit les positions de tous les bus de sa ligne
+    required_messages = sum(per_route.get(bus['routeId'], 0) for bus in fleet.buses)
+    print(f"\n📈 {pings} positions en {wall:.1f}s")
+    print(f"   débit: {pings / wall:,.0f} positions/s (requis: {args.buses / args.interval:,.0f}/s), "
+          f"{deliveries.delivered / wall:,.0f} messages/s (requis: {required_messages / args.interval:,.0f}/s)")
+    if args.realtime:
+        print(f"   suit le rythme: {'oui' if wall <= args.duration * 1.05 else 'non'} "
+              f"(durée réelle {wall:.1f}s pour {ticks * args.interval:.0f}s simulées)")
+    for label, values in [('ingestion', ingest_ms), ('diffusion', broadcast_ms), ('bout en bout', deliveries.latencies)]:
+        if values:
+            print(f"   {label:<13} p50 {percentile(values, 50):8.2f} ms   p95 {percentile(values, 95):8.2f} ms   "
+                  f"p99 {percentile(values, 99):8.2f} ms")
+    print(f"   messages livrés: {deliveries.delivered}, connexions mortes: {deliveries.gone}, erreurs: {len(errors)}")
+    return 1 if errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--buses', type=int, default=30, help="Taille de la flotte")
+    parser.add_argument('--riders', type=int, default=2000, help="Passagers connectés (WebSocket)")
+    parser.add_argument('--interval', type=float, default=2.0, help="Secondes entre deux pings d'un bus")
+    parser.add_argument('--duration', type=float, default=10.0, help="Durée simulée (s)")
+    parser.add_argument('--skew', type=float, default=1.0, help="Concentration des abonnements (Zipf, 0 = uniforme)")
+    parser.add_argument('--routes', type=int, help="Nombre de lignes (défaut: celui du profil)")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='production', help="Profil des lignes")
+    parser.add_argument('--churn', type=float, default=0.0, help="Part des envois vers une connexion morte")
+    parser.add_argument('--workers', type=int, default=8, help="Invocations simultanées")
+    parser.add_argument('--realtime', action='store_true', help="Émettre au rythme réel")
+    return run_load(parser.parse_args())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
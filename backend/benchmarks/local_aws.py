@@ -0,0 +1,175 @@
+"""
+Stand-in local des services AWS utilisés par les handlers (benchmarks hors ligne).
+
+- DynamoDB, S3, API Gateway Management, Cognito : moto (mock_aws, en mémoire)
+- Amazon Location : LocalLocation, enregistré dans shared.clients (moto ne
+  couvre pas ce service)
+
+Les tables sont créées avec les clés telles que les handlers les lisent
+(voir TABLES). Chaque appel AWS est compté par opération via les événements
+botocore `before-call`, ce qui donne le nombre d'appels par requête.
+"""
+
+import os
+import threading
+from collections import Counter
+
+REGION = 'us-east-1'
+
+# Variables d'environnement posées avant l'import des handlers
+ENVIRONMENT = {
+    'AWS_REGION': REGION,
+    'AWS_DEFAULT_REGION': REGION,
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'AWS_S3_BUCKET_NAME': 'limajs-bench-uploads',
+    'INVOICE_BUCKET': 'limajs-invoices',
+    'QR_CACHE_BACKEND': 's3',
+    'PAGINATION_CURSOR_KEY': 'benchmark-cursor-key',
+    'WEBSOCKET_API_ID': 'benchmark',
+    'METRICS_OUTPUT': 'off',
+}
+
+BUCKETS = ['limajs-bench-uploads', 'limajs-invoices']
+
+# table -> (clé de partition, clé de tri, [(index, partition, tri), ...])
+TABLES = {
+    'limajs-users': ('userId', 'type', [('role-index', 'role', 'createdAt')]),
+    'limajs-routes': ('routeId', 'stopIndex', []),
+    'limajs-schedules': ('scheduleId', 'type', [('route-schedules-index', 'routeId', 'type')]),
+    'limajs-buses': ('busId', 'type', []),
+    'limajs-subscriptions': ('userId', 'subscriptionId', [
+        ('user-status-index', 'userId', 'status'),
+        ('status-enddate', 'status', 'endDate'),
+        ('payment-index', 'paymentId', None),
+    ]),
+    'limajs-payments': ('userId', 'paymentId', [
+        ('payment-id-index', 'paymentId', None),
+        ('status-timestamp-index', 'status', 'timestamp'),
+    ]),
+    'limajs-wallet-transactions': ('userId', 'transactionId', [('user-date', 'userId', 'createdAt')]),
+    'limajs-tickets': ('ticketId', 'createdAt', [('user-tickets-index', 'userId', 'createdAt')]),
+    'limajs-trips': ('tripId', 'type', []),
+    'limajs-passenger-trips': ('passengerId', 'tripId', [('passenger-date', 'passengerId', 'date')]),
+    'limajs-gps-positions': ('busId', 'timestamp', []),
+    'limajs-websocket-connections': ('connectionId', None, [('route-connections-index', 'routeId', None)]),
+    'limajs-nfc-cards': ('userId', 'cardId', [
+        ('nfc-uid-index', 'nfcUidHash', None),
+        ('status-index', 'status', None),
+        ('card-id-index', 'cardId', None),
+    ]),
+    'limajs-nfc-changelog': ('partition', 'changeId', []),
+}
+
+
+class CallCounter:
+    """Compte les appels AWS (service.Operation) depuis le dernier reset()."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, model, **kwargs):
+        with self._lock:
+            self.calls[f"{model.service_model.service_name}.{model.name}"] += 1
+
+    def reset(self):
+        with self._lock:
+            snapshot, self.calls = self.calls, Counter()
+        return snapshot
+
+
+class LocalLocation:
+    """Tracker Amazon Location en mémoire (dernière position par appareil)."""
+
+    def __init__(self, counter=None):
+        self.positions = {}
+        self.counter = counter
+
+    def batch_update_device_position(self, TrackerName, Updates):
+        if self.counter is not None:
+            self.counter.calls['location.BatchUpdateDevicePosition'] += 1
+        for update in Updates:
+            self.positions[(TrackerName, update['DeviceId'])] = update
+        return {'Errors': []}
+
+    def get_device_position(self, TrackerName, DeviceId):
+        if self.counter is not None:
+            self.counter.calls['location.GetDevicePosition'] += 1
+        return self.positions[(TrackerName, DeviceId)]
+
+
+def _table_definition(name, partition, sort, indexes):
+    attributes = {partition, sort} - {None}
+    key_schema = [{'AttributeName': partition, 'KeyType': 'HASH'}]
+    if sort:
+        key_schema.append({'AttributeName': sort, 'KeyType': 'RANGE'})
+
+    gsis = []
+    for index_name, index_partition, index_sort in indexes:
+        attributes |= {index_partition, index_sort} - {None}
+        index_keys = [{'AttributeName': index_partition, 'KeyType': 'HASH'}]
+        if index_sort:
+            index_keys.append({'AttributeName': index_sort, 'KeyType': 'RANGE'})
+        gsis.append({'IndexName': index_name, 'KeySchema': index_keys, 'Projection': {'ProjectionType': 'ALL'}})
+
+    definition = {
+        'TableName': name,
+        'KeySchema': key_schema,
+        'AttributeDefinitions': [{'AttributeName': a, 'AttributeType': 'S'} for a in sorted(attributes)],
+        'BillingMode': 'PAY_PER_REQUEST',
+    }
+    if gsis:
+        definition['GlobalSecondaryIndexes'] = gsis
+    return definition
+
+
+class LocalAWS:
+    """
+    Démarre le stand-in :
+
+        with LocalAWS() as aws:
+            seed(aws.dynamodb, 'small')
+            aws.counter.reset()
+            ...  # appeler les handlers
+            aws.counter.reset()  # -> Counter({'dynamodb.Query': 2, ...})
+    """
+
+    def __init__(self):
+        self.counter = CallCounter()
+        self.location = LocalLocation(self.counter)
+        self._mock = None
+
+    def __enter__(self):
+        os.environ.update(ENVIRONMENT)
+        try:
+            from moto import mock_aws
+        except ImportError:
+            raise SystemExit("moto est requis: pip install -r benchmarks/requirements.txt")
+        import boto3
+
+        self._mock = mock_aws()
+        self._mock.start()
+
+        boto3.setup_default_session(region_name=REGION)
+        boto3.DEFAULT_SESSION.events.register('before-call', self.counter)
+
+        from shared.clients import register_client, reset_clients
+        reset_clients()
+        register_client('location', self.location)
+
+        self.dynamodb = boto3.resource('dynamodb')
+        client = self.dynamodb.meta.client
+        for name, (partition, sort, indexes) in TABLES.items():
+            client.create_table(**_table_definition(name, partition, sort, indexes))
+
+        s3 = boto3.client('s3')
+        for bucket in BUCKETS:
+            s3.create_bucket(Bucket=bucket)
+
+        self.counter.reset()
+        return self
+
+    def __exit__(self, *exc):
+        self._mock.stop()
+        return False
@@ -0,0 +1,305 @@
+"""
+Benchmarks hors ligne des handlers Lambda.
+
+Chaque scénario appelle un handler en process (via le routeur unique,
+lambda/router/main.py) contre le stand-in local de benchmarks/local_aws.py,
+sur un jeu de données de taille production (benchmarks/datasets.py).
+
+Pour chaque endpoint : latence p50/p95/p99 (ms), latence du premier appel
+(import du module inclus) et nombre d'appels AWS par requête, détaillé par
+opération. Les latences mesurent le code du handler plus moto : elles se
+comparent d'une exécution à l'autre sur la même machine, pas à la prod.
+Le nombre d'appels, lui, est exact et stable.
+
+Usage:
+    python benchmarks/run.py                               # profil small
+    python benchmarks/run.py --profile production -n 200
+    python benchmarks/run.py wallet tickets                # filtrer les scénarios
+    python benchmarks/run.py --save baseline.json          # enregistrer une référence
+    python benchmarks/run.py --baseline baseline.json      # comparer (code 1 si régression)
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import math
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(__file__))
+
+from local_aws import LocalAWS
+from datasets import PROFILES, seed
+
+# (nom, construction de l'événement, (module, fonction) ou None pour le routeur)
+SCENARIOS = []
+
+
+def scenario(name, module=None, function='lambda_handler'):
+    def register(build):
+        SCENARIOS.append((name, build, (module, function) if module else None))
+        return build
+    return register
+
+
+class Context:
+    function_name = 'benchmark'
+    memory_limit_in_mb = 512
+
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+
+def http_event(method, path, sub, query=None, body=None, headers=None, groups='PASSENGER'):
+    """Événement HTTP API v2 tel que le transmet API Gateway (route $default)."""
+    claims = {'sub': sub, 'email': f"{sub}@example.com", 'cognito:groups': groups}
+    return {
+        'version': '2.0',
+        'routeKey': '$default',
+        'rawPath': path,
+        'headers': {'accept-encoding': 'gzip, br', 'content-type': 'application/json', **(headers or {})},
+        'queryStringParameters': query,
+        'body': json.dumps(body) if body is not None else None,
+        'isBase64Encoded': False,
+        'requestContext': {
+            'http': {'method': method, 'path': path},
+            'stage': '$default',
+            'requestId': str(uuid.uuid4()),
+            # jwt: HTTP API ; claims: lu directement par certains handlers (gps)
+            'authorizer': {'jwt': {'claims': claims}, 'claims': claims},
+        },
+    }
+
+
+def _pick(items, i):
+    return items[i % len(items)]
+
+
+@scenario('routes.list')
+def _(data, i):
+    return http_event('GET', '/routes', _pick(data['hot_users'], i))
+
+
+@scenario('routes.get')
+def _(data, i):
+    return http_event('GET', f"/routes/{_pick(data['routes'], i)}", _pick(data['hot_users'], i))
+
+
+@scenario('schedules.by_route')
+def _(data, i):
+    return http_event('GET', '/schedules', _pick(data['hot_users'], i), query={'routeId': _pick(data['routes'], i)})
+
+
+@scenario('users.me')
+def _(data, i):
+    return http_event('GET', '/users/me', _pick(data['hot_users'], i))
+
+
+@scenario('subscriptions.active')
+def _(data, i):
+    return http_event('GET', '/subscriptions/active', _pick(data['hot_users'], i))
+
+
+@scenario('wallet.balance')
+def _(data, i):
+    return http_event('GET', '/wallet/balance', _pick(data['hot_users'], i))
+
+
+@scenario('wallet.transactions')
+def _(data, i):
+    return http_event('GET', '/wallet/transactions', _pick(data['hot_users'], i), query={'limit': '20'})
+
+
+@scenario('wallet.pay')
+def _(data, i):
+    body = {'amount': 25, 'description': 'Trajet', 'relatedId': f"TRIP#bench-{i}"}
+    return http_event('POST', '/wallet/pay', _pick(data['hot_users'], i), body=body,
+                      headers={'idempotency-key': f"bench-pay-{uuid.uuid4()}"})
+
+
+@scenario('payments.history')
+def _(data, i):
+    return http_event('GET', '/payments/history', _pick(data['hot_users'], i), query={'limit': '20'})
+
+
+@scenario('trips.history')
+def _(data, i):
+    return http_event('GET', '/trips/history', _pick(data['hot_users'], i), query={'limit': '20'})
+
+
+@scenario('tickets.my')
+def _(data, i):
+    return http_event('GET', '/tickets/my', _pick(data['hot_users'], i))
+
+
+@scenario('tickets.generate')
+def _(data, i):
+    return http_event('POST', '/tickets/generate', _pick(data['hot_users'], i), body={'routeId': _pick(data['routes'], i)})
+
+
+@scenario('gps.batch')
+def _(data, i):
+    positions = [
+        {'latitude': 18.54 + k / 1000, 'longitude': -72.33 + k / 1000, 'speed': 30, 'timestamp': f"2026-06-01T08:{k:02d}:00"}
+        for k in range(10)
+    ]
+    return http_event('POST', '/gps/batch', 'bench-driver', groups='DRIVER',
+                      body={'busId': _pick(data['buses'], i), 'routeId': _pick(data['routes'], i), 'positions': positions})
+
+
+@scenario('admin.dashboard')
+def _(data, i):
+    return http_event('GET', '/admin/reports/dashboard', 'bench-admin', groups='ADMIN')
+
+
+@scenario('websocket.broadcast', module='websocket/broadcast')
+def _(data, i):
+    return {'detail': {'busId': _pick(data['buses'], i), 'routeId': _pick(data['routes'], i),
+                       'latitude': 18.54, 'longitude': -72.33, 'speed': 25, 'timestamp': '2026-06-01T08:00:00'}}
+
+
+def percentile(values, p):
+    """Percentile au rang le plus proche."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_scenario(aws, router, data, name, build, target, iterations, warmup, verbose):
+    handler = router.load_function(*target) if target else router.lambda_handler
+    latencies, calls, errors = [], Counter(), 0
+    cold_ms = first_error = None
+
+    for i in range(warmup + iterations):
+        event = build(data, i)
+        aws.counter.reset()
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            started = time.perf_counter()
+            try:
+                response = handler(event, Context())
+                status = response.get('statusCode', 200) if isinstance(response, dict) else 200
+            except Exception as e:
+                response, status = {'body': repr(e)}, 500
+            elapsed = (time.perf_counter() - started) * 1000
+        used = aws.counter.reset()
+
+        if cold_ms is None:
+            cold_ms = elapsed
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        calls.update(used)
+        if status >= 400:
+            errors += 1
+            if first_error is None:
+                first_error = f"{status} {str(response.get('body'))[:200]}"
+
+    if first_error:
+        print(f"   ❌ {errors}/{iterations} en erreur, ex: {first_error}")
+
+    return {
+        'n': iterations,
+        'errors': errors,
+        'coldMs': round(cold_ms, 2),
+        'p50': round(percentile(latencies, 50), 2),
+        'p95': round(percentile(latencies, 95), 2),
+        'p99': round(percentile(latencies, 99), 2),
+        'callsPerRequest': round(sum(calls.values()) / iterations, 2),
+        'calls': {op: round(count / iterations, 2) for op, count in calls.most_common()},
+    }
+
+
+def print_results(results):
+    print(f"\n{'scénario':<22}{'n':>5}{'err':>5}{'cold':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'appels':>8}  détail")
+    for name, r in results.items():
+        detail = ', '.join(f"{op} x{count:g}" for op, count in list(r['calls'].items())[:3])
+        print(f"{name:<22}{r['n']:>5}{r['errors']:>5}{r['coldMs']:>9.1f}{r['p50']:>9.2f}"
+              f"{r['p95']:>9.2f}{r['p99']:>9.2f}{r['callsPerRequest']:>8g}  {detail}")
+
+
+def compare(results, baseline, tolerance):
+    """Affiche l'écart à la référence ; retourne la liste des régressions."""
+    regressions = []
+    print(f"\nComparaison à la référence (tolérance latence {tolerance:.0%}):")
+    for name, r in results.items():
+        ref = baseline.get(name)
+        if not ref:
+            print(f"  {name:<22} (nouveau)")
+            continue
+        delta = {p: (r[p] - ref[p]) / ref[p] if ref[p] else 0 for p in ('p50', 'p95', 'p99')}
+        calls_delta = r['callsPerRequest'] - ref['callsPerRequest']
+        flags = []
+        if delta['p95'] > tolerance:
+            flags.append('p95')
+        if calls_delta > 0:
+            flags.append('appels')
+        if r['errors'] > ref.get('errors', 0):
+            flags.append('erreurs')
+        marker = '❌' if flags else '✅'
+        print(f"  {marker} {name:<22} p50 {delta['p50']:+.0%}  p95 {delta['p95']:+.0%}  p99 {delta['p99']:+.0%}  "
+              f"appels {ref['callsPerRequest']:g} -> {r['callsPerRequest']:g}"
+              + (f"  [{', '.join(flags)}]" if flags else ''))
+        if flags:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('filters', nargs='*', help="Sous-chaînes des noms de scénarios")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='small', help="Taille du jeu de données")
+    parser.add_argument('-n', '--iterations', type=int, default=50, help="Requêtes mesurées par scénario")
+    parser.add_argument('--warmup', type=int, default=3, help="Requêtes non mesurées (cold start inclus)")
+    parser.add_argument('--save', metavar='FICHIER', help="Enregistre les résultats comme référence (JSON)")
+    parser.add_argument('--baseline', metavar='FICHIER', help="Compare à une référence enregistrée")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Hausse de p95 tolérée (0.2 = +20%%)")
+    parser.add_argument('--verbose', action='store_true', help="Affiche la sortie des handlers")
+    args = parser.parse_args()
+
+    selected = [s for s in SCENARIOS if not args.filters or any(f in s[0] for f in args.filters)]
+    if not selected:
+        print("Aucun scénario sélectionné.")
+        return 1
+
+    with LocalAWS() as aws:
+        started = time.perf_counter()
+        data = seed(aws.dynamodb, args.profile)
+        total = sum(data['counts'].values())
+        print(f"🌱 Profil '{args.profile}': {total} éléments en {time.perf_counter() - started:.1f}s")
+
+        spec = importlib.util.spec_from_file_location('router', os.path.join(BACKEND_DIR, 'lambda', 'router', 'main.py'))
+        router = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(router)
+
+        results = {}
+        for name, build, target in selected:
+            print(f"⏱️  {name}...")
+            results[name] = run_scenario(aws, router, data, name, build, target,
+                                         args.iterations, args.warmup, args.verbose)
+
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'profile': args.profile, 'iterations': args.iterations, 'results': results}, f, indent=2)
+        print(f"\n💾 Référence enregistrée: {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            reference = json.load(f)
+        if reference.get('profile') != args.profile:
+            print(f"⚠️ Référence mesurée avec le profil '{reference.get('profile')}'")
+        if compare(results, reference['results'], args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from shared.db import get_item, update_item
+from shared.user_directory import TABLE_USERS, apply_changes, directory_entries, from_cognito, sync_user
+from boto3.dynamodb.types import TypeDeserializer
+
+deserializer = TypeDeserializer()
+
+def lambda_handler(event, context):
+    """
+    Consommateur du stream DynamoDB de limajs-users.
+    Répercute dans l'annuaire admin (shared.user_directory) les profils
+    créés, modifiés ou supprimés. Les mises à jour qui ne touchent pas aux
+    champs de l'annuaire (solde wallet, tokens push...) ne produisent aucune
+    écriture.
+    """
+    changes = []
+
+    for record in event.get('Records', []):
+        ddb = record.get('dynamodb', {})
+        old_image = _deserialize(ddb.get('OldImage'))
+        new_image = _deserialize(ddb.get('NewImage')) if record.get('eventName') != 'REMOVE' else {}
+
+        # Les entrées de l'annuaire elles-mêmes sont ignorées (directory_entries -> {})
+        old, new = directory_entries(old_image), directory_entries(new_image)
+        if old != new:
+            changes.append((old, new))
+
+    writes = apply_changes(changes) if changes else 0
+    if writes:
+        print(f"✅ Annuaire: {writes} entrées écrites pour {len(changes)} profils")
+
+    return {'profiles': len(changes), 'writes': writes}
+
+def cognito_handler(event, context):
+    """
+    Trigger Cognito post-confirmation.
+    Recopie les attributs du compte confirmé (email, nom, téléphone, rôle)
+    dans le profil et dans l'annuaire, sans attendre le stream.
+    """
+    if event.get('triggerSource') != 'PostConfirmation_ConfirmSignUp':
+        return event
+
+    try:
+        cognito_user = from_cognito({
+            'Username': event.get('userName'),
+            'UserAttributes': event['request'].get('userAttributes', {})
+        })
+        user_id = cognito_user.get('userId')
+        if not user_id:
+            return event
+
+        key = {'userId': user_id, 'type': 'PROFILE'}
+        previous = get_item(TABLE_USERS, key)
+
+        # Le profil (créé au signup) reste la référence : seuls les champs absents sont complétés
+        fields = {k: v for k, v in cognito_user.items() if k not in ('userId', 'enabled') and not (previous or {}).get(k)}
+        fields['confirmedAt'] = datetime.utcnow().isoformat()
+
+        expression = "SET " + ", ".join(f"#{name} = :{name}" for name in fields)
+        profile = update_item(
+            TABLE_USERS, key, expression,
+            {f":{name}": value for name, value in fields.items()},
+            {f"#{name}": name for name in fields}
+        )
+        sync_user(profile, previous)
+    except Exception as e:
+        # Ne jamais bloquer la confirmation du compte
+        print(f"❌ Annuaire: synchronisation Cognito impossible: {e}")
+
+    return event
+
+def _deserialize(image):
+    if not image:
+        return {}
+    return {key: deserializer.deserialize(value) for key, value in image.items()}
@@ -5,7 +5,8 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
-from shared.response import success, error
+from shared.response import success, error, optimize_response
+from shared.metrics import instrument
 from shared.db import scan_items, query_items, convert_floats
 from boto3.dynamodb.conditions import Key, Attr
 
@@ -15,6 +16,8 @@ TABLE_SUBSCRIPTIONS = os.environ.get('TABLE_SUBSCRIPTIONS', 'limajs-subscription
 TABLE_TRIPS = os.environ.get('TABLE_TRIPS', 'limajs-trips')
 TABLE_USERS = os.environ.get('TABLE_USERS', 'limajs-users')
 
+@instrument('reports')
+@optimize_response
 def lambda_handler(event, context):
     """
     Handler pour rapports financiers admin.
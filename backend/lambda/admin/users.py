@@ -1,12 +1,15 @@
 import json
 import os
 import sys
-import boto3
 from datetime import datetime
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from shared.response import success, error, get_http_method, get_path_parameters
-from shared.db import query_items, scan_items, convert_floats
+from shared.clients import LazyClient
+from shared.db import query_items, scan_items, convert_floats, batch_get_items
+from shared.pagination import parse_limit, InvalidCursor
+from shared.user_directory import search_users, directory_ready, from_cognito, normalize_phone
+from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key, Attr
 
 # Tables
@@ -16,14 +19,14 @@ TABLE_PAYMENTS = os.environ.get('TABLE_PAYMENTS', 'limajs-payments')
 TABLE_TRIPS = os.environ.get('TABLE_TRIPS', 'limajs-trips')
 
 # Cognito client
-cognito = boto3.client('cognito-idp')
+cognito = LazyClient('cognito-idp')
 USER_POOL_ID = os.environ.get('COGNITO_USER_POOL_ID')
 
 def lambda_handler(event, context):
     """
     Handler pour gestion admin des utilisateurs.
     Routes:
-    - GET /admin/users -> Liste tous les utilisateurs
+    - GET /admin/users -> Liste / recherche des utilisateurs (annuaire)
     - GET /admin/users/{userId} -> Détails d'un utilisateur
     - PUT /admin/users/{userId}/suspend -> Suspendre un utilisateur
     - PUT /admin/users/{userId}/activate -> Réactiver un utilisateur
@@ -51,54 +54,90 @@ def lambda_handler(event, context):
         return error(500, str(e))
 
 def list_users(event):
-    """Liste tous les utilisateurs avec pagination."""
+    """
+    Liste / recherche des utilisateurs depuis l'annuaire (shared.user_directory),
+    sans appel à Cognito. Tant que l'annuaire n'est pas rempli
+    (scripts/sync_user_directory.py), lecture directe de Cognito.
+    Query: q (préfixe du nom, de l'email ou du téléphone), field, role, limit, cursor
+    """
     query_params = event.get('queryStringParameters') or {}
     role_filter = query_params.get('role')  # PASSENGER, DRIVER, ADMIN
-    limit = int(query_params.get('limit', 50))
+    
+    if not directory_ready():
+        return list_users_cognito(query_params)
+    
+    try:
+        users, next_cursor = search_users(
+            query_params.get('q', ''),
+            role=role_filter,
+            field=query_params.get('field'),
+            limit=parse_limit(query_params, 50),
+            cursor=query_params.get('cursor')
+        )
+    except InvalidCursor:
+        return error(400, "Invalid cursor")
+    except ValueError as e:
+        return error(400, str(e))
+    
+    return success({
+        'users': users,
+        'count': len(users),
+        'nextCursor': next_cursor
+    })
+
+def list_users_cognito(query_params):
+    """
+    Liste / recherche dans Cognito (annuaire vide) : un seul filtre par appel,
+    préfixe de q ou rôle ; le curseur est le PaginationToken de Cognito.
+    """
+    role_filter = (query_params.get('role') or '').upper()
+    query = (query_params.get('q') or '').strip().replace('"', '')
+    params = {
+        'UserPoolId': USER_POOL_ID,
+        'Limit': min(parse_limit(query_params, 50), 60)  # max de ListUsers
+    }
+    if query_params.get('cursor'):
+        params['PaginationToken'] = query_params['cursor']
+    
+    if query:
+        field = query_params.get('field') or ('email' if '@' in query else 'name')
+        attribute = {'name': 'name', 'email': 'email', 'phone': 'phone_number'}.get(field)
+        if not attribute:
+            return error(400, "field must be one of name, email, phone")
+        if field == 'phone':
+            query = '+' + normalize_phone(query)
+        params['Filter'] = f'{attribute} ^= "{query}"'
+    elif role_filter:
+        params['Filter'] = f'custom:role = "{role_filter}"'
     
     try:
-        # Récupérer les utilisateurs depuis Cognito
-        params = {
-            'UserPoolId': USER_POOL_ID,
-            'Limit': limit
-        }
-        
-        if role_filter:
-            params['Filter'] = f'custom:role = "{role_filter}"'
-        
         response = cognito.list_users(**params)
-        
-        users = []
-        for user in response.get('Users', []):
-            user_data = {
-                'username': user['Username'],
-                'status': user['UserStatus'],
-                'enabled': user['Enabled'],
-                'createdAt': user['UserCreateDate'].isoformat(),
-                'lastModified': user['UserLastModifiedDate'].isoformat()
-            }
-            
-            # Extraire attributs
-            for attr in user.get('Attributes', []):
-                if attr['Name'] == 'email':
-                    user_data['email'] = attr['Value']
-                elif attr['Name'] == 'custom:role':
-                    user_data['role'] = attr['Value']
-                elif attr['Name'] == 'name':
-                    user_data['name'] = attr['Value']
-                elif attr['Name'] == 'sub':
-                    user_data['userId'] = f"USER#{attr['Value']}"
-            
-            users.append(user_data)
-        
-        return success({
-            'users': users,
-            'count': len(users)
-        })
-        
-    except Exception as e:
-        print(f"Error listing users: {e}")
-        return error(500, str(e))
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'InvalidParameterException' and 'PaginationToken' in params:
+            return error(400, "Invalid cursor")
+        raise
+    
+    accounts = [from_cognito(user) for user in response.get('Users', [])]
+    accounts = [account for account in accounts if account.get('userId')]
+    # Le profil DynamoDB fait foi (rôle, statut)
+    keys = [{'userId': account['userId'], 'type': 'PROFILE'} for account in accounts]
+    profiles = {item['userId']: item for item in batch_get_items(TABLE_USERS, keys)} if keys else {}
+    
+    users = []
+    for account in accounts:
+        profile = profiles.get(account['userId'], {})
+        user = {**account, **{k: profile[k] for k in ('name', 'phone', 'role', 'status') if profile.get(k)}}
+        user['role'] = user.get('role') or 'PASSENGER'
+        user['enabled'] = account.get('enabled', True) and profile.get('status') != 'SUSPENDED'
+        if role_filter and user['role'] != role_filter:
+            continue
+        users.append(user)
+    
+    return success({
+        'users': users,
+        'count': len(users),
+        'nextCursor': response.get('PaginationToken')
+    })
 
 def get_user_details(user_id):
     """Détails complets d'un utilisateur (Cognito + DynamoDB)."""
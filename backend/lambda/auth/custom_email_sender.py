@@ -7,6 +7,7 @@ from botocore.exceptions import ClientError
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from shared.resend_client import send_email
+from shared.templates import render
 
 # Note: Pour un vrai Custom Email Sender, le code est chiffré avec KMS.
 # Cette fonction est un template d'implémentation.
@@ -34,22 +35,13 @@ def lambda_handler(event, context):
         email_type = event['triggerSource'] # 'CustomEmailSender_SignUp' ou 'CustomEmailSender_ForgotPassword'
         
         subject = "Votre Code de Validation LimaJS"
-        html_content = f"""
-        <div style="font-family: sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
-            <h1 style="color: #333;">Bienvenue chez LimaJS !</h1>
-            <p>Voici votre code de vérification :</p>
-            <div style="background-color: #f4f4f4; padding: 15px; text-align: center; border-radius: 5px; font-size: 24px; font-weight: bold; letter-spacing: 5px;">
-                {decrypted_code}
-            </div>
-            <p style="color: #666; font-size: 12px; margin-top: 20px;">Ce code expirera dans quelques minutes.</p>
-        </div>
-        """
-        
         if email_type == 'CustomEmailSender_ForgotPassword':
             subject = "Réinitialisation de mot de passe LimaJS"
         
+        message = render('verification_code', subject=subject, code=decrypted_code)
+        
         # 2. Envoyer via Resend
-        success = send_email(email, subject, html_content)
+        success = send_email(email, message['subject'], message['html'], text=message['text'])
         
         if not success:
             raise Exception("Failed to send email via Resend")
@@ -1,17 +1,17 @@
 import json
 import os
 import sys
-import boto3
 from datetime import datetime
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from shared.response import success, error
+from shared.clients import LazyClient
 from shared.db import put_item, convert_floats
 
 TABLE_GPS = os.environ.get('TABLE_GPS', 'limajs-gps-positions')
 LOCATION_TRACKER = os.environ.get('AWS_LOCATION_TRACKER_NAME', 'limajs-bus-tracker')
 
-location = boto3.client('location')
+location = LazyClient('location')
 
 def lambda_handler(event, context):
     """
@@ -0,0 +1,101 @@
+"""
+Téléchargement des factures PDF.
+
+GET /invoices/{id} lit le PDF dans S3 et le renvoie tel quel, avec support
+des requêtes partielles (header Range -> 206 + Content-Range) pour les
+lecteurs PDF qui chargent le document par morceaux. Les factures étant
+adressées par contenu (voir generate.store_invoice), leur ETag est stable :
+If-None-Match -> 304 sans lecture S3.
+
+Au-delà de INVOICE_INLINE_MAX (limite de réponse Lambda), redirection vers
+l'URL présignée.
+"""
+
+import os
+import re
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.dirname(__file__))
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from shared.clients import get_client
+from shared.db import get_item, query_items
+from shared.response import (
+    error, get_header, get_http_method, get_path_parameters, get_user_sub,
+    binary_response, not_modified, etag_matches, user_has_role, CORS_HEADERS
+)
+
+S3_BUCKET = os.environ.get('INVOICE_BUCKET', 'limajs-invoices')
+TABLE_INVOICES = os.environ.get('TABLE_INVOICES', 'limajs-invoices')
+# Corps binaire max d'une réponse (6 Mo de réponse Lambda, base64 compris)
+INVOICE_INLINE_MAX = 4 * 1024 * 1024
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d+-\d*|-\d+)$')
+
+
+def lambda_handler(event, context=None):
+    if get_http_method(event) != 'GET':
+        return error(405, "Method not allowed")
+
+    invoice_id = get_path_parameters(event).get('id')
+    if not invoice_id:
+        return error(400, "invoiceId is required")
+
+    user_sub = get_user_sub(event)
+    if not user_sub:
+        return error(401, "Unauthorized")
+
+    invoice = find_invoice(event, invoice_id, f"USER#{user_sub}")
+    if not invoice or not invoice.get('pdfKey'):
+        return error(404, "Invoice not found")
+
+    etag = f'"{invoice["contentHash"][:32]}"' if invoice.get('contentHash') else None
+    cache_headers = {'Cache-Control': 'private, max-age=86400', 'Accept-Ranges': 'bytes'}
+    if etag:
+        cache_headers['ETag'] = etag
+        if etag_matches(event, etag):
+            return not_modified(etag, cache_headers)
+
+    range_header = get_header(event, 'Range')
+    if range_header and not RANGE_PATTERN.match(range_header.strip()):
+        return error(416, "Unsupported Range")
+
+    params = {'Bucket': S3_BUCKET, 'Key': invoice['pdfKey']}
+    if range_header:
+        params['Range'] = range_header.strip()
+    try:
+        obj = get_client('s3').get_object(**params)
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code == 'InvalidRange':
+            return error(416, "Requested range not satisfiable")
+        if code in ('NoSuchKey', '404'):
+            return error(404, "Invoice file not found")
+        raise
+
+    if obj['ContentLength'] > INVOICE_INLINE_MAX:
+        obj['Body'].close()
+        from generate import presign_invoice
+        return {
+            'statusCode': 302,
+            'headers': {'Location': presign_invoice(invoice['pdfKey']), **CORS_HEADERS},
+            'body': ''
+        }
+
+    headers = dict(cache_headers, **{'Content-Disposition': f'inline; filename="{invoice_id}.pdf"'})
+    if obj.get('ContentRange'):
+        headers['Content-Range'] = obj['ContentRange']
+    return binary_response(206 if range_header else 200, obj['Body'].read(), 'application/pdf', headers)
+
+
+def find_invoice(event, invoice_id, user_id):
+    """Facture de l'utilisateur ; un admin peut lire celle de n'importe qui."""
+    invoice = get_item(TABLE_INVOICES, {'invoiceId': invoice_id, 'userId': user_id})
+    if invoice:
+        return invoice
+
+    if user_has_role(event, 'ADMIN'):
+        invoices = query_items(TABLE_INVOICES, Key('invoiceId').eq(invoice_id))
+        return invoices[0] if invoices else None
+    return None
@@ -3,30 +3,35 @@ Génération de factures PDF pour LimaJS Motors
 Utilise ReportLab pour créer des factures professionnelles
 """
 
+import hashlib
+import importlib.util
 import io
+import json
 import os
+import sys
+import threading
+import time
 import uuid
 from datetime import datetime
 from decimal import Decimal
 
-try:
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import cm
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-    from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from shared.clients import LazyClient
+from shared.db import get_item, put_item, update_item
 
-import boto3
+# ReportLab (~100 ms d'import) n'est chargé qu'au rendu d'un PDF
+REPORTLAB_AVAILABLE = importlib.util.find_spec('reportlab') is not None
 
 # Configuration
 S3_BUCKET = os.environ.get('INVOICE_BUCKET', 'limajs-invoices')
 REGION = 'us-east-1'
+TABLE_INVOICES = os.environ.get('TABLE_INVOICES', 'limajs-invoices')
+PRESIGNED_URL_TTL = 604800  # 7 jours
+# URL présignée réutilisée tant qu'il lui reste plus d'un jour de validité
+PRESIGNED_URL_REFRESH_MARGIN = 86400
+INVOICE_RENDER_WORKERS = int(os.environ.get('INVOICE_RENDER_WORKERS', str(os.cpu_count() or 1)))
 
-s3 = boto3.client('s3', region_name=REGION)
+s3 = LazyClient('s3', region_name=REGION)
 
 
 def generate_invoice_number():
@@ -36,74 +41,116 @@ def generate_invoice_number():
     return f"INV-{now.year}-{now.month:02d}-{random_part}"
 
 
-def create_invoice_pdf(invoice_data: dict) -> bytes:
+# Styles et éléments fixes, construits une fois par processus (voir _layout)
+_layout_cache = None
+_layout_lock = threading.Lock()
+_flowables = threading.local()
+
+
+def _layout() -> dict:
+    """Feuille de styles, ParagraphStyle et TableStyle des factures (partagés, en lecture seule)"""
+    global _layout_cache
+    if _layout_cache is None:
+        with _layout_lock:
+            if _layout_cache is None:
+                from reportlab.lib import colors
+                from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+                from reportlab.lib.units import cm
+                from reportlab.platypus import TableStyle
+                from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+                
+                styles = getSampleStyleSheet()
+                
+                def info_style(status_color):
+                    return TableStyle([
+                        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                        ('FONTSIZE', (0, 0), (-1, -1), 10),
+                        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#374151')),
+                        ('TEXTCOLOR', (-1, -1), (-1, -1), status_color),
+                        ('FONTNAME', (-1, -1), (-1, -1), 'Helvetica-Bold'),
+                        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+                    ])
+                
+                _layout_cache = {
+                    'title': ParagraphStyle('Title', parent=styles['Heading1'], fontSize=24, textColor=colors.HexColor('#2563EB'), spaceAfter=20),
+                    'heading': ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=14, textColor=colors.HexColor('#1f2937'), spaceBefore=15, spaceAfter=10),
+                    'normal': ParagraphStyle('Normal', parent=styles['Normal'], fontSize=10, textColor=colors.HexColor('#374151')),
+                    'right': ParagraphStyle('Right', parent=styles['Normal'], fontSize=10, alignment=TA_RIGHT),
+                    'footer': ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.HexColor('#9CA3AF'), alignment=TA_CENTER),
+                    'info_paid': info_style(colors.HexColor('#10B981')),
+                    'info_unpaid': info_style(colors.HexColor('#EF4444')),
+                    'items': TableStyle([
+                        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2563EB')),
+                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                        ('FONTSIZE', (0, 0), (-1, -1), 10),
+                        ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+                        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+                        ('TOPPADDING', (0, 0), (-1, -1), 10),
+                        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E5E7EB')),
+                        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+                    ]),
+                    'totals': TableStyle([
+                        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+                        ('FONTNAME', (-2, -1), (-1, -1), 'Helvetica-Bold'),
+                        ('FONTSIZE', (-2, -1), (-1, -1), 12),
+                        ('TEXTCOLOR', (-1, -1), (-1, -1), colors.HexColor('#2563EB')),
+                        ('TOPPADDING', (0, 0), (-1, -1), 5),
+                    ]),
+                    'info_widths': [4*cm, 6*cm],
+                    'item_widths': [8*cm, 2*cm, 3.5*cm, 3.5*cm],
+                }
+    return _layout_cache
+
+
+def _static_flowables():
     """
-    Génère un PDF de facture
-    
-    Args:
-        invoice_data: {
-            'invoiceNumber': str,
-            'date': str,
-            'dueDate': str,
-            'status': 'unpaid' | 'paid',
-            'customer': {
-                'name': str,
-                'email': str,
-                'phone': str
-            },
-            'items': [{
-                'description': str,
-                'quantity': int,
-                'unitPrice': Decimal,
-                'total': Decimal
-            }],
-            'subtotal': Decimal,
-            'total': Decimal,
-            'currency': str,
-            'period': {'start': str, 'end': str}  # for subscriptions
-        }
+    En-tête et pied de page. Les flowables gardent un état de mise en page :
+    un jeu par thread (les rendus parallèles ne se les partagent pas).
     """
-    if not REPORTLAB_AVAILABLE:
-        raise ImportError("ReportLab is required for PDF generation. Install with: pip install reportlab")
-    
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
-    
-    elements = []
-    styles = getSampleStyleSheet()
+    cached = getattr(_flowables, 'value', None)
+    if cached is None:
+        from reportlab.platypus import Paragraph, Spacer
+        
+        layout = _layout()
+        header = [
+            Paragraph("LIMAJS MOTORS", layout['title']),
+            Paragraph("Transport Collectif - Haiti", layout['normal']),
+            Spacer(1, 20),
+        ]
+        footer = [
+            Spacer(1, 40),
+            Paragraph("Merci pour votre confiance!", layout['footer']),
+            Paragraph("LimaJS Motors - Transport Collectif", layout['footer']),
+            Paragraph("Email: contact@limajs.com", layout['footer']),
+        ]
+        cached = _flowables.value = (header, footer)
+    return cached
+
+
+def invoice_elements(invoice_data: dict) -> list:
+    """Flowables d'une facture (en-tête, détails, pied de page)"""
+    from reportlab.platypus import Paragraph, Spacer, Table
     
-    # Custom styles
-    title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=24, textColor=colors.HexColor('#2563EB'), spaceAfter=20)
-    heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=14, textColor=colors.HexColor('#1f2937'), spaceBefore=15, spaceAfter=10)
-    normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=10, textColor=colors.HexColor('#374151'))
-    right_style = ParagraphStyle('Right', parent=styles['Normal'], fontSize=10, alignment=TA_RIGHT)
+    layout = _layout()
+    header, footer = _static_flowables()
+    normal_style = layout['normal']
+    heading_style = layout['heading']
     
-    # Header
-    elements.append(Paragraph("LIMAJS MOTORS", title_style))
-    elements.append(Paragraph("Transport Collectif - Haiti", normal_style))
-    elements.append(Spacer(1, 20))
+    elements = list(header)
     
     # Invoice Info
-    status_color = colors.HexColor('#10B981') if invoice_data['status'] == 'paid' else colors.HexColor('#EF4444')
-    status_text = 'PAYÉE' if invoice_data['status'] == 'paid' else 'NON PAYÉE'
-    
+    paid = invoice_data['status'] == 'paid'
     invoice_info = [
         ['FACTURE', f"#{invoice_data['invoiceNumber']}"],
         ['Date', invoice_data['date']],
         ['Échéance', invoice_data['dueDate']],
-        ['Statut', status_text]
+        ['Statut', 'PAYÉE' if paid else 'NON PAYÉE']
     ]
     
-    info_table = Table(invoice_info, colWidths=[4*cm, 6*cm])
-    info_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#374151')),
-        ('TEXTCOLOR', (-1, -1), (-1, -1), status_color),
-        ('FONTNAME', (-1, -1), (-1, -1), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-    ]))
+    info_table = Table(invoice_info, colWidths=layout['info_widths'])
+    info_table.setStyle(layout['info_paid'] if paid else layout['info_unpaid'])
     elements.append(info_table)
     elements.append(Spacer(1, 20))
     
@@ -128,18 +175,8 @@ def create_invoice_pdf(invoice_data: dict) -> bytes:
             f"{item['total']} {invoice_data['currency']}"
         ])
     
-    items_table = Table(table_data, colWidths=[8*cm, 2*cm, 3.5*cm, 3.5*cm])
-    items_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2563EB')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#E5E7EB')),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-    ]))
+    items_table = Table(table_data, colWidths=layout['item_widths'])
+    items_table.setStyle(layout['items'])
     elements.append(items_table)
     elements.append(Spacer(1, 10))
     
@@ -148,14 +185,8 @@ def create_invoice_pdf(invoice_data: dict) -> bytes:
         ['', '', 'Sous-total:', f"{invoice_data['subtotal']} {invoice_data['currency']}"],
         ['', '', 'TOTAL:', f"{invoice_data['total']} {invoice_data['currency']}"]
     ]
-    total_table = Table(total_data, colWidths=[8*cm, 2*cm, 3.5*cm, 3.5*cm])
-    total_table.setStyle(TableStyle([
-        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (-2, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (-2, -1), (-1, -1), 12),
-        ('TEXTCOLOR', (-1, -1), (-1, -1), colors.HexColor('#2563EB')),
-        ('TOPPADDING', (0, 0), (-1, -1), 5),
-    ]))
+    total_table = Table(total_data, colWidths=layout['item_widths'])
+    total_table.setStyle(layout['totals'])
     elements.append(total_table)
     
     # Period (for subscriptions)
@@ -164,21 +195,114 @@ def create_invoice_pdf(invoice_data: dict) -> bytes:
         period = invoice_data['period']
         elements.append(Paragraph(f"<b>Période:</b> {period['start']} - {period['end']}", normal_style))
     
-    # Footer
-    elements.append(Spacer(1, 40))
-    footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.HexColor('#9CA3AF'), alignment=TA_CENTER)
-    elements.append(Paragraph("Merci pour votre confiance!", footer_style))
-    elements.append(Paragraph("LimaJS Motors - Transport Collectif", footer_style))
-    elements.append(Paragraph("Email: contact@limajs.com", footer_style))
+    elements.extend(footer)
+    return elements
+
+
+def _build(elements) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate
     
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm)
     doc.build(elements)
-    buffer.seek(0)
     return buffer.getvalue()
 
 
+def create_invoice_pdf(invoice_data: dict) -> bytes:
+    """
+    Génère un PDF de facture
+    
+    Args:
+        invoice_data: {
+            'invoiceNumber': str,
+            'date': str,
+            'dueDate': str,
+            'status': 'unpaid' | 'paid',
+            'customer': {
+                'name': str,
+                'email': str,
+                'phone': str
+            },
+            'items': [{
+                'description': str,
+                'quantity': int,
+                'unitPrice': Decimal,
+                'total': Decimal
+            }],
+            'subtotal': Decimal,
+            'total': Decimal,
+            'currency': str,
+            'period': {'start': str, 'end': str}  # for subscriptions
+        }
+    """
+    if not REPORTLAB_AVAILABLE:
+        raise ImportError("ReportLab is required for PDF generation. Install with: pip install reportlab")
+    
+    return _build(invoice_elements(invoice_data))
+
+
+def create_invoices_pdf(invoices: list) -> bytes:
+    """Un seul PDF multi-pages (une facture par page), pour téléchargement admin"""
+    if not REPORTLAB_AVAILABLE:
+        raise ImportError("ReportLab is required for PDF generation. Install with: pip install reportlab")
+    
+    from reportlab.platypus import PageBreak
+    
+    elements = []
+    for i, invoice_data in enumerate(invoices):
+        if i:
+            elements.append(PageBreak())
+        elements.extend(invoice_elements(invoice_data))
+    return _build(elements)
+
+
+def render_invoices(invoices: list, workers: int = None) -> list:
+    """
+    Rend plusieurs factures en parallèle sur un pool de processus (le rendu
+    ReportLab est CPU-bound). Retourne les PDF dans l'ordre des factures.
+    
+    Sans multiprocessing disponible (ex: Lambda, sans /dev/shm), le rendu
+    se fait dans le processus courant.
+    """
+    workers = workers or INVOICE_RENDER_WORKERS
+    if workers <= 1 or len(invoices) <= 1:
+        return [create_invoice_pdf(invoice_data) for invoice_data in invoices]
+    
+    import multiprocessing
+    import pickle
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+    
+    # fork: les workers héritent des modules déjà chargés (ReportLab, styles)
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(invoices)), mp_context=context) as pool:
+            chunksize = max(1, len(invoices) // (workers * 4))
+            return list(pool.map(create_invoice_pdf, invoices, chunksize=chunksize))
+    except (OSError, NotImplementedError, pickle.PicklingError, BrokenProcessPool) as e:
+        print(f"⚠️ Process pool unavailable ({e}), rendering in-process")
+        return [create_invoice_pdf(invoice_data) for invoice_data in invoices]
+
+
+def invoice_key(invoice_number: str) -> str:
+    """Clé S3 du PDF d'une facture"""
+    return f"invoices/{invoice_number}.pdf"
+
+
+def presign_invoice(key: str) -> str:
+    """URL présignée (7 jours) du PDF"""
+    return s3.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': S3_BUCKET, 'Key': key},
+        ExpiresIn=PRESIGNED_URL_TTL
+    )
+
+
 def upload_invoice_to_s3(pdf_bytes: bytes, invoice_number: str) -> str:
     """Upload la facture PDF vers S3 et retourne l'URL"""
-    key = f"invoices/{invoice_number}.pdf"
+    key = invoice_key(invoice_number)
     
     s3.put_object(
         Bucket=S3_BUCKET,
@@ -187,14 +311,68 @@ def upload_invoice_to_s3(pdf_bytes: bytes, invoice_number: str) -> str:
         ContentType='application/pdf'
     )
     
-    # Generate presigned URL (valid 7 days)
-    url = s3.generate_presigned_url(
-        'get_object',
-        Params={'Bucket': S3_BUCKET, 'Key': key},
-        ExpiresIn=604800  # 7 days
-    )
+    return presign_invoice(key)
+
+
+def invoice_content_hash(invoice_data: dict, user_id: str) -> str:
+    """
+    Empreinte du contenu d'une facture : tout sauf le numéro et la date
+    d'émission. Deux demandes identiques (ex: rappels J-7, J-3, J-0 du même
+    renouvellement) ont la même empreinte.
+    """
+    content = {k: v for k, v in invoice_data.items() if k not in ('invoiceNumber', 'date')}
+    canonical = json.dumps({'userId': user_id, 'invoice': content}, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def store_invoice(invoice_data: dict, user_id: str, record: dict = None) -> dict:
+    """
+    Stockage adressé par contenu : l'identifiant de facture dérive de
+    l'empreinte de son contenu. Si la facture existe déjà, ni rendu ni upload :
+    l'URL présignée est réutilisée (et renouvelée à l'approche de l'expiration).
+    
+    Args:
+        invoice_data: Données de la facture (format create_invoice_pdf)
+        user_id: Propriétaire (clé de tri de limajs-invoices)
+        record: Attributs supplémentaires de l'enregistrement (subscriptionId, status...)
+    
+    Returns:
+        {'invoiceId', 'invoiceNumber', 'pdfUrl', 's3Bucket', 's3Key', 'created'}
+    """
+    digest = invoice_content_hash(invoice_data, user_id)
+    invoice_id = f"INV-{digest[:20].upper()}"
+    key = {'invoiceId': invoice_id, 'userId': user_id}
+    now = int(time.time())
+    
+    existing = get_item(TABLE_INVOICES, key)
+    if existing and existing.get('pdfKey'):
+        url = existing.get('pdfUrl')
+        if not url or int(existing.get('urlExpiresAt', 0)) - now < PRESIGNED_URL_REFRESH_MARGIN:
+            url = presign_invoice(existing['pdfKey'])
+            update_item(TABLE_INVOICES, key, "SET pdfUrl = :url, urlExpiresAt = :expires",
+                        {':url': url, ':expires': now + PRESIGNED_URL_TTL})
+        return {
+            'invoiceId': invoice_id, 'invoiceNumber': invoice_id, 'pdfUrl': url,
+            's3Bucket': S3_BUCKET, 's3Key': existing['pdfKey'], 'created': False
+        }
+    
+    invoice_data = dict(invoice_data, invoiceNumber=invoice_id)
+    invoice_data['date'] = invoice_data.get('date') or datetime.now().strftime('%d/%m/%Y')
+    url = upload_invoice_to_s3(create_invoice_pdf(invoice_data), invoice_id)
     
-    return url
+    put_item(TABLE_INVOICES, {
+        **(record or {}),
+        **key,
+        'contentHash': digest,
+        'pdfKey': invoice_key(invoice_id),
+        'pdfUrl': url,
+        'urlExpiresAt': now + PRESIGNED_URL_TTL,
+        'createdAt': datetime.now().isoformat()
+    })
+    return {
+        'invoiceId': invoice_id, 'invoiceNumber': invoice_id, 'pdfUrl': url,
+        's3Bucket': S3_BUCKET, 's3Key': invoice_key(invoice_id), 'created': True
+    }
 
 
 def generate_and_upload_invoice(invoice_data: dict) -> dict:
@@ -205,7 +383,9 @@ def generate_and_upload_invoice(invoice_data: dict) -> dict:
         {
             'invoiceNumber': str,
             'pdfUrl': str,
-            'pdfBytes': bytes
+            'pdfBytes': bytes,
+            's3Bucket': str,
+            's3Key': str
         }
     """
     # Generate invoice number if not provided
@@ -225,10 +405,52 @@ def generate_and_upload_invoice(invoice_data: dict) -> dict:
     return {
         'invoiceNumber': invoice_data['invoiceNumber'],
         'pdfUrl': pdf_url,
-        'pdfBytes': pdf_bytes
+        'pdfBytes': pdf_bytes,
+        's3Bucket': S3_BUCKET,
+        's3Key': invoice_key(invoice_data['invoiceNumber'])
     }
 
 
+def generate_invoice_batch(invoices: list, combined: bool = False, upload_workers: int = 8) -> dict:
+    """
+    Facturation en lot (fin de mois) : rendu sur tous les cœurs, uploads S3
+    en parallèle, et en option un PDF unique de toutes les factures.
+    
+    Returns:
+        {
+            'invoices': [{'invoiceNumber', 'pdfUrl', 's3Bucket', 's3Key'}],
+            'combinedUrl': str | None
+        }
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    today = datetime.now().strftime('%d/%m/%Y')
+    for invoice_data in invoices:
+        invoice_data['invoiceNumber'] = invoice_data.get('invoiceNumber') or generate_invoice_number()
+        invoice_data['date'] = invoice_data.get('date') or today
+    
+    pdfs = render_invoices(invoices)
+    
+    def upload(args):
+        invoice_data, pdf_bytes = args
+        number = invoice_data['invoiceNumber']
+        return {
+            'invoiceNumber': number,
+            'pdfUrl': upload_invoice_to_s3(pdf_bytes, number),
+            's3Bucket': S3_BUCKET,
+            's3Key': invoice_key(number)
+        }
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(upload_workers, len(pdfs)))) as pool:
+        results = list(pool.map(upload, zip(invoices, pdfs)))
+    
+    combined_url = None
+    if combined and invoices:
+        combined_url = upload_invoice_to_s3(create_invoices_pdf(invoices), f"batches/BATCH-{uuid.uuid4().hex[:12].upper()}")
+    
+    return {'invoices': results, 'combinedUrl': combined_url}
+
+
 # Example usage
 if __name__ == '__main__':
     test_data = {
@@ -0,0 +1,328 @@
+"""
+Bundle hors-ligne des cartes NFC pour les appareils chauffeurs.
+
+Le job (EventBridge, toutes les 5 minutes) compile les cartes ACTIVE ayant un
+abonnement actif en un fichier binaire signé, versionné, accompagné de deltas
+depuis les versions récentes. L'app chauffeur valide les taps hors-ligne par
+recherche dichotomique et ne télécharge que les changements.
+
+Format (entiers big-endian):
+    Bundle complet  : en-tête '>4sBBHQII' (b'LJNF', format, flags, réservé,
+                      version, generatedAt, count) puis `count` entrées
+                      triées de 20 octets (16 premiers octets du SHA-256 du
+                      UID + expiration u32 epoch), puis HMAC-SHA256 (32 octets).
+    Delta           : en-tête '>4sBBHQQIII' (b'LJND', format, flags, réservé,
+                      fromVersion, toVersion, generatedAt, added, removed),
+                      entrées ajoutées/modifiées (20 octets), hashes retirés
+                      (16 octets), puis HMAC-SHA256.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from shared.response import success, error, get_user_sub, user_has_role
+from shared.db import get_table
+from shared import secrets
+from shared.clients import get_client
+from boto3.dynamodb.conditions import Key
+
+TABLE_NFC = os.environ.get('TABLE_NFC', 'limajs-nfc-cards')
+TABLE_SUBSCRIPTIONS = os.environ.get('TABLE_SUBSCRIPTIONS', 'limajs-subscriptions')
+BUNDLE_BUCKET = os.environ.get('NFC_BUNDLE_BUCKET') or os.environ.get('INVOICE_BUCKET', 'limajs-invoices')
+BUNDLE_PREFIX = 'nfc-bundles/'
+MAX_DELTAS = int(os.environ.get('NFC_BUNDLE_MAX_DELTAS', 12))  # ~1h de retard rattrapable par delta
+URL_EXPIRES_IN = 300
+MANIFEST_TTL = 60
+
+FORMAT_VERSION = 1
+HASH_SIZE = 16
+ENTRY = struct.Struct('>16sI')
+BUNDLE_HEADER = struct.Struct('>4sBBHQII')
+DELTA_HEADER = struct.Struct('>4sBBHQQIII')
+SIGNATURE_SIZE = 32
+
+_manifest_cache = {'value': None, 'loaded_at': 0}
+
+secrets.require_signing_key('NFC_BUNDLE_SIGNING_KEY')
+
+
+def get_s3():
+    return get_client('s3')
+
+
+def get_signing_key():
+    """Clé HMAC partagée avec les apps chauffeur (secret généré par l'infra, sinon env)."""
+    return secrets.get_signing_key('NFC_BUNDLE_SIGNING_KEY')
+
+
+# =============================================================================
+# COLLECTE
+# =============================================================================
+
+def _query_all(table, **kwargs):
+    while True:
+        response = table.query(**kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def _to_epoch(value):
+    if not value:
+        return None
+    return int(datetime.fromisoformat(str(value).replace('Z', '')).timestamp())
+
+
+def collect_entries():
+    """
+    Cartes ACTIVE jointes à la fin de droit de leur titulaire.
+    Retourne {hash16 (bytes): expiration (epoch)}.
+    """
+    now = datetime.utcnow().isoformat()
+
+    # Fin de droit par utilisateur = abonnement actif le plus long
+    entitlements = {}
+    for sub in _query_all(
+        get_table(TABLE_SUBSCRIPTIONS),
+        IndexName='status-enddate',
+        KeyConditionExpression=Key('status').eq('ACTIVE') & Key('endDate').gte(now),
+        ProjectionExpression='userId, endDate'
+    ):
+        end = _to_epoch(sub.get('endDate'))
+        if end and end > entitlements.get(sub.get('userId'), 0):
+            entitlements[sub['userId']] = end
+
+    entries = {}
+    for card in _query_all(
+        get_table(TABLE_NFC),
+        IndexName='status-index',
+        KeyConditionExpression=Key('status').eq('ACTIVE'),
+        ProjectionExpression='userId, nfcUidHash, expiryDate'
+    ):
+        expiry = entitlements.get(card.get('userId'))
+        if not expiry or not card.get('nfcUidHash'):
+            continue
+        card_expiry = _to_epoch(card.get('expiryDate'))
+        if card_expiry:
+            expiry = min(expiry, card_expiry)
+        entries[bytes.fromhex(card['nfcUidHash'])[:HASH_SIZE]] = expiry
+
+    return entries
+
+
+# =============================================================================
+# ENCODAGE
+# =============================================================================
+
+def _sign(payload, key):
+    return payload + hmac.new(key, payload, hashlib.sha256).digest()
+
+
+def _encode_entries(entries):
+    return b''.join(ENTRY.pack(h, entries[h]) for h in sorted(entries))
+
+
+def encode_bundle(entries, version, key):
+    header = BUNDLE_HEADER.pack(b'LJNF', FORMAT_VERSION, 0, 0, version, int(time.time()), len(entries))
+    return _sign(header + _encode_entries(entries), key)
+
+
+def decode_bundle(data, key):
+    """Relit un bundle complet (vérifie la signature)."""
+    payload, signature = data[:-SIGNATURE_SIZE], data[-SIGNATURE_SIZE:]
+    if not hmac.compare_digest(hmac.new(key, payload, hashlib.sha256).digest(), signature):
+        raise ValueError("Invalid bundle signature")
+    magic, _, _, _, version, _, count = BUNDLE_HEADER.unpack_from(payload)
+    if magic != b'LJNF':
+        raise ValueError("Not an NFC bundle")
+    entries = {}
+    for i in range(count):
+        h, expiry = ENTRY.unpack_from(payload, BUNDLE_HEADER.size + i * ENTRY.size)
+        entries[h] = expiry
+    return version, entries
+
+
+def diff_entries(old, new):
+    """Changements pour passer de `old` à `new`: {hash: expiration ou None (retiré)}."""
+    changes = {h: e for h, e in new.items() if old.get(h) != e}
+    changes.update({h: None for h in old if h not in new})
+    return changes
+
+
+def encode_delta(changes, from_version, to_version, key):
+    added = {h: e for h, e in changes.items() if e is not None}
+    removed = sorted(h for h, e in changes.items() if e is None)
+    header = DELTA_HEADER.pack(b'LJND', FORMAT_VERSION, 0, 0, from_version, to_version,
+                               int(time.time()), len(added), len(removed))
+    return _sign(header + _encode_entries(added) + b''.join(removed), key)
+
+
+def decode_delta(data, key):
+    payload, signature = data[:-SIGNATURE_SIZE], data[-SIGNATURE_SIZE:]
+    if not hmac.compare_digest(hmac.new(key, payload, hashlib.sha256).digest(), signature):
+        raise ValueError("Invalid delta signature")
+    magic, _, _, _, from_version, to_version, _, added, removed = DELTA_HEADER.unpack_from(payload)
+    if magic != b'LJND':
+        raise ValueError("Not an NFC delta")
+    changes = {}
+    offset = DELTA_HEADER.size
+    for _ in range(added):
+        h, expiry = ENTRY.unpack_from(payload, offset)
+        changes[h] = expiry
+        offset += ENTRY.size
+    for _ in range(removed):
+        changes[payload[offset:offset + HASH_SIZE]] = None
+        offset += HASH_SIZE
+    return from_version, to_version, changes
+
+
+# =============================================================================
+# STOCKAGE (S3)
+# =============================================================================
+
+def _get_object(key):
+    try:
+        return get_s3().get_object(Bucket=BUNDLE_BUCKET, Key=key)['Body'].read()
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+
+
+def _put_object(key, body, content_type='application/octet-stream'):
+    get_s3().put_object(Bucket=BUNDLE_BUCKET, Key=key, Body=body, ContentType=content_type)
+
+
+def load_manifest(use_cache=False):
+    if use_cache and _manifest_cache['value'] and time.time() - _manifest_cache['loaded_at'] < MANIFEST_TTL:
+        return _manifest_cache['value']
+    raw = _get_object(f"{BUNDLE_PREFIX}manifest.json")
+    manifest = json.loads(raw) if raw else None
+    _manifest_cache.update(value=manifest, loaded_at=time.time())
+    return manifest
+
+
+def build_bundle():
+    """Construit une nouvelle version si le contenu a changé."""
+    key = get_signing_key()
+    entries = collect_entries()
+    content_hash = hashlib.sha256(_encode_entries(entries)).hexdigest()
+
+    manifest = load_manifest()
+    if manifest and manifest.get('contentHash') == content_hash:
+        print(f"ℹ️ Bundle NFC inchangé (version {manifest['version']}, {len(entries)} cartes)")
+        return manifest
+
+    version = (manifest or {}).get('version', 0) + 1
+    bundle = encode_bundle(entries, version, key)
+    full_key = f"{BUNDLE_PREFIX}full/{version}.bin"
+    _put_object(full_key, bundle)
+
+    deltas = {}
+    history = []
+    if manifest:
+        # Delta depuis la version précédente, puis composition pour les plus anciennes
+        previous = _get_object(manifest['full'])
+        _, previous_entries = decode_bundle(previous, key)
+        latest_changes = diff_entries(previous_entries, entries)
+
+        history = (manifest.get('history', []) + [manifest['version']])[-MAX_DELTAS:]
+        for from_version in history:
+            if from_version == manifest['version']:
+                changes = latest_changes
+            else:
+                old_key = manifest.get('deltas', {}).get(str(from_version))
+                if not old_key:
+                    continue
+                _, _, changes = decode_delta(_get_object(old_key), key)
+                changes = {**changes, **latest_changes}
+            delta_key = f"{BUNDLE_PREFIX}delta/{from_version}-{version}.bin"
+            _put_object(delta_key, encode_delta(changes, from_version, version, key))
+            deltas[str(from_version)] = delta_key
+
+    manifest = {
+        'version': version,
+        'generatedAt': datetime.utcnow().isoformat(),
+        'count': len(entries),
+        'contentHash': content_hash,
+        'full': full_key,
+        'sha256': hashlib.sha256(bundle).hexdigest(),
+        'size': len(bundle),
+        'deltas': deltas,
+        'history': history
+    }
+    _put_object(f"{BUNDLE_PREFIX}manifest.json", json.dumps(manifest), 'application/json')
+    _manifest_cache.update(value=manifest, loaded_at=time.time())
+
+    print(f"✅ Bundle NFC v{version}: {len(entries)} cartes, {len(deltas)} deltas")
+    return manifest
+
+
+# =============================================================================
+# HANDLERS
+# =============================================================================
+
+def handler(event, context):
+    """Job planifié (EventBridge) - recompile le bundle."""
+    manifest = build_bundle()
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'version': manifest['version'], 'count': manifest['count']})
+    }
+
+
+def lambda_handler(event, context):
+    """
+    GET /nfc/bundle?since=<version> -> URL du delta ou du bundle complet.
+    Réservé aux chauffeurs et admins : le bundle liste toutes les cartes.
+    """
+    if not get_user_sub(event):
+        return error(401, "Unauthorized")
+    if not user_has_role(event, 'DRIVER', 'ADMIN'):
+        return error(403, "Driver access required")
+
+    params = event.get('queryStringParameters') or {}
+
+    try:
+        manifest = load_manifest(use_cache=True)
+        if not manifest:
+            return error(404, "No NFC bundle available yet")
+
+        version = manifest['version']
+        since = params.get('since')
+
+        if since and since.isdigit() and int(since) == version:
+            return success({'version': version, 'upToDate': True})
+
+        delta_key = manifest.get('deltas', {}).get(since or '')
+        object_key = delta_key or manifest['full']
+
+        url = get_s3().generate_presigned_url(
+            'get_object',
+            Params={'Bucket': BUNDLE_BUCKET, 'Key': object_key},
+            ExpiresIn=URL_EXPIRES_IN
+        )
+
+        return success({
+            'version': version,
+            'upToDate': False,
+            'type': 'delta' if delta_key else 'full',
+            'fromVersion': int(since) if delta_key else None,
+            'url': url,
+            'expiresIn': URL_EXPIRES_IN,
+            'count': manifest['count'],
+            'sha256': None if delta_key else manifest['sha256']
+        })
+    except Exception as e:
+        print(f"Error: {e}")
+        return error(500, str(e))
@@ -7,10 +7,16 @@ from datetime import datetime
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from shared.response import success, error
-from shared.db import put_item, get_item, update_item, query_items, scan_items, convert_floats
+from shared.db import put_item, get_item, update_item, query_items, get_item_by, convert_floats
+from shared.nfc_index import NfcCardIndex, TABLE_NFC_CHANGELOG, build_change_entry
 from boto3.dynamodb.conditions import Key, Attr
 
 TABLE_NFC = os.environ.get('TABLE_NFC', 'limajs-nfc-cards')
+NFC_INDEX_REFRESH_SECONDS = int(os.environ.get('NFC_INDEX_REFRESH_SECONDS', 30))
+
+# Index des cartes propre au conteneur (réutilisé entre invocations)
+card_index = NfcCardIndex(TABLE_NFC, refresh_seconds=NFC_INDEX_REFRESH_SECONDS)
+card_index.usage.flush_on_shutdown()
 
 def lambda_handler(event, context):
     """
@@ -26,6 +32,9 @@ def lambda_handler(event, context):
     path = event.get('path', '')
     path_parameters = event.get('pathParameters') or {}
     
+    # Écrire les lastUsed restés en attente depuis l'invocation précédente (sans attendre)
+    card_index.usage.maybe_flush()
+    
     try:
         if '/issue' in path and http_method == 'POST':
             return issue_card(event)
@@ -98,13 +107,11 @@ def activate_card(event):
         return error(400, "cardId required")
     
     # Récupérer la carte (simplifié - pas de vérification du code pour MVP)
-    cards = scan_items(TABLE_NFC, Attr('cardId').eq(card_id))
+    card = get_item_by('nfc-card', card_id)
     
-    if not cards:
+    if not card:
         return error(404, "Card not found")
     
-    card = cards[0]
-    
     if card['status'] != 'PENDING_ACTIVATION':
         return error(400, f"Card is already {card['status']}")
     
@@ -120,6 +127,10 @@ def activate_card(event):
         {'#status': 'status'}
     )
     
+    # Publication immédiate (sans attendre le stream) : effet sous NFC_INDEX_REFRESH_SECONDS
+    put_item(TABLE_NFC_CHANGELOG, build_change_entry(card, 'ACTIVE'))
+    card_index.apply_change(card.get('nfcUidHash'), card['userId'], card_id, 'ACTIVE')
+    
     return success({
         'card': updated
     }, "NFC card activated successfully")
@@ -134,13 +145,11 @@ def block_card(event):
     if not card_id:
         return error(400, "cardId required")
     
-    cards = scan_items(TABLE_NFC, Attr('cardId').eq(card_id))
+    card = get_item_by('nfc-card', card_id)
     
-    if not cards:
+    if not card:
         return error(404, "Card not found")
     
-    card = cards[0]
-    
     updated = update_item(
         TABLE_NFC,
         {'userId': card['userId'], 'cardId': card_id},
@@ -153,6 +162,10 @@ def block_card(event):
         {'#status': 'status'}
     )
     
+    # Publication immédiate (sans attendre le stream) : effet sous NFC_INDEX_REFRESH_SECONDS
+    put_item(TABLE_NFC_CHANGELOG, build_change_entry(card, 'BLOCKED'))
+    card_index.apply_change(card.get('nfcUidHash'), card['userId'], card_id, 'BLOCKED')
+    
     return success({
         'card': updated
     }, "NFC card blocked successfully")
@@ -168,37 +181,33 @@ def validate_card(event):
     
     nfc_uid_hash = hash_nfc_uid(nfc_uid)
     
-    # Query par GSI nfc-uid-index
-    cards = query_items(
-        TABLE_NFC,
-        Key('nfcUidHash').eq(nfc_uid_hash),
-        index_name='nfc-uid-index'
-    )
+    # Index en mémoire (+ liste de refus) : pas d'aller-retour DynamoDB pour une carte connue
+    entry = card_index.lookup(nfc_uid_hash)
     
-    if not cards:
+    if not entry:
         return error(404, "NFC card not found")
     
-    card = cards[0]
+    user_id, card_id, status = entry
     
     # Vérifier statut
-    if card['status'] != 'ACTIVE':
-        return error(403, f"Card is {card['status']}. Access denied.")
+    if status != 'ACTIVE':
+        return error(403, f"Card is {status}. Access denied.")
     
     # Vérifier abonnement actif de l'utilisateur
     # (Logique similaire à celle des Tickets - vérifier TABLE_SUBSCRIPTIONS)
     # Pour MVP, on assume que si la carte est active, l'abonnement l'est aussi
     
-    # Mettre à jour lastUsed
-    updated = update_item(
-        TABLE_NFC,
-        {'userId': card['userId'], 'cardId': card['cardId']},
-        "SET lastUsed = :now",
-        {':now': datetime.utcnow().isoformat()}
-    )
+    # lastUsed écrit en différé, par lots
+    used_at = card_index.record_use(user_id, card_id)
     
     return success({
-        'card': updated,
-        'userId': card['userId'],
+        'card': {
+            'userId': user_id,
+            'cardId': card_id,
+            'status': status,
+            'lastUsed': used_at
+        },
+        'userId': user_id,
         'access': 'GRANTED'
     }, "NFC card validated successfully")
 
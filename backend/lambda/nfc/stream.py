@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from shared.db import get_table
+from shared.nfc_index import CHANGELOG_PK, TABLE_NFC_CHANGELOG, build_change_entry
+from boto3.dynamodb.types import TypeDeserializer
+
+deserializer = TypeDeserializer()
+
+def lambda_handler(event, context):
+    """
+    Consommateur du stream DynamoDB de la table NFC.
+    Publie chaque changement de statut / UID dans le journal (TABLE_NFC_CHANGELOG),
+    relue par incréments par l'index en mémoire des conteneurs de validation.
+    """
+    changes = []
+    
+    for record in event.get('Records', []):
+        ddb = record.get('dynamodb', {})
+        new_image = _deserialize(ddb.get('NewImage'))
+        old_image = _deserialize(ddb.get('OldImage'))
+        card = new_image or old_image
+        
+        # Ignorer les anciennes entrées du journal, autrefois rangées dans la table NFC
+        if not card or card.get('userId') == CHANGELOG_PK or 'cardId' not in card:
+            continue
+        
+        if record.get('eventName') == 'REMOVE':
+            changes.append(build_change_entry(old_image, 'DELETED'))
+        elif (old_image.get('status'), old_image.get('nfcUidHash')) != (new_image.get('status'), new_image.get('nfcUidHash')):
+            changes.append(build_change_entry(new_image))
+    
+    if changes:
+        with get_table(TABLE_NFC_CHANGELOG).batch_writer(overwrite_by_pkeys=['partition', 'changeId']) as batch:
+            for change in changes:
+                batch.put_item(Item=change)
+        print(f"✅ {len(changes)} changements NFC publiés")
+    
+    return {'published': len(changes)}
+
+def _deserialize(image):
+    if not image:
+        return {}
+    return {key: deserializer.deserialize(value) for key, value in image.items()}
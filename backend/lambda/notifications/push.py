@@ -1,38 +1,74 @@
 import json
 import os
+import re
 import sys
-import boto3
-import requests
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
-from shared.response import success, error
-from shared.db import get_item, put_item, query_items, scan_items, update_item, convert_floats
-from shared.secrets import get_secret
+from shared.response import success, error, get_http_method, get_user_sub, user_has_role
+from shared.db import get_item, get_table, put_item, query_items, update_item, convert_floats
+from shared.clients import get_client
+from shared.delivery_queue import enqueue, job_handler
+from shared.fcm_client import send_push, send_to_tokens, FCM_CONCURRENCY
+from shared.metrics import instrument, increment
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
 
 TABLE_USERS = os.environ.get('TABLE_USERS', 'limajs-users')
 TABLE_NOTIFICATIONS = os.environ.get('TABLE_NOTIFICATIONS', 'limajs-notifications')
 
+# GSI creux des profils ayant un token: pushShard (PUSH#00..) -> userId.
+# Le shard répartit les lectures d'un broadcast sur plusieurs partitions.
+PUSH_TOKEN_INDEX = 'push-token-index'
+PUSH_TOKEN_SHARDS = int(os.environ.get('PUSH_TOKEN_SHARDS', '16'))
+
+BROADCAST_PAGE_SIZE = int(os.environ.get('BROADCAST_PAGE_SIZE', '4000'))
+# Marge avant le timeout Lambda pour enregistrer la reprise et relancer
+BROADCAST_TIME_MARGIN_MS = 30000
+BROADCAST_RESUME_SOURCE = 'limajs.notifications.broadcast'
+PRUNE_WORKERS = 8
+
+# Abonnements par sujet: route:<routeId>, role:<ROLE>, zone:<zone>.
+# Chaque sujet est une partition de la table des notifications
+# (userId = TOPIC#<sujet>, notificationId = TOKEN#<userId>) portant le token :
+# un envoi ciblé lit uniquement les abonnés du sujet.
+TOPIC_PATTERN = re.compile(r'^(route|role|zone):[\w#.:-]{1,128}$')
+TOPIC_PREFIX = 'TOPIC#'
+MEMBER_PREFIX = 'TOKEN#'
+
+@instrument('notifications')
 def lambda_handler(event, context):
     """
     Handler pour notifications push.
     Routes:
     - POST /notifications/register -> Enregistrer device token (FCM)
+    - POST /notifications/topics -> (Dés)abonner l'utilisateur à des sujets
     - POST /notifications/send -> Envoyer notification (admin)
-    - POST /notifications/broadcast -> Broadcast à tous (admin)
+    - POST /notifications/broadcast -> Broadcast à tous ou à un sujet (admin)
     - GET /notifications/history -> Historique notifications
     """
-    http_method = event.get('httpMethod')
-    path = event.get('path', '')
+    # Suite d'un broadcast (invocation asynchrone par la Lambda elle-même)
+    if event.get('source') == BROADCAST_RESUME_SOURCE:
+        return resume_broadcast(event['broadcastId'], context)
+
+    http_method = get_http_method(event)
+    path = event.get('rawPath') or event.get('path', '')
     
     try:
         if '/register' in path and http_method == 'POST':
             return register_device(event)
+        elif '/topics' in path and http_method == 'POST':
+            return update_topics(event)
         elif '/send' in path and http_method == 'POST':
+            if not user_has_role(event, 'ADMIN'):
+                return error(403, 'Admin access required')
             return send_notification(event)
         elif '/broadcast' in path and http_method == 'POST':
-            return broadcast_notification(event)
+            if not user_has_role(event, 'ADMIN'):
+                return error(403, 'Admin access required')
+            return broadcast_notification(event, context)
         elif '/history' in path and http_method == 'GET':
             return get_notification_history(event)
         else:
@@ -42,9 +78,14 @@ def lambda_handler(event, context):
         return error(500, str(e))
 
 def register_device(event):
-    """Enregistrer un device token pour les push notifications."""
-    claims = event.get('requestContext', {}).get('authorizer', {}).get('claims', {})
-    user_sub = claims.get('sub')
+    """
+    Enregistrer un device token pour les push notifications.
+
+    `topics` (optionnel) ajoute des abonnements aux sujets déjà enregistrés ;
+    le sujet du rôle (role:PASSENGER, ...) est ajouté automatiquement. Les
+    entrées de tous les sujets de l'utilisateur reçoivent le nouveau token.
+    """
+    user_sub = get_user_sub(event)
     
     if not user_sub:
         return error(401, "Unauthorized")
@@ -58,71 +99,186 @@ def register_device(event):
     if not device_token:
         return error(400, "deviceToken required")
     
-    # Mettre à jour le profil avec le token
-    updated = update_item(
-        TABLE_USERS,
-        {'userId': user_id, 'type': 'PROFILE'},
-        "SET fcmToken = :token, fcmPlatform = :platform, tokenUpdatedAt = :updated",
-        {
-            ':token': device_token,
-            ':platform': platform,
-            ':updated': datetime.utcnow().isoformat()
-        }
-    )
+    topics = body.get('topics', [])
+    if not valid_topics(topics):
+        return error(400, "topics must be a list of route:<routeId>, role:<ROLE> or zone:<zone>")
+    
+    # Mettre à jour le profil avec le token (pushShard l'inscrit dans push-token-index)
+    expression = "SET fcmToken = :token, fcmPlatform = :platform, tokenUpdatedAt = :updated, pushShard = :shard"
+    values = {
+        ':token': device_token,
+        ':platform': platform,
+        ':updated': datetime.utcnow().isoformat(),
+        ':shard': push_shard(user_id)
+    }
+    if topics:
+        expression += " ADD pushTopics :topics"
+        values[':topics'] = set(topics)
+    updated = update_item(TABLE_USERS, {'userId': user_id, 'type': 'PROFILE'}, expression, values)
+    
+    subscribed = set(updated.get('pushTopics', set()))
+    role_topic = current_role_topic(updated)
+    if role_topic and role_topic not in subscribed:
+        update_item(TABLE_USERS, {'userId': user_id, 'type': 'PROFILE'}, "ADD pushTopics :topics", {':topics': {role_topic}})
+        subscribed.add(role_topic)
+    subscribed -= drop_stale_role_topics(user_id, updated)
+    
+    write_topic_members(user_id, device_token, platform, subscribed)
     
     return success({
         'registered': True,
-        'platform': platform
+        'platform': platform,
+        'topics': sorted(subscribed)
     }, "Device registered for push notifications")
 
+
+def update_topics(event):
+    """Abonnements aux sujets: {"subscribe": [...], "unsubscribe": [...]}."""
+    user_sub = get_user_sub(event)
+    
+    if not user_sub:
+        return error(401, "Unauthorized")
+    
+    user_id = f"USER#{user_sub}"
+    body = json.loads(event.get('body', '{}'))
+    subscribe = body.get('subscribe', [])
+    unsubscribe = body.get('unsubscribe', [])
+    
+    if not (subscribe or unsubscribe) or not valid_topics(subscribe) or not valid_topics(unsubscribe):
+        return error(400, "subscribe/unsubscribe must list route:<routeId>, role:<ROLE> or zone:<zone>")
+    
+    # ADD et DELETE ne peuvent pas viser le même attribut dans une seule expression
+    profile = None
+    if subscribe:
+        profile = update_push_topics(user_id, "ADD pushTopics :topics", subscribe)
+    if unsubscribe and (profile or not subscribe):
+        profile = update_push_topics(user_id, "DELETE pushTopics :topics", unsubscribe)
+    if profile is None:
+        return error(404, "Profile not found")
+    
+    stale = drop_stale_role_topics(user_id, profile)
+    topics = set(profile.get('pushTopics', set())) - stale
+    
+    if profile.get('fcmToken') and subscribe:
+        write_topic_members(user_id, profile['fcmToken'], profile.get('fcmPlatform', 'android'),
+                            set(subscribe) - set(unsubscribe) - stale)
+    remove_topic_members(user_id, unsubscribe)
+    
+    return success({'topics': sorted(topics)}, "Topics updated")
+
+
+def update_push_topics(user_id, expression, topics):
+    """
+    ADD/DELETE sur pushTopics d'un profil existant (ALL_NEW), ou None si le
+    profil n'existe pas : sans la condition, ADD créerait un item PROFILE nu.
+    """
+    try:
+        return get_table(TABLE_USERS).update_item(
+            Key={'userId': user_id, 'type': 'PROFILE'},
+            UpdateExpression=expression,
+            ConditionExpression="attribute_exists(userId)",
+            ExpressionAttributeValues={':topics': set(topics)},
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return None
+
+
+def current_role_topic(profile):
+    return f"role:{profile['role'].upper()}" if profile.get('role') else None
+
+
+def drop_stale_role_topics(user_id, profile):
+    """
+    Désabonne des sujets role:<ROLE> qui ne correspondent plus au rôle du
+    profil (rôle changé depuis l'abonnement). Retourne les sujets retirés.
+    """
+    role_topic = current_role_topic(profile)
+    stale = {topic for topic in profile.get('pushTopics', set())
+             if topic.startswith('role:') and topic != role_topic}
+    if stale:
+        update_push_topics(user_id, "DELETE pushTopics :topics", stale)
+        remove_topic_members(user_id, stale)
+    return stale
+
+
+def valid_topics(topics):
+    return isinstance(topics, list) and all(isinstance(t, str) and TOPIC_PATTERN.match(t) for t in topics)
+
+
+def write_topic_members(user_id, token, platform, topics):
+    """Inscrit (ou met à jour) le token de l'utilisateur dans chaque sujet."""
+    if not topics:
+        return
+    now = datetime.utcnow().isoformat()
+    with get_table(TABLE_NOTIFICATIONS).batch_writer(overwrite_by_pkeys=['userId', 'notificationId']) as batch:
+        for topic in topics:
+            batch.put_item(Item={
+                'userId': f"{TOPIC_PREFIX}{topic}",
+                'notificationId': f"{MEMBER_PREFIX}{user_id}",
+                'subscriberId': user_id,
+                'fcmToken': token,
+                'platform': platform,
+                'subscribedAt': now
+            })
+
+
+def remove_topic_members(user_id, topics):
+    if not topics:
+        return
+    with get_table(TABLE_NOTIFICATIONS).batch_writer(overwrite_by_pkeys=['userId', 'notificationId']) as batch:
+        for topic in topics:
+            batch.delete_item(Key={'userId': f"{TOPIC_PREFIX}{topic}", 'notificationId': f"{MEMBER_PREFIX}{user_id}"})
+
+def push_shard(user_id):
+    """Shard stable d'un utilisateur dans push-token-index."""
+    return f"PUSH#{zlib.crc32(user_id.encode()) % PUSH_TOKEN_SHARDS:02d}"
+
+
 def send_push_to_device(token, title, body, data=None):
     """Envoyer une notification push via Firebase Cloud Messaging."""
-    try:
-        # Récupérer la clé FCM depuis Secrets Manager
-        secret_name = os.environ.get('SECRET_NAME', 'limajs/backend/production')
-        secrets = get_secret(secret_name)
-        
-        # Gestion cas string vs dict
-        fcm_key = secrets.get('FCM_SERVER_KEY') if isinstance(secrets, dict) else secrets
-        
-        if not fcm_key:
-            print("⚠️ FCM_SERVER_KEY not configured")
-            return False
-        
-        headers = {
-            'Authorization': f'key={fcm_key}',
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            'to': token,
-            'notification': {
-                'title': title,
-                'body': body
-            },
-            'data': data or {}
-        }
-        
-        response = requests.post(
-            'https://fcm.googleapis.com/fcm/send',
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result.get('success', 0) > 0
-        else:
-            print(f"FCM Error: {response.status_code} - {response.text}")
-            return False
-            
-    except Exception as e:
-        print(f"Error sending push: {e}")
-        return False
+    return send_push(token, title, body, data) == 'sent'
+
+
+def prune_tokens(holders):
+    """
+    Retire les tokens invalides des profils (holders: [(userId, token)]) et
+    des sujets auxquels ils sont abonnés ; les abonnements (pushTopics) restent
+    sur le profil et seront réinscrits au prochain enregistrement.
+    La condition évite d'effacer un token ré-enregistré entre-temps.
+    """
+    def prune(holder):
+        user_id, token = holder
+        try:
+            response = get_table(TABLE_USERS).update_item(
+                Key={'userId': user_id, 'type': 'PROFILE'},
+                UpdateExpression="REMOVE fcmToken, pushShard",
+                ConditionExpression="fcmToken = :token",
+                ExpressionAttributeValues={':token': token},
+                ReturnValues='ALL_OLD'
+            )
+            remove_topic_members(user_id, response.get('Attributes', {}).get('pushTopics'))
+            return 1
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                print(f"⚠️ Prune {user_id}: {e}")
+            return 0
+
+    if not holders:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(PRUNE_WORKERS, len(holders))) as pool:
+        pruned = sum(pool.map(prune, holders))
+    increment('PrunedTokens', pruned)
+    return pruned
 
 def send_notification(event):
-    """Envoyer une notification à un utilisateur spécifique."""
+    """
+    Envoyer une notification à un utilisateur spécifique.
+    L'envoi FCM est déposé dans la file de livraison (voir deliver_push) :
+    la réponse n'attend pas Firebase.
+    """
     body = json.loads(event.get('body', '{}'))
     
     target_user_id = body.get('userId')
@@ -155,77 +311,228 @@ def send_notification(event):
         'delivered': False
     })
     
-    # Envoyer la push notification si token disponible
-    if fcm_token:
-        delivered = send_push_to_device(
-            fcm_token,
-            title,
-            message,
-            {'type': notification_type, 'notificationId': notification_id}
-        )
-        notification_item['delivered'] = delivered
-    
+    # Historique d'abord: le worker y marque la livraison
+    notification_item['deliveryStatus'] = 'QUEUED' if fcm_token else 'NO_TOKEN'
     put_item(TABLE_NOTIFICATIONS, notification_item)
     
+    if fcm_token:
+        enqueue('push', {
+            'userId': target_user_id,
+            'token': fcm_token,
+            'title': title,
+            'message': message,
+            'data': {'type': notification_type, 'notificationId': notification_id}
+        })
+    
     return success({
         'notification': notification_item
-    }, "Notification sent")
+    }, "Notification queued" if fcm_token else "Notification saved (no device token)")
+
+
+@job_handler('push')
+def deliver_push(payload, job_id=None):
+    """Job de la file de livraison: envoi FCM d'une notification individuelle."""
+    outcome = send_push(payload['token'], payload['title'], payload['message'], payload.get('data'))
+    if outcome == 'failed':
+        raise RuntimeError(f"FCM delivery failed for {payload['userId']}")
+    if outcome == 'invalid':
+        prune_tokens([(payload['userId'], payload['token'])])
+    
+    notification_id = (payload.get('data') or {}).get('notificationId')
+    if notification_id:
+        update_item(
+            TABLE_NOTIFICATIONS,
+            {'userId': payload['userId'], 'notificationId': notification_id},
+            "SET delivered = :delivered, deliveryStatus = :status, deliveredAt = :at",
+            {
+                ':delivered': outcome == 'sent',
+                ':status': 'DELIVERED' if outcome == 'sent' else 'INVALID_TOKEN',
+                ':at': datetime.utcnow().isoformat()
+            }
+        )
+
+def broadcast_notification(event, context=None):
+    """
+    Envoyer une notification à tous les utilisateurs ayant un token, ou aux
+    seuls abonnés d'un sujet (`topic`: "route:ROUTE#...", "zone:nord", ...).
 
-def broadcast_notification(event):
-    """Envoyer une notification à tous les utilisateurs."""
+    Les destinataires sont lus page par page dans push-token-index, shard par
+    shard (ou dans la partition du sujet), et envoyés en lots multicast parallèles. La progression (shard,
+    clé de page, compteurs) est enregistrée dans l'entrée BROADCAST# après
+    chaque page : si le temps restant devient court, la Lambda se relance
+    elle-même et reprend au même point.
+    """
     body = json.loads(event.get('body', '{}'))
     
     title = body.get('title')
     message = body.get('message')
     notification_type = body.get('type', 'PROMO')
     role_filter = body.get('role')  # Optionnel: PASSENGER, DRIVER
+    topic = body.get('topic')  # Optionnel: route:<routeId>, role:<ROLE>, zone:<zone>
+    
+    # Reprise manuelle d'un broadcast interrompu
+    if body.get('broadcastId'):
+        return resume_broadcast(body['broadcastId'], context)
     
     if not title or not message:
         return error(400, "title and message required")
+    if topic and (role_filter or not valid_topics([topic])):
+        return error(400, "topic must be route:<routeId>, role:<ROLE> or zone:<zone>, without role")
     
-    # Récupérer tous les users avec un FCM token
-    all_users = scan_items(TABLE_USERS, Attr('fcmToken').exists() & Attr('type').eq('PROFILE'))
-    
-    if role_filter:
-        all_users = [u for u in all_users if u.get('role') == role_filter]
-    
-    sent_count = 0
-    failed_count = 0
-    
-    for user in all_users:
-        fcm_token = user.get('fcmToken')
-        if fcm_token:
-            if send_push_to_device(fcm_token, title, message, {'type': notification_type}):
-                sent_count += 1
-            else:
-                failed_count += 1
-    
-    # Sauvegarder le broadcast dans l'historique admin
-    broadcast_id = f"BROADCAST#{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-    
+    now = datetime.utcnow().isoformat()
     broadcast_item = convert_floats({
         'userId': 'SYSTEM',
-        'notificationId': broadcast_id,
+        'notificationId': f"BROADCAST#{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}",
         'title': title,
         'message': message,
         'type': notification_type,
         'targetRole': role_filter,
-        'sentTo': sent_count + failed_count,
-        'delivered': sent_count,
-        'failed': failed_count,
-        'sentAt': datetime.utcnow().isoformat()
+        'targetTopic': topic,
+        'status': 'RUNNING',
+        'shard': 0,
+        'cursor': None,
+        'sentTo': 0,
+        'delivered': 0,
+        'failed': 0,
+        'pruned': 0,
+        'sentAt': now,
+        'updatedAt': now
     })
-    
     put_item(TABLE_NOTIFICATIONS, broadcast_item)
     
+    job = run_broadcast(broadcast_item, context)
+    
     return success({
-        'broadcast': broadcast_item
-    }, f"Broadcast sent to {sent_count} users")
+        'broadcast': job
+    }, f"Broadcast sent to {job['delivered']} users" if job['status'] == 'DONE'
+       else f"Broadcast in progress ({job['delivered']} delivered so far)")
+
+
+def resume_broadcast(broadcast_id, context=None):
+    """Reprend un broadcast à partir de son point de reprise."""
+    job = get_item(TABLE_NOTIFICATIONS, {'userId': 'SYSTEM', 'notificationId': broadcast_id})
+    if not job:
+        return error(404, "Broadcast not found")
+    if job.get('status') == 'DONE':
+        return success({'broadcast': job}, "Broadcast already completed")
+    job = run_broadcast(job, context)
+    return success({'broadcast': job}, f"Broadcast {job['status'].lower()}")
+
+
+def iter_token_pages(role_filter, shard, cursor):
+    """Pages (shard, {token: userId}, clé suivante) de push-token-index à partir du point de reprise."""
+    table = get_table(TABLE_USERS)
+    for current in range(shard, PUSH_TOKEN_SHARDS):
+        kwargs = {
+            'IndexName': PUSH_TOKEN_INDEX,
+            'KeyConditionExpression': Key('pushShard').eq(f"PUSH#{current:02d}"),
+            'Limit': BROADCAST_PAGE_SIZE
+        }
+        if role_filter:
+            kwargs['FilterExpression'] = Attr('role').eq(role_filter)
+        start_key = cursor if current == shard else None
+        while True:
+            if start_key:
+                kwargs['ExclusiveStartKey'] = start_key
+            response = table.query(**kwargs)
+            start_key = response.get('LastEvaluatedKey')
+            holders = {item['fcmToken']: item['userId'] for item in response.get('Items', []) if item.get('fcmToken')}
+            yield current, holders, start_key
+            if not start_key:
+                break
+
+
+def iter_topic_pages(topic, cursor):
+    """Pages (0, {token: userId}, clé suivante) des abonnés d'un sujet."""
+    table = get_table(TABLE_NOTIFICATIONS)
+    kwargs = {
+        'KeyConditionExpression': Key('userId').eq(f"{TOPIC_PREFIX}{topic}"),
+        'ProjectionExpression': 'fcmToken, subscriberId',
+        'Limit': BROADCAST_PAGE_SIZE
+    }
+    start_key = cursor
+    while True:
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        response = table.query(**kwargs)
+        start_key = response.get('LastEvaluatedKey')
+        yield 0, {item['fcmToken']: item['subscriberId'] for item in response.get('Items', [])}, start_key
+        if not start_key:
+            break
+
+
+def run_broadcast(job, context=None):
+    """Envoie les pages restantes du broadcast `job` et met à jour sa reprise."""
+    cursor = json.loads(job['cursor']) if job.get('cursor') else None
+    counters = {name: int(job.get(name, 0)) for name in ('sentTo', 'delivered', 'failed', 'pruned')}
+    delivered_before = counters['delivered']
+    data = {'type': job.get('type', 'PROMO'), 'broadcastId': job['notificationId']}
+    resume = False
+
+    # Un sujet tient dans une seule partition (shard 0)
+    topic = job.get('targetTopic')
+    if topic:
+        pages, last_shard = iter_topic_pages(topic, cursor), 0
+    else:
+        pages, last_shard = iter_token_pages(job.get('targetRole'), int(job.get('shard', 0)), cursor), PUSH_TOKEN_SHARDS - 1
+
+    for shard, holders, next_key in pages:
+        if holders:
+            outcome = send_to_tokens(list(holders), job['title'], job['message'], data, FCM_CONCURRENCY)
+            counters['sentTo'] += len(holders)
+            counters['delivered'] += outcome['sent']
+            counters['failed'] += outcome['failed'] + len(outcome['invalid'])
+            counters['pruned'] += prune_tokens([(holders[token], token) for token in outcome['invalid']])
+
+        # Point de reprise: page suivante du même shard, ou début du shard suivant
+        job['shard'], job['cursor'] = (shard, json.dumps(next_key)) if next_key else (shard + 1, None)
+        finished = job['shard'] > last_shard
+        resume = not finished and bool(context) and context.get_remaining_time_in_millis() < BROADCAST_TIME_MARGIN_MS
+
+        # Enregistré à chaque page : une invocation coupée (timeout, erreur) ne renvoie que la page en cours
+        job.update(counters, status='DONE' if finished else 'RUNNING', updatedAt=datetime.utcnow().isoformat())
+        save_checkpoint(job)
+        if finished or resume:
+            break
+
+    increment('PushDelivered', counters['delivered'] - delivered_before)
+
+    if resume:
+        continue_broadcast(job['notificationId'], context)
+    return job
+
+
+def save_checkpoint(job):
+    update_item(
+        TABLE_NOTIFICATIONS,
+        {'userId': 'SYSTEM', 'notificationId': job['notificationId']},
+        "SET #status = :status, #shard = :shard, #cursor = :cursor, sentTo = :sentTo, delivered = :delivered, "
+        "failed = :failed, pruned = :pruned, updatedAt = :updatedAt",
+        {
+            ':status': job['status'], ':shard': job['shard'], ':cursor': job.get('cursor'),
+            ':sentTo': job['sentTo'], ':delivered': job['delivered'], ':failed': job['failed'],
+            ':pruned': job['pruned'], ':updatedAt': job['updatedAt']
+        },
+        {'#status': 'status', '#shard': 'shard', '#cursor': 'cursor'}
+    )
+
+
+def continue_broadcast(broadcast_id, context):
+    """Relance asynchrone de la Lambda pour la suite du broadcast."""
+    try:
+        get_client('lambda').invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps({'source': BROADCAST_RESUME_SOURCE, 'broadcastId': broadcast_id})
+        )
+        print(f"🔁 Broadcast {broadcast_id} continue dans une nouvelle invocation")
+    except Exception as e:
+        # Reprise possible via POST /notifications/broadcast {"broadcastId": ...}
+        print(f"⚠️ Relance du broadcast {broadcast_id} impossible: {e}")
 
 def get_notification_history(event):
     """Historique des notifications d'un utilisateur."""
-    claims = event.get('requestContext', {}).get('authorizer', {}).get('claims', {})
-    user_sub = claims.get('sub')
+    user_sub = get_user_sub(event)
     
     if not user_sub:
         return error(401, "Unauthorized")
@@ -0,0 +1,67 @@
+"""
+Worker de la file de livraison (emails, push).
+
+Déclenché par SQS (source d'événements avec ReportBatchItemFailures) : les
+messages du lot sont livrés en parallèle par shared.delivery_queue, qui gère
+relances et lettres mortes. Seuls les messages qui n'ont pu être ni livrés
+ni redéposés sont rendus à SQS.
+"""
+
+import base64
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.dirname(__file__))
+from shared.clients import get_client
+from shared.delivery_queue import job_handler, process_batch
+from shared.metrics import instrument
+from shared.resend_client import send_email
+from shared.secrets import SECRET_NAME, prefetch_secrets
+
+# Enregistre le job 'push'
+import push  # noqa: F401
+
+# Clés FCM et Resend en cache avant le premier lot
+prefetch_secrets([SECRET_NAME])
+
+
+@job_handler('email')
+def deliver_email(payload, job_id=None):
+    """
+    payload: {to, subject, html, text?, attachments?}. Les pièces jointes
+    référencées par {s3Bucket, s3Key} sont lues dans S3 au moment de l'envoi
+    (un PDF ne tient pas dans un message SQS).
+
+    La clé d'idempotence Resend dérive de l'identifiant du job : une nouvelle
+    tentative après un timeout (email déjà accepté par Resend) n'envoie pas
+    de doublon.
+    """
+    attachments = []
+    for attachment in payload.get('attachments') or []:
+        content = attachment.get('content')
+        if content is None:
+            body = get_client('s3').get_object(Bucket=attachment['s3Bucket'], Key=attachment['s3Key'])['Body'].read()
+            content = base64.b64encode(body).decode('utf-8')
+        attachments.append({'filename': attachment['filename'], 'content': content, 'type': attachment.get('type')})
+
+    result = send_email(
+        to=payload['to'],
+        subject=payload['subject'],
+        html=payload['html'],
+        attachments=attachments or None,
+        text=payload.get('text'),
+        idempotency_key=f"email-{job_id}" if job_id else None
+    )
+    if result.get('error'):
+        raise RuntimeError(f"Resend: {result['error']}")
+
+
+@instrument('delivery')
+def lambda_handler(event, context):
+    records = event.get('Records', [])
+    messages = [json.loads(record['body']) for record in records]
+    unacked = process_batch(messages)
+    print(f"📬 {len(messages) - len(unacked)}/{len(messages)} messages traités")
+    return {'batchItemFailures': [{'itemIdentifier': records[i]['messageId']} for i in unacked]}
@@ -2,18 +2,18 @@ import json
 import os
 import sys
 import uuid
-import boto3
 from datetime import datetime
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from shared.response import success, error
-from shared.db import put_item, get_item, query_items, scan_items, update_item, convert_floats
+from shared.clients import LazyClient
+from shared.db import put_item, get_item, query_items, update_item, resolve_key, convert_floats
 from boto3.dynamodb.conditions import Key, Attr
 
 TABLE_PAYMENTS = os.environ.get('TABLE_PAYMENTS', 'limajs-payments')
 S3_BUCKET = os.environ.get('AWS_S3_BUCKET_NAME')
 
-s3 = boto3.client('s3')
+s3 = LazyClient('s3')
 
 def lambda_handler(event, context):
     """
@@ -138,22 +138,15 @@ def list_pending_payments():
 
 def approve_payment(payment_id, event):
     """Approuver un paiement (Admin)."""
-    payment = get_item(TABLE_PAYMENTS, {
-        'paymentId': payment_id,
-        'timestamp': event.get('body') and json.loads(event['body']).get('timestamp')
-    })
+    payment_key = resolve_key('payment', payment_id)
     
-    if not payment:
-        # Fallback: scan pour trouver le payment
-        all_payments = scan_items(TABLE_PAYMENTS, Attr('paymentId').eq(payment_id))
-        if not all_payments:
-            return error(404, "Payment not found")
-        payment = all_payments[0]
+    if not payment_key:
+        return error(404, "Payment not found")
     
     # Mettre à jour le statut
     updated = update_item(
         TABLE_PAYMENTS,
-        {'paymentId': payment_id, 'timestamp': payment['timestamp']},
+        payment_key,
         "SET #status = :status, approvedAt = :approved",
         {':status': 'APPROVED', ':approved': datetime.utcnow().isoformat()},
         {'#status': 'status'}
@@ -162,19 +155,18 @@ def approve_payment(payment_id, event):
     # Activer l'abonnement correspondant
     TABLE_SUBSCRIPTIONS = os.environ.get('TABLE_SUBSCRIPTIONS', 'limajs-subscriptions')
     
-    # Trouver l'abonnement PENDING lié à ce paiement
-    subs = scan_items(TABLE_SUBSCRIPTIONS, Attr('paymentId').eq(payment_id))
+    # Trouver l'abonnement PENDING lié à ce paiement (GSI payment-index)
+    sub_key = resolve_key('subscription-payment', payment_id)
     
-    if subs:
-        sub = subs[0]
+    if sub_key:
         update_item(
             TABLE_SUBSCRIPTIONS,
-            {'userId': sub['userId'], 'subscriptionId': sub['subscriptionId']},
+            sub_key,
             "SET #status = :status, activatedAt = :activated",
             {':status': 'ACTIVE', ':activated': datetime.utcnow().isoformat()},
             {'#status': 'status'}
         )
-        print(f"✅ Abonnement {sub['subscriptionId']} activé")
+        print(f"✅ Abonnement {sub_key['subscriptionId']} activé")
     
     return success({'payment': updated}, "Payment approved and subscription activated")
 
@@ -182,15 +174,13 @@ def reject_payment(payment_id, event):
     """Rejeter un paiement (Admin)."""
     body = json.loads(event.get('body', '{}'))
     
-    all_payments = scan_items(TABLE_PAYMENTS, Attr('paymentId').eq(payment_id))
-    if not all_payments:
+    payment_key = resolve_key('payment', payment_id)
+    if not payment_key:
         return error(404, "Payment not found")
     
-    payment = all_payments[0]
-    
     updated = update_item(
         TABLE_PAYMENTS,
-        {'paymentId': payment_id, 'timestamp': payment['timestamp']},
+        payment_key,
         "SET #status = :status, rejectedAt = :rejected, rejectionReason = :reason",
         {
             ':status': 'REJECTED',
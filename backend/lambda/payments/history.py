@@ -8,7 +8,9 @@ from datetime import datetime
 import sys
 sys.path.insert(0, '/var/task')
 from shared.db import get_table
-from shared.response import success, error, get_user_sub
+from shared.response import success, error, get_user_sub, optimize_response
+from shared.pagination import paginate, parse_limit, InvalidCursor
+from boto3.dynamodb.conditions import Key, Attr
 
 
 def get_payment_history(event, context):
@@ -19,27 +21,31 @@ def get_payment_history(event, context):
         return error(401, 'Unauthorized')
     
     params = event.get('queryStringParameters') or {}
-    limit = int(params.get('limit', 20))
+    limit = parse_limit(params)
     payment_type = params.get('type')  # 'subscription', 'wallet_recharge', or all
     
     table = get_table('limajs-payments')
     
     query_params = {
-        'KeyConditionExpression': 'userId = :uid',
-        'ExpressionAttributeValues': {':uid': user_id},
-        'ScanIndexForward': False,
-        'Limit': limit
+        'KeyConditionExpression': Key('userId').eq(user_id),
+        'ScanIndexForward': False
     }
     
     if payment_type:
-        query_params['FilterExpression'] = '#type = :type'
-        query_params['ExpressionAttributeNames'] = {'#type': 'type'}
-        query_params['ExpressionAttributeValues'][':type'] = payment_type
+        query_params['FilterExpression'] = Attr('type').eq(payment_type)
     
-    response = table.query(**query_params)
+    # Avec un filtre, la boucle de pagination relit jusqu'à `limit` résultats
+    try:
+        items, next_cursor = paginate(
+            table, limit, params.get('cursor'), scope=user_id,
+            key_attributes=['userId', 'paymentId'] if payment_type else None,
+            **query_params
+        )
+    except InvalidCursor:
+        return error(400, 'Invalid cursor')
     
     payments = []
-    for item in response.get('Items', []):
+    for item in items:
         payment = {
             'paymentId': item.get('paymentId'),
             'date': item.get('submittedAt', item.get('createdAt', '')),
@@ -58,7 +64,8 @@ def get_payment_history(event, context):
     
     return success({
         'payments': payments,
-        'count': len(payments)
+        'count': len(payments),
+        'nextCursor': next_cursor
     })
 
 
@@ -84,6 +91,7 @@ def get_payment_description(payment: dict) -> str:
     return payment.get('description', 'Paiement')
 
 
+@optimize_response
 def handler(event, context):
     """Main handler"""
     return get_payment_history(event, context)
@@ -0,0 +1,170 @@
+"""
+Routeur API unique (optionnel, USE_API_ROUTER=true côté infra).
+
+Une seule Lambda sert toutes les routes HTTP : une session passager qui
+touche tickets, abonnements, wallet et lignes ne paie qu'un cold start, et
+les caches en mémoire / clients AWS sont partagés entre domaines.
+
+La table des routes est compilée à l'import :
+    - correspondance exacte sur `routeKey` (HTTP API: "GET /tickets/{id}")
+    - sinon regex par méthode sur le chemin (route `$default` ou `{proxy+}`),
+      les paramètres extraits sont injectés dans `pathParameters`
+Les modules de domaine ne sont importés qu'à la première requête qui les vise.
+"""
+
+import importlib.util
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from shared.response import error, get_http_method, finalize_response
+
+LAMBDA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# (méthode, chemin, module relatif à lambda/, fonction)
+# Les fonctions de domaine acceptant (event, context) ou (event) sont appelées
+# directement ; les autres passent par le point d'entrée du domaine.
+ROUTES = [
+    ('POST', '/auth/signup', 'auth/signup', 'lambda_handler'),
+    ('POST', '/auth/login', 'auth/login', 'lambda_handler'),
+
+    ('GET', '/users/me', 'users/get_profile', 'lambda_handler'),
+    ('PUT', '/users/me', 'users/update_profile', 'lambda_handler'),
+    ('POST', '/users/me/photo', 'users/update_profile', 'lambda_handler'),
+
+    ('ANY', '/buses', 'buses/crud', 'lambda_handler'),
+    ('ANY', '/buses/{id}', 'buses/crud', 'lambda_handler'),
+    ('ANY', '/routes', 'routes/crud', 'lambda_handler'),
+    ('ANY', '/routes/{id}', 'routes/crud', 'lambda_handler'),
+    ('ANY', '/schedules', 'schedules/crud', 'lambda_handler'),
+    ('ANY', '/schedules/{id}', 'schedules/crud', 'lambda_handler'),
+
+    ('POST', '/trips/start', 'trips/crud', 'lambda_handler'),
+    ('POST', '/trips/end', 'trips/crud', 'lambda_handler'),
+    ('POST', '/trips/board', 'trips/crud', 'lambda_handler'),
+    ('POST', '/trips/alight', 'trips/crud', 'lambda_handler'),
+    ('GET', '/trips/current/passengers', 'trips/crud', 'lambda_handler'),
+    ('GET', '/trips/history', 'trips/history', 'get_trip_history'),
+
+    ('POST', '/gps/batch', 'gps/ingest', 'lambda_handler'),
+
+    ('GET', '/subscriptions/types', 'subscriptions/crud', 'lambda_handler'),
+    ('POST', '/subscriptions', 'subscriptions/crud', 'lambda_handler'),
+    ('GET', '/subscriptions/active', 'subscriptions/crud', 'lambda_handler'),
+    ('POST', '/payments/presigned-url', 'payments/crud', 'lambda_handler'),
+    ('POST', '/payments/upload', 'payments/crud', 'lambda_handler'),
+    ('GET', '/payments/history', 'payments/history', 'get_payment_history'),
+    ('GET', '/invoices/{id}', 'invoices/download', 'lambda_handler'),
+
+    ('GET', '/wallet/balance', 'wallet/crud', 'get_balance'),
+    ('GET', '/wallet/transactions', 'wallet/crud', 'get_transactions'),
+    ('POST', '/wallet/recharge', 'wallet/crud', 'request_recharge'),
+    ('POST', '/wallet/pay', 'wallet/crud', 'pay_with_wallet'),
+    ('POST', '/wallet/recharges/approve', 'wallet/crud', 'approve_recharges'),
+
+    ('POST', '/tickets/generate', 'tickets/crud', 'generate_ticket'),
+    ('GET', '/tickets/my', 'tickets/crud', 'lambda_handler'),
+    ('POST', '/tickets/validate', 'tickets/crud', 'validate_ticket'),
+    ('GET', '/tickets/{id}', 'tickets/crud', 'lambda_handler'),
+    ('GET', '/tickets/{id}/qr', 'tickets/crud', 'lambda_handler'),
+
+    ('GET', '/nfc/my-card', 'nfc/crud', 'lambda_handler'),
+    ('POST', '/nfc/validate', 'nfc/crud', 'lambda_handler'),
+    ('POST', '/nfc/recharge', 'nfc/crud', 'lambda_handler'),
+    ('GET', '/nfc/bundle', 'nfc/bundle', 'lambda_handler'),
+
+    ('GET', '/admin/users', 'admin/users', 'lambda_handler'),
+    ('GET', '/admin/reports/dashboard', 'admin/reports', 'lambda_handler'),
+]
+
+# Fonctions qui n'acceptent que `event`
+EVENT_ONLY = {('tickets/crud', 'generate_ticket'), ('tickets/crud', 'validate_ticket')}
+
+
+def _compile(path):
+    pattern = re.sub(r'\\\{(\w+)\\\}', r'(?P<\1>[^/]+)', re.escape(path))
+    return re.compile(f'^{pattern}/?$')
+
+
+def compile_routes(routes):
+    """Index exact (routeKey) + regex par méthode, construits une seule fois."""
+    exact = {}
+    by_method = {}
+    for method, path, module, function in routes:
+        target = (module, function)
+        exact[f"{method} {path}"] = target
+        # Chemins statiques avant les chemins paramétrés (/tickets/my avant /tickets/{id})
+        by_method.setdefault(method, []).append(('{' in path, _compile(path), target))
+    for entries in by_method.values():
+        entries.sort(key=lambda entry: entry[0])
+    return exact, by_method
+
+
+EXACT_ROUTES, PATTERN_ROUTES = compile_routes(ROUTES)
+
+_modules = {}
+
+
+def load_function(module, function):
+    """Importe le module de domaine à la demande (une fois par conteneur)."""
+    loaded = _modules.get(module)
+    if loaded is None:
+        path = os.path.join(LAMBDA_DIR, f"{module}.py")
+        spec = importlib.util.spec_from_file_location(f"handlers.{module.replace('/', '.')}", path)
+        loaded = importlib.util.module_from_spec(spec)
+        # Les modules vendorisés (ex: qrcode des tickets) sont importés depuis le dossier du domaine
+        domain_dir = os.path.dirname(path)
+        if domain_dir not in sys.path:
+            sys.path.append(domain_dir)
+        spec.loader.exec_module(loaded)
+        _modules[module] = loaded
+    return getattr(loaded, function)
+
+
+def resolve(event):
+    """Retourne (target, pathParameters) ou (None, None)."""
+    route_key = event.get('routeKey')
+    if route_key and route_key in EXACT_ROUTES:
+        return EXACT_ROUTES[route_key], event.get('pathParameters') or {}
+
+    method = get_http_method(event)
+    path = event.get('rawPath') or event.get('path') or ''
+    stage = event.get('requestContext', {}).get('stage')
+    if stage and stage != '$default' and path.startswith(f"/{stage}/"):
+        path = path[len(stage) + 1:]
+
+    for candidate in (method, 'ANY'):
+        for _, pattern, target in PATTERN_ROUTES.get(candidate, []):
+            match = pattern.match(path)
+            if match:
+                return target, match.groupdict()
+    return None, None
+
+
+def lambda_handler(event, context):
+    if get_http_method(event) == 'OPTIONS':
+        return {'statusCode': 204, 'headers': {}, 'body': ''}
+
+    target, path_parameters = resolve(event)
+    if target is None:
+        return error(404, "Route not found")
+
+    if path_parameters:
+        event['pathParameters'] = {**(event.get('pathParameters') or {}), **path_parameters}
+
+    started = time.perf_counter()
+    try:
+        function = load_function(*target)
+        if target in EVENT_ONLY:
+            response = function(event)
+        else:
+            response = function(event, context)
+    except Exception as e:
+        print(f"❌ Router {target[0]}.{target[1]}: {e}")
+        return error(500, str(e))
+
+    print(f"➡️ {event.get('routeKey') or get_http_method(event)} -> {target[0]}.{target[1]} "
+          f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+    return finalize_response(event, response)
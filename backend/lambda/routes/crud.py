@@ -1,16 +1,22 @@
 import json
 import os
 import sys
+import time
 import uuid
 from datetime import datetime
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
-from shared.response import success, error, get_http_method, get_path_parameters
+from shared.response import success, error, get_http_method, get_path_parameters, preserialize, optimize_response
+from shared.cache import LRUCache
 from shared.db import put_item, get_item, scan_items, delete_item, update_item, convert_floats, query_items
 from boto3.dynamodb.conditions import Key, Attr
 
 TABLE_ROUTES = os.environ.get('TABLE_ROUTES', 'limajs-routes')
+ROUTES_CACHE_TTL = int(os.environ.get('ROUTES_CACHE_TTL', 60))
 
+_routes_cache = LRUCache(max_bytes=1024 * 1024)
+
+@optimize_response
 def lambda_handler(event, context):
     """
     Handler CRUD pour Routes (Lignes de transport).
@@ -85,6 +91,7 @@ def create_route(event):
         })
         put_item(TABLE_ROUTES, stop_item)
     
+    _routes_cache.clear()
     return success({'route': route_item, 'stopsCount': len(stops)}, "Route created successfully")
 
 def get_route(route_id):
@@ -114,8 +121,13 @@ def get_route(route_id):
 
 def list_routes():
     """Lister toutes les lignes (sans les arrêts)."""
-    routes = scan_items(TABLE_ROUTES, Attr('stopIndex').eq('METADATA'))
-    return success({'routes': routes, 'count': len(routes)})
+    # Liste quasi statique: sérialisée une fois puis resservie telle quelle
+    cached = _routes_cache.get('list')
+    if cached is None:
+        routes = scan_items(TABLE_ROUTES, Attr('stopIndex').eq('METADATA'))
+        cached = preserialize({'routes': routes, 'count': len(routes)})
+        _routes_cache.set('list', cached, expires_at=time.time() + ROUTES_CACHE_TTL)
+    return success(cached)
 
 def update_route(route_id, event):
     """Mettre à jour une ligne."""
@@ -142,6 +154,7 @@ def update_route(route_id, event):
         convert_floats(expr_values)
     )
     
+    _routes_cache.clear()
     return success({'route': updated}, "Route updated successfully")
 
 def delete_route(route_id):
@@ -157,4 +170,5 @@ def delete_route(route_id):
         {':active': False, ':updated': datetime.utcnow().isoformat()}
     )
     
+    _routes_cache.clear()
     return success({'route': updated}, "Route deactivated successfully")
@@ -5,12 +5,13 @@ import uuid
 from datetime import datetime
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
-from shared.response import success, error, get_http_method, get_path_parameters
+from shared.response import success, error, get_http_method, get_path_parameters, optimize_response
 from shared.db import put_item, get_item, query_items, scan_items, delete_item, convert_floats
 from boto3.dynamodb.conditions import Key, Attr
 
 TABLE_SCHEDULES = os.environ.get('TABLE_SCHEDULES', 'limajs-schedules')
 
+@optimize_response
 def lambda_handler(event, context):
     """
     Handler CRUD pour Schedules (Horaires).
@@ -1,89 +1,156 @@
 """
 Lambda pour les rappels d'abonnement automatiques
 Déclenché quotidiennement par EventBridge
+
+Pipeline par page d'abonnements expirants (J-7, J-3, J-0) :
+    - lecture paginée de l'index status-enddate
+    - profils et types d'abonnement lus par BatchGetItem (un appel par page)
+    - factures (adressées par contenu, voir invoices.generate.store_invoice)
+      rendues et uploadées en parallèle (REMINDER_WORKERS)
+    - emails déposés par lots dans la file de livraison
+La progression (étape, clé de page, compteurs) est enregistrée après chaque
+page dans l'entrée REMINDER#<date> : à l'approche du timeout, la Lambda se
+relance elle-même et reprend au même point ; un second déclenchement le même
+jour reprend ou ne fait rien.
 """
 
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-import boto3
-
 # Imports locaux
 import sys
 sys.path.insert(0, '/var/task')
-from shared.db import get_table
-from shared.resend_client import send_email
-from invoices.generate import generate_and_upload_invoice
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from boto3.dynamodb.conditions import Key
+from shared.clients import get_client
+from shared.db import batch_get_items, get_item, get_table, put_item, update_item
+from shared.delivery_queue import enqueue_many
+from shared.metrics import increment
+from shared.templates import render
 
 # Configuration
 REGION = 'us-east-1'
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
+TABLE_USERS = os.environ.get('TABLE_USERS', 'limajs-users')
+TABLE_SUBSCRIPTIONS = os.environ.get('TABLE_SUBSCRIPTIONS', 'limajs-subscriptions')
+# Types d'abonnement (pk=TYPE, sk=<type>), dans la table des abonnements par défaut
+TABLE_SUBSCRIPTION_TYPES = os.environ.get('TABLE_SUBSCRIPTION_TYPES', TABLE_SUBSCRIPTIONS)
+TABLE_NOTIFICATIONS = os.environ.get('TABLE_NOTIFICATIONS', 'limajs-notifications')
+
+REMINDER_DAYS = (7, 3, 0)
+REMINDER_WORKERS = int(os.environ.get('REMINDER_WORKERS', '8'))
+REMINDER_PAGE_SIZE = int(os.environ.get('REMINDER_PAGE_SIZE', '200'))
+# Marge avant le timeout Lambda pour enregistrer la reprise et relancer
+REMINDER_TIME_MARGIN_MS = 20000
+REMINDER_RESUME_SOURCE = 'limajs.subscriptions.reminder'
 
 
-def get_expiring_subscriptions(days_until_expiry: int) -> list:
+def iter_expiring_subscriptions(days_until_expiry: int, cursor: dict = None):
     """
-    Récupère les abonnements qui expirent dans X jours
+    Pages (abonnements, clé suivante) des abonnements actifs qui expirent
+    dans X jours. endDate est un timestamp ISO : begins_with sur la date.
     """
-    table = get_table('limajs-subscriptions')
+    table = get_table(TABLE_SUBSCRIPTIONS)
+    target_date = (datetime.utcnow() + timedelta(days=days_until_expiry)).strftime('%Y-%m-%d')
     
-    target_date = (datetime.now() + timedelta(days=days_until_expiry)).strftime('%Y-%m-%d')
-    
-    # Query by status and endDate
-    response = table.query(
-        IndexName='status-enddate',
-        KeyConditionExpression='#status = :status AND #endDate = :date',
-        ExpressionAttributeNames={
-            '#status': 'status',
-            '#endDate': 'endDate'
-        },
-        ExpressionAttributeValues={
-            ':status': 'active',
-            ':date': target_date
-        }
-    )
-    
-    return response.get('Items', [])
+    kwargs = {
+        'IndexName': 'status-enddate',
+        'KeyConditionExpression': Key('status').eq('ACTIVE') & Key('endDate').begins_with(target_date),
+        'Limit': REMINDER_PAGE_SIZE
+    }
+    start_key = cursor
+    while True:
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        response = table.query(**kwargs)
+        start_key = response.get('LastEvaluatedKey')
+        yield response.get('Items', []), start_key
+        if not start_key:
+            break
 
 
-def get_user(user_id: str) -> dict:
-    """Récupère les infos utilisateur"""
-    table = get_table('limajs-users')
-    response = table.get_item(Key={'userId': user_id, 'type': 'PROFILE'})
-    return response.get('Item', {})
+def get_users(user_ids) -> dict:
+    """Profils par userId (BatchGetItem)"""
+    keys = [{'userId': user_id, 'type': 'PROFILE'} for user_id in sorted(set(user_ids))]
+    return {item['userId']: item for item in batch_get_items(TABLE_USERS, keys)}
 
 
-def get_subscription_type(type_id: str) -> dict:
-    """Récupère les infos du type d'abonnement"""
-    table = get_table('limajs-subscriptions')
-    response = table.get_item(Key={'pk': 'TYPE', 'sk': type_id})
-    return response.get('Item', {})
+def subscription_type_id(subscription: dict) -> str:
+    return (subscription.get('subscriptionType') or subscription.get('type') or 'monthly').lower()
 
 
-def create_invoice_record(user: dict, subscription: dict, sub_type: dict) -> dict:
-    """Crée un enregistrement de facture dans DynamoDB"""
-    table = get_table('limajs-invoices')
-    
-    invoice_id = f"inv-{datetime.now().strftime('%Y%m%d%H%M%S')}-{user['userId'][-6:]}"
-    
-    item = {
-        'invoiceId': invoice_id,
-        'userId': user['userId'],
-        'subscriptionId': subscription.get('subscriptionId') or subscription.get('sk'),
-        'amount': sub_type.get('price', 0),
+def get_subscription_types(type_ids, known: dict) -> dict:
+    """Complète `known` (type -> item) avec les types manquants (BatchGetItem)"""
+    missing = sorted(set(type_ids) - set(known))
+    if missing:
+        for item in batch_get_items(TABLE_SUBSCRIPTION_TYPES, [{'pk': 'TYPE', 'sk': t} for t in missing]):
+            known[item['sk']] = item
+        # Types inconnus: valeurs par défaut des templates, sans relire à chaque page
+        for type_id in missing:
+            known.setdefault(type_id, {})
+    return known
+
+
+def build_invoice_data(user: dict, subscription: dict, sub_type: dict) -> dict:
+    """Données de la facture de renouvellement (format invoices.generate, sans numéro)"""
+    end_date = (subscription.get('endDate') or datetime.utcnow().isoformat())[:10]
+    price = float(sub_type.get('price', 0))
+    return {
+        'date': datetime.now().strftime('%d/%m/%Y'),
+        'dueDate': end_date,
+        'status': 'unpaid',
+        'customer': {
+            'name': f"{user.get('firstName', '')} {user.get('lastName', '')}".strip(),
+            'email': user.get('email', ''),
+            'phone': user.get('phone', '')
+        },
+        'items': [{
+            'description': f"{sub_type.get('name', 'Abonnement')} - Renouvellement",
+            'quantity': 1,
+            'unitPrice': price,
+            'total': price
+        }],
+        'subtotal': price,
+        'total': price,
         'currency': sub_type.get('currency', 'HTG'),
-        'status': 'pending',
-        'dueDate': subscription.get('endDate'),
-        'createdAt': datetime.now().isoformat()
+        'period': {
+            'start': end_date,
+            'end': (datetime.strptime(end_date, '%Y-%m-%d') +
+                    timedelta(days=int(sub_type.get('duration', 30)))).strftime('%d/%m/%Y')
+        }
     }
+
+
+def create_invoice(user: dict, subscription: dict, sub_type: dict) -> dict:
+    """
+    Facture du renouvellement. Le stockage est adressé par contenu : les
+    rappels J-7, J-3 et J-0 d'un même renouvellement réutilisent la même
+    facture (ni nouveau rendu, ni nouvel upload).
+    """
+    # Import différé: ReportLab n'est chargé que si un PDF est rendu
+    from invoices.generate import store_invoice
     
-    table.put_item(Item=item)
-    return item
+    return store_invoice(
+        build_invoice_data(user, subscription, sub_type),
+        user['userId'],
+        {
+            'subscriptionId': subscription.get('subscriptionId') or subscription.get('sk'),
+            'amount': sub_type.get('price', 0),
+            'currency': sub_type.get('currency', 'HTG'),
+            'status': 'pending',
+            'dueDate': subscription.get('endDate')
+        }
+    )
 
 
-def send_reminder_email(user: dict, subscription: dict, sub_type: dict, days_remaining: int, invoice_pdf: bytes):
-    """Envoie l'email de rappel avec la facture en pièce jointe"""
+def reminder_email_job(user: dict, subscription: dict, sub_type: dict, days_remaining: int, invoice: dict) -> dict:
+    """
+    Job 'email' du rappel pour la file de livraison, avec la facture en
+    pièce jointe (référencée par sa clé S3, lue par le worker à l'envoi)
+    """
     
     if days_remaining == 7:
         subject = "🔔 Rappel: Votre abonnement expire dans 7 jours"
@@ -95,141 +162,156 @@ def send_reminder_email(user: dict, subscription: dict, sub_type: dict, days_rem
         subject = "❌ Votre abonnement expire aujourd'hui"
         urgency = "aujourd'hui"
     
-    html_content = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; background: #f4f4f4; padding: 20px; }}
-            .container {{ max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; padding: 30px; }}
-            h1 {{ color: #2563EB; }}
-            .warning {{ background: #FEF3C7; border-left: 4px solid #F59E0B; padding: 15px; margin: 20px 0; }}
-            .urgent {{ background: #FEE2E2; border-left: 4px solid #EF4444; }}
-            .btn {{ display: inline-block; background: #2563EB; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px; margin-top: 20px; }}
-            .footer {{ color: #9CA3AF; font-size: 12px; margin-top: 30px; text-align: center; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>LimaJS Motors</h1>
-            <p>Bonjour {user.get('firstName', 'Client')},</p>
-            
-            <div class="warning {'urgent' if days_remaining <= 3 else ''}">
-                <strong>Votre abonnement {sub_type.get('name', 'Pass')} expire {urgency}.</strong>
-            </div>
-            
-            <p>Pour continuer à profiter de nos services de transport, veuillez renouveler votre abonnement.</p>
-            
-            <h3>Détails:</h3>
-            <ul>
-                <li><strong>Type:</strong> {sub_type.get('name', 'Abonnement')}</li>
-                <li><strong>Prix:</strong> {sub_type.get('price', 0)} {sub_type.get('currency', 'HTG')}</li>
-                <li><strong>Expiration:</strong> {subscription.get('endDate')}</li>
-            </ul>
-            
-            <p>Vous trouverez la facture en pièce jointe.</p>
-            
-            <p><strong>Période de grâce:</strong> Vous disposez d'une semaine après l'expiration pour renouveler sans interruption de service.</p>
-            
-            <a href="https://app.limajsmotors.com/subscription" class="btn">Renouveler maintenant</a>
-            
-            <div class="footer">
-                <p>Merci de votre confiance!</p>
-                <p>LimaJS Motors - Transport Collectif</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    
-    import base64
-    
-    send_email(
-        to=user.get('email'),
+    email = render(
+        'subscription_reminder',
         subject=subject,
-        html=html_content,
-        attachments=[{
+        first_name=user.get('firstName', 'Client'),
+        urgency=urgency,
+        urgency_class='urgent' if days_remaining <= 3 else '',
+        plan=sub_type.get('name', 'Pass'),
+        plan_type=sub_type.get('name', 'Abonnement'),
+        price=sub_type.get('price', 0),
+        currency=sub_type.get('currency', 'HTG'),
+        end_date=subscription.get('endDate')
+    )
+    
+    return {
+        'to': user.get('email'),
+        'subject': email['subject'],
+        'html': email['html'],
+        'text': email['text'],
+        'attachments': [{
             'filename': f'facture-limajs-{datetime.now().strftime("%Y%m%d")}.pdf',
-            'content': base64.b64encode(invoice_pdf).decode('utf-8'),
+            's3Bucket': invoice['s3Bucket'],
+            's3Key': invoice['s3Key'],
             'type': 'application/pdf'
         }]
-    )
+    }
 
 
-def process_reminders(days: int):
-    """Traite les rappels pour un nombre de jours donné"""
-    subscriptions = get_expiring_subscriptions(days)
+def process_page(subscriptions: list, days: int, sub_types: dict) -> dict:
+    """Traite une page d'abonnements ; retourne ses compteurs"""
+    users = get_users(sub['userId'] for sub in subscriptions if sub.get('userId'))
+    get_subscription_types([subscription_type_id(sub) for sub in subscriptions], sub_types)
     
-    print(f"📧 Found {len(subscriptions)} subscriptions expiring in {days} days")
-    
-    for sub in subscriptions:
+    def process(sub):
+        user = users.get(sub.get('userId'))
+        if not user or not user.get('email'):
+            return None
         try:
-            # Get user and subscription type
-            user = get_user(sub.get('userId') or sub.get('pk', '').replace('USER#', ''))
-            if not user:
-                continue
-            
-            sub_type = get_subscription_type(sub.get('subscriptionType', 'monthly'))
-            
-            # Create invoice record
-            invoice_record = create_invoice_record(user, sub, sub_type)
-            
-            # Generate PDF invoice
-            invoice_data = {
-                'invoiceNumber': invoice_record['invoiceId'].upper(),
-                'date': datetime.now().strftime('%d/%m/%Y'),
-                'dueDate': sub.get('endDate', ''),
-                'status': 'unpaid',
-                'customer': {
-                    'name': f"{user.get('firstName', '')} {user.get('lastName', '')}".strip(),
-                    'email': user.get('email', ''),
-                    'phone': user.get('phone', '')
-                },
-                'items': [{
-                    'description': f"{sub_type.get('name', 'Abonnement')} - Renouvellement",
-                    'quantity': 1,
-                    'unitPrice': float(sub_type.get('price', 0)),
-                    'total': float(sub_type.get('price', 0))
-                }],
-                'subtotal': float(sub_type.get('price', 0)),
-                'total': float(sub_type.get('price', 0)),
-                'currency': sub_type.get('currency', 'HTG'),
-                'period': {
-                    'start': sub.get('endDate', ''),
-                    'end': (datetime.strptime(sub.get('endDate', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d') + 
-                           timedelta(days=sub_type.get('duration', 30))).strftime('%d/%m/%Y')
-                }
-            }
-            
-            result = generate_and_upload_invoice(invoice_data)
-            
-            # Update invoice record with PDF URL
-            table = get_table('limajs-invoices')
-            table.update_item(
-                Key={'invoiceId': invoice_record['invoiceId'], 'userId': user['userId']},
-                UpdateExpression='SET pdfUrl = :url',
-                ExpressionAttributeValues={':url': result['pdfUrl']}
-            )
-            
-            # Send reminder email
-            send_reminder_email(user, sub, sub_type, days, result['pdfBytes'])
-            
-            print(f"  ✅ Sent reminder to {user.get('email')}")
-            
+            sub_type = sub_types[subscription_type_id(sub)]
+            invoice = create_invoice(user, sub, sub_type)
+            return reminder_email_job(user, sub, sub_type, days, invoice)
         except Exception as e:
-            print(f"  ❌ Error processing subscription: {e}")
+            print(f"  ❌ Error processing subscription {sub.get('subscriptionId')}: {e}")
+            return False
+    
+    with ThreadPoolExecutor(max_workers=REMINDER_WORKERS) as pool:
+        outcomes = list(pool.map(process, subscriptions))
+    
+    jobs = [('email', job) for job in outcomes if job]
+    if jobs:
+        enqueue_many(jobs)
+    return {
+        'found': len(subscriptions),
+        'queued': len(jobs),
+        'skipped': outcomes.count(None),
+        'failed': outcomes.count(False)
+    }
+
+
+def run_reminders(job: dict, context=None) -> dict:
+    """Traite les pages restantes du job `job` et met à jour sa reprise"""
+    cursor = json.loads(job['cursor']) if job.get('cursor') else None
+    counters = {name: int(job.get(name, 0)) for name in ('found', 'queued', 'skipped', 'failed')}
+    queued_before = counters['queued']
+    sub_types = {}
+    status = 'DONE'
+    
+    for stage in range(int(job.get('stage', 0)), len(REMINDER_DAYS)):
+        days = REMINDER_DAYS[stage]
+        interrupted = False
+        for subscriptions, next_key in iter_expiring_subscriptions(days, cursor):
+            page = process_page(subscriptions, days, sub_types) if subscriptions else {}
+            for name, value in page.items():
+                counters[name] += value
+            if subscriptions:
+                print(f"📧 J-{days}: {page['queued']}/{page['found']} rappels déposés")
+            
+            # Point de reprise: page suivante de l'étape, ou début de l'étape suivante
+            job['stage'], job['cursor'] = (stage, json.dumps(next_key, default=str)) if next_key else (stage + 1, None)
+            job.update(counters, updatedAt=datetime.utcnow().isoformat())
+            save_checkpoint(job)
+            if context and context.get_remaining_time_in_millis() < REMINDER_TIME_MARGIN_MS:
+                interrupted = next_key is not None or stage + 1 < len(REMINDER_DAYS)
+                break
+        cursor = None
+        if interrupted:
+            status = 'RUNNING'
+            break
+    
+    job.update(counters, status=status, updatedAt=datetime.utcnow().isoformat())
+    save_checkpoint(job)
+    increment('RemindersQueued', counters['queued'] - queued_before)
+    
+    if status == 'RUNNING':
+        continue_reminders(job['notificationId'], context)
+    return job
+
+
+def save_checkpoint(job: dict):
+    update_item(
+        TABLE_NOTIFICATIONS,
+        {'userId': 'SYSTEM', 'notificationId': job['notificationId']},
+        "SET #status = :status, stage = :stage, #cursor = :cursor, #found = :found, queued = :queued, "
+        "skipped = :skipped, failed = :failed, updatedAt = :updatedAt",
+        {
+            ':status': job.get('status', 'RUNNING'), ':stage': job['stage'], ':cursor': job.get('cursor'),
+            ':found': job['found'], ':queued': job['queued'], ':skipped': job['skipped'],
+            ':failed': job['failed'], ':updatedAt': job['updatedAt']
+        },
+        {'#status': 'status', '#cursor': 'cursor', '#found': 'found'}
+    )
+
+
+def continue_reminders(run_id: str, context):
+    """Relance asynchrone de la Lambda pour la suite des rappels"""
+    try:
+        get_client('lambda').invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps({'source': REMINDER_RESUME_SOURCE, 'runId': run_id})
+        )
+        print(f"🔁 Rappels {run_id}: suite dans une nouvelle invocation")
+    except Exception as e:
+        # Le prochain déclenchement du jour (ou un appel manuel avec runId) reprendra
+        print(f"⚠️ Relance des rappels {run_id} impossible: {e}")
 
 
 def handler(event, context):
     """Lambda handler - triggered daily by EventBridge"""
-    print("🔔 Starting subscription reminder job...")
-    print(f"📅 Current date: {datetime.now().isoformat()}")
+    event = event or {}
+    run_id = event.get('runId') or f"REMINDER#{datetime.utcnow().strftime('%Y-%m-%d')}"
+    print(f"🔔 Subscription reminder job {run_id} ({'resume' if event.get('source') == REMINDER_RESUME_SOURCE else 'start'})")
     
-    # Process reminders for different timeframes
-    process_reminders(7)   # 7 days before
-    process_reminders(3)   # 3 days before
-    process_reminders(0)   # Day of expiration
+    job = get_item(TABLE_NOTIFICATIONS, {'userId': 'SYSTEM', 'notificationId': run_id})
+    if job and job.get('status') == 'DONE':
+        print("✅ Reminders already processed today")
+    else:
+        if not job:
+            job = {'userId': 'SYSTEM', 'notificationId': run_id, 'type': 'REMINDER_RUN', 'status': 'RUNNING',
+                   'stage': 0, 'cursor': None, 'found': 0, 'queued': 0, 'skipped': 0, 'failed': 0,
+                   'startedAt': datetime.utcnow().isoformat(), 'updatedAt': datetime.utcnow().isoformat()}
+            put_item(TABLE_NOTIFICATIONS, job)
+        job = run_reminders(job, context)
     
     return {
         'statusCode': 200,
-        'body': json.dumps({'message': 'Reminders processed successfully'})
+        'body': json.dumps({
+            'message': 'Reminders processed successfully' if job['status'] == 'DONE' else 'Reminders in progress',
+            'runId': run_id,
+            'status': job['status'],
+            'queued': int(job.get('queued', 0)),
+            'failed': int(job.get('failed', 0))
+        })
     }
@@ -2,19 +2,39 @@ import json
 import os
 import sys
 import uuid
-import qrcode
 import io
 import base64
+import hashlib
+import time
 from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
-from shared.response import success, error, get_http_method, get_path_parameters, get_user_sub
+from shared.response import success, error, get_http_method, get_path_parameters, get_user_sub, binary_response, not_modified, etag_matches
 from shared.db import put_item, get_item, query_items, convert_floats
+from shared.cache import LRUCache
+from shared.clients import get_client
+from shared.metrics import instrument, timed
 from boto3.dynamodb.conditions import Key, Attr
 
 TABLE_TICKETS = os.environ.get('TABLE_TICKETS', 'limajs-tickets')
 TABLE_SUBSCRIPTIONS = os.environ.get('TABLE_SUBSCRIPTIONS', 'limajs-subscriptions')
 
+# Cache de rendu QR: LRU en mémoire + stockage optionnel ('s3' ou 'dynamodb').
+# 's3' en production : avec 'dynamodb', le PNG est stocké sur l'item ticket et
+# relu par chaque GET /tickets/my (user-tickets-index projette tous les attributs).
+QR_CACHE_MAX_BYTES = int(os.environ.get('QR_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+QR_CACHE_BACKEND = os.environ.get('QR_CACHE_BACKEND', '').lower()
+QR_CACHE_BUCKET = os.environ.get('QR_CACHE_BUCKET') or os.environ.get('AWS_S3_BUCKET_NAME')
+QR_RENDER_VERSION = 'v1'  # À incrémenter si le rendu change (invalide les ETags)
+
+_qr_cache = LRUCache(max_bytes=QR_CACHE_MAX_BYTES)
+
+def get_s3_client():
+    """Client S3 créé à la demande (uniquement si le backend S3 est utilisé)."""
+    return get_client('s3')
+
+@instrument('tickets')
 def lambda_handler(event, context):
     """
     Handler pour Tickets (QR Codes).
@@ -22,6 +42,7 @@ def lambda_handler(event, context):
     - POST /tickets/generate -> Générer un QR code pour un voyage
     - POST /tickets/validate -> Valider un QR code (chauffeur)
     - GET /tickets/history -> Historique de mes tickets
+    - GET /tickets/{id}/qr -> Image QR du ticket (cache + ETag/304)
     """
     http_method = get_http_method(event)
     path_parameters = get_path_parameters(event)
@@ -32,6 +53,9 @@ def lambda_handler(event, context):
             return generate_ticket(event)
         elif '/validate' in path and http_method == 'POST':
             return validate_ticket(event)
+        elif path.endswith('/qr') and http_method == 'GET':
+            ticket_id = path_parameters.get('id') or path_parameters.get('ticketId')
+            return get_ticket_qr(event, ticket_id)
         elif ('/history' in path or '/my' in path) and http_method == 'GET':
             return get_ticket_history(event)
         else:
@@ -74,36 +98,160 @@ def generate_ticket(event):
         'subscriptionId': subscriptions[0]['subscriptionId'],
         'status': 'ACTIVE',  # ACTIVE, USED, EXPIRED
         'ttl': int(expires_at.timestamp()),  # Pour auto-suppression DynamoDB
+        'expiresAt': expires_at.isoformat(),
         'routeId': body.get('routeId'),  # Optionnel
         'validatedAt': None,
         'validatedBy': None
     })
     
-    put_item(TABLE_TICKETS, ticket_item)
+    # Générer QR Code (une seule fois, puis mis en cache jusqu'au ttl)
+    png = render_qr_png(ticket_item)
+    
+    if QR_CACHE_BACKEND == 'dynamodb':
+        # Le PNG voyage avec le ticket et expire avec lui (TTL DynamoDB)
+        put_item(TABLE_TICKETS, {**ticket_item, 'qrPng': png})
+    else:
+        put_item(TABLE_TICKETS, ticket_item)
+        store_qr_blob(ticket_item, png)
+    
+    _qr_cache.set(ticket_id, png, expires_at=ticket_item['ttl'])
+    
+    # Convertir en base64 pour retour JSON
+    img_base64 = base64.b64encode(png).decode()
+    
+    return success({
+        'ticket': ticket_item,
+        'qrCode': f"data:image/png;base64,{img_base64}",
+        'expiresAt': expires_at.isoformat()
+    }, "Ticket generated successfully")
+
+@timed('qr.render')
+def render_qr_png(ticket):
+    """Génère l'image PNG du QR code d'un ticket."""
+    expires_at = ticket.get('expiresAt') or datetime.utcfromtimestamp(int(ticket['ttl'])).isoformat()
     
-    # Générer QR Code
     qr_data = json.dumps({
-        'ticketId': ticket_id,
-        'userId': user_id,
-        'exp': expires_at.isoformat()
+        'ticketId': ticket['ticketId'],
+        'userId': ticket['userId'],
+        'exp': expires_at
     })
     
+    import qrcode  # Import différé: qrcode + PIL ne sont chargés qu'au premier rendu
+    
     qr = qrcode.QRCode(version=1, box_size=10, border=4)
     qr.add_data(qr_data)
     qr.make(fit=True)
     
     img = qr.make_image(fill_color="black", back_color="white")
     
-    # Convertir en base64 pour retour JSON
     buffer = io.BytesIO()
     img.save(buffer, format='PNG')
-    img_base64 = base64.b64encode(buffer.getvalue()).decode()
+    return buffer.getvalue()
+
+def qr_etag(ticket):
+    """
+    ETag fort du QR: le rendu ne dépend que du ticket, on peut donc
+    répondre 304 sans relire ni régénérer l'image.
+    """
+    expires_at = ticket.get('expiresAt') or str(ticket.get('ttl'))
+    digest = hashlib.sha256(f"{ticket['ticketId']}:{ticket['userId']}:{expires_at}:{QR_RENDER_VERSION}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def public_ticket(ticket):
+    """Ticket renvoyé au client, sans le PNG mis en cache sur l'item (backend dynamodb)."""
+    return {k: v for k, v in (ticket or {}).items() if k != 'qrPng'}
+
+def qr_blob_key(ticket_id):
+    return f"qr-cache/{ticket_id}.png"
+
+def load_qr_blob(ticket):
+    """Relit le PNG depuis le stockage persistant (S3 ou item DynamoDB)."""
+    if QR_CACHE_BACKEND == 'dynamodb':
+        png = ticket.get('qrPng')
+        # boto3 retourne un objet Binary pour les attributs de type B
+        return getattr(png, 'value', png)
     
-    return success({
-        'ticket': ticket_item,
-        'qrCode': f"data:image/png;base64,{img_base64}",
-        'expiresAt': expires_at.isoformat()
-    }, "Ticket generated successfully")
+    if QR_CACHE_BACKEND == 's3' and QR_CACHE_BUCKET:
+        try:
+            response = get_s3_client().get_object(Bucket=QR_CACHE_BUCKET, Key=qr_blob_key(ticket['ticketId']))
+            return response['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+                print(f"⚠️ Erreur lecture cache QR S3: {e}")
+    return None
+
+def store_qr_blob(ticket, png):
+    """Sauvegarde le PNG dans le stockage persistant (backend S3)."""
+    if QR_CACHE_BACKEND != 's3' or not QR_CACHE_BUCKET:
+        return
+    try:
+        get_s3_client().put_object(
+            Bucket=QR_CACHE_BUCKET,
+            Key=qr_blob_key(ticket['ticketId']),
+            Body=png,
+            ContentType='image/png',
+            Expires=datetime.utcfromtimestamp(int(ticket['ttl']))
+        )
+    except ClientError as e:
+        # Le cache est une optimisation: ne jamais faire échouer la requête
+        print(f"⚠️ Erreur écriture cache QR S3: {e}")
+
+def get_ticket_qr_png(ticket):
+    """PNG du ticket: cache mémoire -> stockage persistant -> rendu."""
+    ticket_id = ticket['ticketId']
+    
+    png = _qr_cache.get(ticket_id)
+    if png is not None:
+        return png
+    
+    png = load_qr_blob(ticket)
+    if png is None:
+        png = render_qr_png(ticket)
+        store_qr_blob(ticket, png)
+    
+    _qr_cache.set(ticket_id, png, expires_at=int(ticket['ttl']))
+    return png
+
+def get_ticket_qr(event, ticket_id):
+    """Servir l'image QR d'un ticket (réouverture de l'écran ticket)."""
+    if not ticket_id:
+        return error(400, "ticketId is required")
+    
+    user_sub = get_user_sub(event)
+    
+    if not user_sub:
+        return error(401, "Unauthorized")
+    
+    tickets = query_items(
+        TABLE_TICKETS,
+        Key('ticketId').eq(ticket_id)
+    )
+    
+    if not tickets:
+        return error(404, "Ticket not found or expired")
+    
+    ticket = tickets[0]
+    
+    if ticket['userId'] != f"USER#{user_sub}":
+        return error(403, "Forbidden")
+    
+    remaining = int(ticket['ttl']) - int(time.time())
+    if remaining <= 0:
+        _qr_cache.delete(ticket_id)
+        return error(410, "Ticket expired")
+    
+    etag = qr_etag(ticket)
+    cache_headers = {
+        'ETag': etag,
+        'Cache-Control': f"private, max-age={remaining}"
+    }
+    
+    if etag_matches(event, etag):
+        return not_modified(etag, cache_headers)
+    
+    png = get_ticket_qr_png(ticket)
+    
+    return binary_response(200, png, 'image/png', cache_headers)
 
 def validate_ticket(event):
     """Valider un QR code (Chauffeur scanne)."""
@@ -139,7 +287,8 @@ def validate_ticket(event):
     updated = update_item(
         TABLE_TICKETS,
         {'ticketId': ticket_id, 'createdAt': ticket['createdAt']},
-        "SET #status = :status, validatedAt = :validated, validatedBy = :driver",
+        # Le PNG en cache (backend dynamodb) n'a plus d'utilité une fois le ticket consommé
+        "SET #status = :status, validatedAt = :validated, validatedBy = :driver REMOVE qrPng",
         {
             ':status': 'USED',
             ':validated': datetime.utcnow().isoformat(),
@@ -148,8 +297,11 @@ def validate_ticket(event):
         {'#status': 'status'}
     )
     
+    # Le QR n'a plus d'utilité une fois le ticket consommé
+    _qr_cache.delete(ticket_id)
+    
     return success({
-        'ticket': updated,
+        'ticket': public_ticket(updated),
         'passenger': ticket['userId']
     }, "Ticket validated successfully")
 
@@ -169,4 +321,6 @@ def get_ticket_history(event):
         index_name='user-tickets-index'
     )
     
+    tickets = [public_ticket(ticket) for ticket in tickets]
+    
     return success({'tickets': tickets, 'count': len(tickets)})
@@ -7,8 +7,10 @@ from datetime import datetime
 
 import sys
 sys.path.insert(0, '/var/task')
-from shared.db import get_table
-from shared.response import success, error, get_user_sub
+from shared.db import get_table, batch_get_items
+from shared.response import success, error, get_user_sub, optimize_response
+from shared.pagination import paginate, parse_limit, InvalidCursor
+from boto3.dynamodb.conditions import Key
 
 
 def get_trip_history(event, context):
@@ -19,42 +21,43 @@ def get_trip_history(event, context):
         return error(401, 'Unauthorized')
     
     params = event.get('queryStringParameters') or {}
-    limit = int(params.get('limit', 20))
+    limit = parse_limit(params)
     start_date = params.get('startDate')
     end_date = params.get('endDate')
     
-    # Query passenger trip records
+    # Query passenger trip records (GSI passenger-date: la plage de dates est
+    # une condition de clé, pas un filtre appliqué après lecture)
     table = get_table('limajs-passenger-trips')
     
-    query_params = {
-        'KeyConditionExpression': 'passengerId = :pid',
-        'ExpressionAttributeValues': {':pid': user_id},
-        'ScanIndexForward': False,  # Most recent first
-        'Limit': limit
-    }
-    
-    # Add date filter if provided
+    key_condition = Key('passengerId').eq(user_id)
     if start_date and end_date:
-        query_params['FilterExpression'] = '#date BETWEEN :start AND :end'
-        query_params['ExpressionAttributeNames'] = {'#date': 'date'}
-        query_params['ExpressionAttributeValues'][':start'] = start_date
-        query_params['ExpressionAttributeValues'][':end'] = end_date
+        key_condition = key_condition & Key('date').between(start_date, end_date)
+    elif start_date:
+        key_condition = key_condition & Key('date').gte(start_date)
+    elif end_date:
+        key_condition = key_condition & Key('date').lte(end_date)
     
-    response = table.query(**query_params)
+    try:
+        items, next_cursor = paginate(
+            table, limit, params.get('cursor'), scope=user_id,
+            IndexName='passenger-date',
+            KeyConditionExpression=key_condition,
+            ScanIndexForward=False  # Most recent first
+        )
+    except InvalidCursor:
+        return error(400, 'Invalid cursor')
     
-    # Get route names
-    routes_table = get_table('limajs-routes')
-    route_cache = {}
+    # Get route names (une seule lecture groupée des items INFO)
+    route_ids = sorted({item['routeId'] for item in items if item.get('routeId')})
+    route_cache = {
+        route['routeId']: route.get('name', 'Route inconnue')
+        for route in batch_get_items('limajs-routes', [{'routeId': r, 'type': 'INFO'} for r in route_ids])
+    }
     
     trips = []
-    for item in response.get('Items', []):
+    for item in items:
         route_id = item.get('routeId')
         
-        # Get route name (with caching)
-        if route_id and route_id not in route_cache:
-            route_resp = routes_table.get_item(Key={'routeId': route_id, 'type': 'INFO'})
-            route_cache[route_id] = route_resp.get('Item', {}).get('name', 'Route inconnue')
-        
         trips.append({
             'tripId': item.get('tripId'),
             'date': item.get('date'),
@@ -70,10 +73,12 @@ def get_trip_history(event, context):
     
     return success({
         'trips': trips,
-        'count': len(trips)
+        'count': len(trips),
+        'nextCursor': next_cursor
     })
 
 
+@optimize_response
 def handler(event, context):
     """Main handler"""
     return get_trip_history(event, context)
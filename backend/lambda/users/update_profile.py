@@ -1,17 +1,17 @@
 import json
 import os
 import sys
-import boto3
 from datetime import datetime
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from shared.response import success, error, get_http_method, get_user_sub
+from shared.clients import LazyClient
 from shared.db import get_item, update_item, convert_floats
 
 TABLE_USERS = os.environ.get('TABLE_USERS', 'limajs-users')
 S3_BUCKET = os.environ.get('AWS_S3_BUCKET_NAME')
 
-s3 = boto3.client('s3')
+s3 = LazyClient('s3')
 
 def lambda_handler(event, context):
     """
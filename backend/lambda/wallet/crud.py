@@ -7,14 +7,27 @@ import os
 from datetime import datetime
 from decimal import Decimal
 import uuid
-
-import boto3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Imports locaux
 import sys
 sys.path.insert(0, '/var/task')
-from shared.db import get_table
-from shared.response import success, error, get_user_sub
+from shared.db import get_table, resolve_key, batch_get_items
+from shared.response import success, error, get_user_sub, get_header, optimize_response, user_has_role
+from shared import ledger
+from shared.clients import LazyClient
+from shared.pagination import paginate, parse_limit, InvalidCursor
+from boto3.dynamodb.conditions import Key
+
+BULK_APPROVAL_MAX = int(os.environ.get('WALLET_BULK_APPROVAL_MAX', 500))
+BULK_APPROVAL_WORKERS = int(os.environ.get('WALLET_BULK_APPROVAL_WORKERS', 8))
+
+# Résultat de ledger.post_batch -> statut de POST /wallet/recharges/approve.
+# 'rejected': le paiement n'était plus pending au moment de la transaction
+# (traité entre-temps) -> déjà traité, comme 'replayed'
+RECHARGE_APPROVAL_STATUS = {'applied': 'approved', 'replayed': 'skipped', 'rejected': 'skipped'}
+
+s3 = LazyClient('s3')
 
 
 def get_balance(event, context):
@@ -43,29 +56,41 @@ def get_transactions(event, context):
         return error(401, 'Unauthorized')
     
     params = event.get('queryStringParameters') or {}
-    limit = int(params.get('limit', 20))
+    limit = parse_limit(params)
     
     table = get_table('limajs-wallet-transactions')
     
-    response = table.query(
-        KeyConditionExpression='userId = :uid',
-        ExpressionAttributeValues={':uid': user_id},
-        ScanIndexForward=False,  # Most recent first
-        Limit=limit
-    )
+    # GSI user-date: ordre chronologique, sans snapshots ni marqueurs d'idempotence
+    try:
+        items, next_cursor = paginate(
+            table, limit, params.get('cursor'), scope=user_id,
+            IndexName='user-date',
+            KeyConditionExpression=Key('userId').eq(user_id),
+            ScanIndexForward=False  # Most recent first
+        )
+    except InvalidCursor:
+        return error(400, 'Invalid cursor')
+    
+    # Solde après chaque entrée: un seul calcul par requête, depuis le snapshot
+    # le plus proche (au plus SNAPSHOT_INTERVAL entrées relues ; snapshot
+    # d'ouverture pour les comptes qui n'en ont pas encore), puis déduit
+    # entrée par entrée en descendant la page
+    balance = ledger.balance_at(user_id, items[0]['createdAt']) if items else None
     
     transactions = []
-    for item in response.get('Items', []):
+    for item in items:
         transactions.append({
             'transactionId': item.get('transactionId'),
             'type': item.get('type'),  # credit or debit
             'amount': float(item.get('amount', 0)),
             'description': item.get('description'),
             'date': item.get('createdAt'),
-            'relatedId': item.get('relatedId')
+            'relatedId': item.get('relatedId'),
+            'balanceAfter': float(balance)
         })
+        balance -= ledger.signed_amount(item)
     
-    return success({'transactions': transactions})
+    return success({'transactions': transactions, 'nextCursor': next_cursor})
 
 
 def request_recharge(event, context):
@@ -102,7 +127,6 @@ def request_recharge(event, context):
     table.put_item(Item=item)
     
     # Generate presigned URL for proof upload
-    s3 = boto3.client('s3')
     bucket = os.environ.get('PAYMENTS_BUCKET', 'limajs-payments')
     key = f"recharge-proofs/{user_id}/{payment_id}.jpg"
     
@@ -138,106 +162,156 @@ def pay_with_wallet(event, context):
     amount = body.get('amount')
     description = body.get('description', 'Paiement')
     related_id = body.get('relatedId')  # subscriptionId or tripId
+    # Un client qui rejoue la requête (timeout réseau) renvoie la même clé
+    idempotency_key = get_header(event, 'Idempotency-Key') or body.get('idempotencyKey')
     
     if not amount or float(amount) <= 0:
         return error(400, 'Invalid amount')
     
     amount = Decimal(str(amount))
     
-    # Get current balance
-    users_table = get_table('limajs-users')
-    response = users_table.get_item(Key={'userId': user_id, 'type': 'PROFILE'})
-    user = response.get('Item', {})
-    
-    current_balance = Decimal(str(user.get('walletBalance', 0)))
-    
-    if current_balance < amount:
+    # Débit + entrée du grand livre dans une seule transaction (condition de solde atomique)
+    try:
+        result = ledger.debit(user_id, amount, description, related_id, idempotency_key)
+    except ledger.InsufficientFunds:
         return error(400, 'Solde insuffisant', {
-            'currentBalance': float(current_balance),
+            'currentBalance': float(ledger.get_balance(user_id)),
             'required': float(amount)
         })
     
-    # Deduct from wallet (atomic operation)
-    new_balance = current_balance - amount
-    
-    users_table.update_item(
-        Key={'userId': user_id, 'type': 'PROFILE'},
-        UpdateExpression='SET walletBalance = :balance, lastWalletUpdate = :now',
-        ConditionExpression='walletBalance >= :amount',
-        ExpressionAttributeValues={
-            ':balance': new_balance,
-            ':amount': amount,
-            ':now': datetime.now().isoformat()
-        }
-    )
-    
-    # Record transaction
-    tx_table = get_table('limajs-wallet-transactions')
-    transaction_id = f"tx-{uuid.uuid4().hex[:12]}"
-    
-    tx_table.put_item(Item={
-        'transactionId': transaction_id,
-        'userId': user_id,
-        'type': 'debit',
-        'amount': amount,
-        'description': description,
-        'relatedId': related_id,
-        'balanceAfter': new_balance,
-        'createdAt': datetime.now().isoformat()
-    })
-    
     return success({
-        'transactionId': transaction_id,
+        'transactionId': result['transactionId'],
         'amount': float(amount),
-        'newBalance': float(new_balance),
+        'newBalance': float(result['newBalance']),
+        'replayed': result['replayed'],
         'message': 'Paiement effectué avec succès'
     })
 
 
-def credit_wallet(user_id: str, amount: Decimal, description: str, related_id: str = None):
+def credit_wallet(user_id: str, amount: Decimal, description: str, related_id: str = None, idempotency_key: str = None):
     """Fonction utilitaire pour créditer un wallet (appelée après approbation d'une recharge)"""
     
-    users_table = get_table('limajs-users')
+    # Une recharge ne doit être créditée qu'une fois, même si l'approbation est rejouée
+    if idempotency_key is None and related_id:
+        idempotency_key = f"credit-{related_id}"
     
-    # Get current balance
-    response = users_table.get_item(Key={'userId': user_id, 'type': 'PROFILE'})
-    user = response.get('Item', {})
-    current_balance = Decimal(str(user.get('walletBalance', 0)))
-    
-    new_balance = current_balance + amount
-    
-    # Update balance
-    users_table.update_item(
-        Key={'userId': user_id, 'type': 'PROFILE'},
-        UpdateExpression='SET walletBalance = :balance, walletCurrency = :currency, lastWalletUpdate = :now',
-        ExpressionAttributeValues={
-            ':balance': new_balance,
-            ':currency': 'HTG',
-            ':now': datetime.now().isoformat()
-        }
-    )
-    
-    # Record transaction
-    tx_table = get_table('limajs-wallet-transactions')
-    transaction_id = f"tx-{uuid.uuid4().hex[:12]}"
-    
-    tx_table.put_item(Item={
-        'transactionId': transaction_id,
-        'userId': user_id,
-        'type': 'credit',
-        'amount': amount,
-        'description': description,
-        'relatedId': related_id,
-        'balanceAfter': new_balance,
-        'createdAt': datetime.now().isoformat()
-    })
+    result = ledger.credit(user_id, amount, description, related_id, idempotency_key)
     
     return {
-        'transactionId': transaction_id,
-        'newBalance': float(new_balance)
+        'transactionId': result['transactionId'],
+        'newBalance': float(result['newBalance'])
     }
 
 
+def approve_recharges(event, context):
+    """
+    POST /wallet/recharges/approve - Approbation en masse de recharges (admin)
+    
+    Body: {"paymentIds": ["recharge-xxx", ...]}
+    Les crédits sont regroupés par utilisateur: une transaction par utilisateur
+    (solde + entrées + passage des paiements à 'approved'), traitées en parallèle.
+    """
+    if not get_user_sub(event):
+        return error(401, 'Unauthorized')
+    if not user_has_role(event, 'ADMIN'):
+        return error(403, 'Admin access required')
+    
+    try:
+        body = json.loads(event.get('body', '{}'))
+    except:
+        return error(400, 'Invalid JSON body')
+    
+    payment_ids = list(dict.fromkeys(body.get('paymentIds') or []))
+    if not payment_ids:
+        return error(400, 'paymentIds required')
+    if len(payment_ids) > BULK_APPROVAL_MAX:
+        return error(400, f'Maximum {BULK_APPROVAL_MAX} paiements par appel')
+    
+    admin_id = get_user_sub(event)
+    report = {payment_id: {'paymentId': payment_id} for payment_id in payment_ids}
+    
+    with ThreadPoolExecutor(max_workers=BULK_APPROVAL_WORKERS) as pool:
+        # 1. Résolution des clés (GSI payment-id-index) puis lecture par lots
+        keys = dict(zip(payment_ids, pool.map(lambda pid: resolve_key('payment', pid), payment_ids)))
+        found = batch_get_items('limajs-payments', [key for key in keys.values() if key])
+        payments = {item['paymentId']: item for item in found}
+        
+        by_user = {}
+        for payment_id in payment_ids:
+            payment = payments.get(payment_id)
+            if not payment or payment.get('type') != 'wallet_recharge':
+                report[payment_id].update(status='failed', reason='not_found')
+            elif payment.get('status') != 'pending':
+                report[payment_id].update(status='skipped', reason=f"status_{payment.get('status')}")
+            else:
+                by_user.setdefault(payment['userId'], []).append(payment)
+        
+        # 2. Une transaction (ou plus si > 100 actions) par utilisateur
+        futures = {
+            pool.submit(_credit_recharges, user_id, user_payments, admin_id): user_payments
+            for user_id, user_payments in by_user.items()
+        }
+        for future in as_completed(futures):
+            user_payments = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"❌ Erreur approbation recharges {user_payments[0]['userId']}: {e}")
+                for payment in user_payments:
+                    report[payment['paymentId']].update(status='failed', reason='error')
+                continue
+            for payment, result in zip(user_payments, results):
+                report[payment['paymentId']].update(
+                    status=RECHARGE_APPROVAL_STATUS.get(result['status'], 'failed'),
+                    reason=None if result['status'] == 'applied' else result['status'],
+                    userId=payment['userId'],
+                    amount=float(payment['amount']),
+                    transactionId=result['transactionId'],
+                    newBalance=float(result['newBalance'])
+                )
+    
+    items = [report[payment_id] for payment_id in payment_ids]
+    summary = {}
+    for item in items:
+        summary[item['status']] = summary.get(item['status'], 0) + 1
+    
+    return success({'results': items, 'summary': summary})
+
+
+def _credit_recharges(user_id, payments, admin_id):
+    """Crédite toutes les recharges d'un utilisateur et les marque approuvées, atomiquement."""
+    now = datetime.now().isoformat()
+    entries = []
+    for payment in payments:
+        transaction_id = ledger.new_transaction_id()
+        entries.append({
+            'type': 'credit',
+            'amount': payment['amount'],
+            'description': 'Recharge wallet',
+            'relatedId': payment['paymentId'],
+            'idempotencyKey': f"credit-{payment['paymentId']}",
+            'transactionId': transaction_id,
+            'actions': [{
+                'Update': {
+                    'TableName': 'limajs-payments',
+                    'Key': ledger.serialize_item({'userId': user_id, 'paymentId': payment['paymentId']}),
+                    'UpdateExpression': 'SET #status = :approved, approvedAt = :now, approvedBy = :admin, walletTransactionId = :tx',
+                    'ConditionExpression': '#status = :pending',
+                    'ExpressionAttributeNames': {'#status': 'status'},
+                    'ExpressionAttributeValues': ledger.serialize_item({
+                        ':approved': 'approved',
+                        ':pending': 'pending',
+                        ':now': now,
+                        ':admin': admin_id or 'admin',
+                        ':tx': transaction_id
+                    })
+                }
+            }]
+        })
+    return ledger.post_batch(user_id, entries)
+
+
+@optimize_response
 def handler(event, context):
     """Main handler routing to appropriate function"""
     method = event.get('httpMethod', event.get('requestContext', {}).get('http', {}).get('method'))
@@ -251,5 +325,7 @@ def handler(event, context):
         return request_recharge(event, context)
     elif path.endswith('/pay') and method == 'POST':
         return pay_with_wallet(event, context)
+    elif path.endswith('/recharges/approve') and method == 'POST':
+        return approve_recharges(event, context)
     
     return error(404, 'Not found')
@@ -5,6 +5,7 @@ import boto3
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from shared.db import query_items, scan_items
+from shared.metrics import instrument, timer, increment
 from boto3.dynamodb.conditions import Key, Attr
 
 TABLE_CONNECTIONS = os.environ.get('TABLE_CONNECTIONS', 'limajs-websocket-connections')
@@ -23,6 +24,7 @@ def get_apigw_client(event):
         apigw_management = boto3.client('apigatewaymanagementapi', endpoint_url=endpoint)
     return apigw_management
 
+@instrument('broadcast')
 def lambda_handler(event, context):
     """
     Broadcast GPS updates aux clients connectés.
@@ -84,18 +86,21 @@ def lambda_handler(event, context):
         sent_count = 0
         for conn in connections:
             try:
-                apigw.post_to_connection(
-                    ConnectionId=conn['connectionId'],
-                    Data=json.dumps(message)
-                )
+                with timer('apigw.post_to_connection'):
+                    apigw.post_to_connection(
+                        ConnectionId=conn['connectionId'],
+                        Data=json.dumps(message)
+                    )
                 sent_count += 1
             except apigw.exceptions.GoneException:
                 # Connexion morte, la supprimer
                 delete_item(TABLE_CONNECTIONS, {'connectionId': conn['connectionId']})
+                increment('StaleConnections')
                 print(f"🗑️ Connexion morte supprimée: {conn['connectionId']}")
             except Exception as e:
                 print(f"⚠️ Erreur envoi à {conn['connectionId']}: {e}")
         
+        increment('MessagesSent', sent_count)
         print(f"✅ Broadcast terminé: {sent_count}/{len(connections)} envoyés")
         
         return {
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Écrit le snapshot d'ouverture du wallet (shared.ledger.opening_snapshot) des
+profils qui n'ont encore aucun snapshot.
+
+Les comptes créés avant le grand livre ont un walletBalance sans les entrées
+qui l'expliquent : sans snapshot d'ouverture, balanceAfter (GET
+/wallet/transactions) et ledger.reconcile rejouent depuis 0 et relisent tout
+l'historique. À lancer une fois après le déploiement ; les comptes oubliés
+reçoivent leur snapshot d'ouverture à la première lecture.
+
+Usage:
+    python backfill_wallet_snapshots.py
+    python backfill_wallet_snapshots.py --dry-run
+"""
+
+import argparse
+import os
+import sys
+
+from boto3.dynamodb.conditions import Attr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared import ledger
+from shared.db import get_table
+
+# Configure stdout for Windows
+sys.stdout.reconfigure(encoding='utf-8')
+
+
+def iter_wallet_profiles():
+    """Profils ayant déjà un solde wallet."""
+    table = get_table(ledger.TABLE_USERS)
+    kwargs = {
+        'FilterExpression': Attr('type').eq('PROFILE') & Attr('walletBalance').exists(),
+        'ProjectionExpression': 'userId, walletBalance'
+    }
+    while True:
+        response = table.scan(**kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help="Affiche les soldes d'ouverture sans les écrire")
+    args = parser.parse_args()
+
+    written = skipped = 0
+    for profile in iter_wallet_profiles():
+        user_id = profile['userId']
+        if ledger.latest_snapshot(user_id):
+            skipped += 1
+            continue
+        if args.dry_run:
+            opening = profile['walletBalance'] - sum(ledger.signed_amount(e) for e in ledger.iter_entries(user_id))
+            print(f"  {user_id}: ouverture {opening}")
+        else:
+            snapshot = ledger.opening_snapshot(user_id)
+            print(f"  {user_id}: ouverture {snapshot['balance']}")
+        written += 1
+
+    action = "à écrire" if args.dry_run else "écrits"
+    print(f"✅ {written} snapshots d'ouverture {action}, {skipped} comptes déjà couverts")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+"""
+Chargement en masse de données de test (tests de performance sur grosses tables).
+
+Les éléments sont générés de façon déterministe à partir d'une graine : le
+même appel produit toujours les mêmes clés et valeurs, sur autant de
+millions d'éléments que demandé. Le travail est découpé en lots (shards) de
+SHARD_SIZE éléments, écrits en parallèle par un pool de threads, chacun avec
+son propre batch_writer (BatchWriteItem par 25, UnprocessedItems relancés).
+
+Chaque lot terminé est noté dans un fichier de reprise : après une
+interruption, --resume ne réécrit que les lots manquants (un lot rejoué
+réécrit les mêmes clés, sans doublon).
+
+Usage:
+    python bulk_load.py --users 50000 --trips 2000000 --payments 500000 --gps 5000000
+    python bulk_load.py --trips 2000000 --workers 32 --resume
+    python bulk_load.py --users 1000 --cognito 200       # + comptes Cognito (pool détecté)
+    python bulk_load.py --users 1000 --endpoint-url http://localhost:8000   # DynamoDB Local
+    python bulk_load.py --trips 1000000 --dry-run        # génération seule (débit du générateur)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import boto3
+from botocore.config import Config
+
+# Configure stdout for Windows
+sys.stdout.reconfigure(encoding='utf-8')
+
+AWS_REGION = "us-east-1"
+SHARD_SIZE = 5000
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.bulk_load_checkpoint.json')
+
+# Relances adaptatives: le débit s'ajuste au throttling au lieu d'échouer
+BOTO_CONFIG = Config(retries={'mode': 'adaptive', 'max_attempts': 10}, max_pool_connections=50)
+
+ENDPOINT_URL = None
+_local = threading.local()
+
+
+def get_table(table_name):
+    """Resource par thread (les resources boto3 ne sont pas thread-safe)."""
+    if not hasattr(_local, 'dynamodb'):
+        _local.dynamodb = boto3.session.Session().resource(
+            'dynamodb', region_name=AWS_REGION, endpoint_url=ENDPOINT_URL, config=BOTO_CONFIG
+        )
+    return _local.dynamodb.Table(table_name)
+
+
+# =============================================================================
+# GÉNÉRATEURS (un élément par index, déterministe)
+# =============================================================================
+
+ROUTES = [f"ROUTE#load-{r:03d}" for r in range(40)]
+BUSES = [f"BUS#load-{b:04d}" for b in range(300)]
+
+
+def user_sub(index):
+    return f"load-user-{index:08d}"
+
+
+def user_id(index):
+    """Clé utilisateur des tables (USER#<sub>), comme les profils."""
+    return f"USER#{user_sub(index)}"
+
+
+def _moment(config, rng):
+    return config['start'] + timedelta(seconds=rng.randint(0, config['days'] * 86400 - 1))
+
+
+def gen_user(index, rng, config):
+    sub = user_sub(index)
+    return {
+        'userId': user_id(index), 'type': 'PROFILE', 'email': f"{sub}@load.limajs.test",
+        'name': f"Passager {index}", 'phone': f"+509{30000000 + index % 10000000:08d}",
+        'role': 'PASSENGER', 'isActive': True,
+        'passengerType': rng.choice(['free', 'student', 'employee', 'parent']),
+        'walletBalance': Decimal(rng.randint(0, 5000)), 'walletCurrency': 'HTG',
+        'createdAt': _moment(config, rng).isoformat(),
+    }
+
+
+def gen_subscription(index, rng, config):
+    start = _moment(config, rng)
+    end = start + timedelta(days=rng.choice([7, 30]))
+    return {
+        'userId': user_id(index), 'subscriptionId': f"SUB#load-{index:08d}",
+        'status': 'ACTIVE' if end > config['start'] + timedelta(days=config['days']) else 'EXPIRED',
+        'type': 'WEEKLY' if (end - start).days == 7 else 'MONTHLY',
+        'startDate': start.isoformat(), 'endDate': end.isoformat(),
+        'paymentId': f"PAY#load-sub-{index:08d}", 'createdAt': start.isoformat(),
+    }
+
+
+def gen_payment(index, rng, config):
+    submitted = _moment(config, rng)
+    return {
+        'userId': user_id(rng.randrange(config['users'])), 'paymentId': f"PAY#load-{index:09d}",
+        'amount': Decimal(rng.choice([250, 500, 1000, 1500])), 'currency': 'HTG',
+        'type': rng.choice(['subscription', 'wallet_recharge']),
+        'status': rng.choice(['APPROVED'] * 8 + ['PENDING', 'REJECTED']),
+        'submittedAt': submitted.isoformat(), 'timestamp': submitted.isoformat(),
+    }
+
+
+def gen_passenger_trip(index, rng, config):
+    boarded = _moment(config, rng)
+    return {
+        'passengerId': user_id(rng.randrange(config['users'])), 'tripId': f"TRIP#load-{index:09d}",
+        'date': boarded.isoformat(), 'routeId': rng.choice(ROUTES), 'busId': rng.choice(BUSES),
+        'boardedAt': boarded.isoformat(),
+        'alightedAt': (boarded + timedelta(minutes=rng.randint(5, 60))).isoformat(),
+        'fare': Decimal(rng.choice([25, 35, 50])), 'paymentMethod': rng.choice(['subscription', 'wallet', 'nfc']),
+    }
+
+
+def gen_gps(index, rng, config):
+    # Un point toutes les 2 s par bus: les index consécutifs d'un bus sont des instants consécutifs
+    bus = BUSES[index % len(BUSES)]
+    at = config['start'] + timedelta(seconds=2 * (index // len(BUSES)))
+    return {
+        'busId': bus, 'timestamp': at.isoformat(),
+        'latitude': Decimal(str(round(18.50 + rng.random() / 10, 6))),
+        'longitude': Decimal(str(round(-72.35 + rng.random() / 10, 6))),
+        'speed': Decimal(rng.randint(0, 60)), 'heading': rng.randint(0, 359), 'accuracy': rng.randint(3, 20),
+        'routeId': ROUTES[index % len(ROUTES)],
+    }
+
+
+def gen_wallet_tx(index, rng, config):
+    created = _moment(config, rng)
+    credit = rng.random() < 0.2
+    return {
+        'userId': user_id(rng.randrange(config['users'])),
+        'transactionId': f"tx-{created.strftime('%Y%m%d%H%M%S')}-{index:09d}",
+        'type': 'credit' if credit else 'debit',
+        'amount': Decimal(500 if credit else rng.choice([25, 35, 50])),
+        'description': 'Recharge wallet' if credit else 'Trajet', 'createdAt': created.isoformat(),
+    }
+
+
+# nom -> (table, générateur)
+KINDS = {
+    'users': ('limajs-users', gen_user),
+    'subscriptions': ('limajs-subscriptions', gen_subscription),
+    'payments': ('limajs-payments', gen_payment),
+    'trips': ('limajs-passenger-trips', gen_passenger_trip),
+    'gps': ('limajs-gps-positions', gen_gps),
+    'wallet': ('limajs-wallet-transactions', gen_wallet_tx),
+}
+
+
+def generate_shard(kind, shard, total, config):
+    """Éléments du lot `shard` : même graine + même lot = mêmes éléments."""
+    rng = random.Random(f"{config['seed']}:{kind}:{shard}")
+    generator = KINDS[kind][1]
+    first = shard * SHARD_SIZE
+    for index in range(first, min(first + SHARD_SIZE, total)):
+        yield generator(index, rng, config)
+
+
+# =============================================================================
+# REPRISE
+# =============================================================================
+
+class Checkpoint:
+    """Lots terminés, persistés après chaque lot (écriture atomique)."""
+
+    def __init__(self, path, signature, resume):
+        self.path = path
+        self.signature = signature
+        self.done = set()
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('signature') != signature:
+                raise SystemExit("❌ Le fichier de reprise correspond à d'autres paramètres (graine, volumes).")
+            self.done = set(state.get('done', []))
+
+    def mark(self, key):
+        with self._lock:
+            self.done.add(key)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'signature': self.signature, 'done': sorted(self.done)}, f)
+            os.replace(tmp, self.path)
+
+
+# =============================================================================
+# ÉCRITURE
+# =============================================================================
+
+def write_shard(kind, shard, total, config, dry_run):
+    table_name = KINDS[kind][0]
+    count = 0
+    if dry_run:
+        for _ in generate_shard(kind, shard, total, config):
+            count += 1
+        return count
+    return write_items(table_name, generate_shard(kind, shard, total, config))
+
+
+def write_items(table_name, items):
+    count = 0
+    with get_table(table_name).batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+            count += 1
+    return count
+
+
+def write_tables(tables, workers=8):
+    """
+    Écrit de petits jeux fixes (scripts de seed) : une table par thread, chacune
+    par batch_writer. `tables` : {nom de table: [éléments]}. Retourne le total.
+    """
+    total = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(write_items, table_name, items): table_name for table_name, items in tables.items()}
+        for future in as_completed(futures):
+            count = future.result()
+            print(f"  📥 {futures[future]}: {count} éléments")
+            total += count
+    return total
+
+
+def load(plan, config, checkpoint, workers, dry_run):
+    tasks = [
+        (kind, shard, total)
+        for kind, total in plan
+        for shard in range((total + SHARD_SIZE - 1) // SHARD_SIZE)
+        if f"{kind}:{shard}" not in checkpoint.done
+    ]
+    expected = sum(total for _, total in plan)
+    skipped = sum(1 for kind, total in plan for shard in range((total + SHARD_SIZE - 1) // SHARD_SIZE)
+                  if f"{kind}:{shard}" in checkpoint.done)
+    if skipped:
+        print(f"⏩ {skipped} lots déjà écrits (reprise)")
+    print(f"📦 {len(tasks)} lots à écrire ({expected:,} éléments au total), {workers} workers")
+
+    written = 0
+    started = last_report = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(write_shard, kind, shard, total, config, dry_run): (kind, shard)
+                   for kind, shard, total in tasks}
+        for future in as_completed(futures):
+            kind, shard = futures[future]
+            try:
+                written += future.result()
+            except Exception as e:
+                print(f"❌ Lot {kind}:{shard} en échec: {e} (relancer avec --resume)")
+                continue
+            if not dry_run:
+                checkpoint.mark(f"{kind}:{shard}")
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                print(f"   {written:,} éléments, {written / (now - started):,.0f}/s")
+                last_report = now
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {written:,} éléments en {elapsed:.1f}s ({written / max(elapsed, 1e-9):,.0f}/s)")
+    return written
+
+
+# =============================================================================
+# COGNITO
+# =============================================================================
+
+def find_user_pool(cognito):
+    response = cognito.list_user_pools(MaxResults=60)
+    for pool in response['UserPools']:
+        if 'limajs' in pool['Name'].lower():
+            return pool['Id']
+    raise SystemExit("❌ User Pool 'limajs' introuvable")
+
+
+def create_cognito_users(count, workers, config):
+    """Comptes de charge Cognito (mot de passe commun, sans e-mail d'invitation)."""
+    cognito = boto3.client('cognito-idp', region_name=AWS_REGION, config=BOTO_CONFIG)
+    pool_id = find_user_pool(cognito)
+    password = f"Load-{hashlib.sha256(str(config['seed']).encode()).hexdigest()[:10]}!"
+
+    def create(index):
+        email = f"{user_sub(index)}@load.limajs.test"
+        try:
+            cognito.admin_create_user(
+                UserPoolId=pool_id, Username=email, MessageAction='SUPPRESS',
+                UserAttributes=[{'Name': 'email', 'Value': email}, {'Name': 'email_verified', 'Value': 'true'}]
+            )
+        except cognito.exceptions.UsernameExistsException:
+            return False
+        cognito.admin_set_user_password(UserPoolId=pool_id, Username=email, Password=password, Permanent=True)
+        return True
+
+    print(f"🔐 {count} comptes Cognito dans {pool_id} ({workers} workers)")
+    created = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(create, i) for i in range(count)]):
+            try:
+                created += future.result()
+            except Exception as e:
+                print(f"   ❌ {e}")
+    print(f"✅ {created} créés (les autres existaient déjà), mot de passe: {password}")
+
+
+def main():
+    global ENDPOINT_URL
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for kind, (table_name, _) in KINDS.items():
+        parser.add_argument(f"--{kind}", type=int, default=0, metavar='N', help=f"Éléments dans {table_name}")
+    parser.add_argument('--seed', type=int, default=42, help="Graine des générateurs")
+    parser.add_argument('--start', default='2025-01-01', help="Début de la période générée (AAAA-MM-JJ)")
+    parser.add_argument('--days', type=int, default=365, help="Durée de la période générée")
+    parser.add_argument('--workers', type=int, default=16, help="Threads d'écriture")
+    parser.add_argument('--cognito', type=int, default=0, metavar='N', help="Comptes Cognito à créer")
+    parser.add_argument('--cognito-workers', type=int, default=4, help="Threads Cognito (quota API bas)")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="Fichier de reprise")
+    parser.add_argument('--resume', action='store_true', help="Reprendre après les lots déjà écrits")
+    parser.add_argument('--endpoint-url', help="Endpoint DynamoDB (ex: DynamoDB Local)")
+    parser.add_argument('--dry-run', action='store_true', help="Générer sans écrire")
+    args = parser.parse_args()
+
+    ENDPOINT_URL = args.endpoint_url
+    plan = [(kind, getattr(args, kind)) for kind in KINDS if getattr(args, kind) > 0]
+    if not plan and not args.cognito:
+        parser.error("rien à charger (ex: --trips 1000000)")
+
+    config = {
+        'seed': args.seed,
+        'start': datetime.fromisoformat(args.start),
+        'days': args.days,
+        # Les références vers les passagers restent dans la population générée
+        'users': max(args.users, args.subscriptions, 1),
+    }
+    signature = {'seed': args.seed, 'start': args.start, 'days': args.days, 'users': config['users'],
+                 'plan': dict(plan), 'shardSize': SHARD_SIZE}
+
+    print("🌱 LimaJS Motors - Chargement en masse")
+    print("=" * 50)
+    if plan:
+        checkpoint = Checkpoint(args.checkpoint, signature, args.resume)
+        load(plan, config, checkpoint, args.workers, args.dry_run)
+    if args.cognito and not args.dry_run:
+        create_cognito_users(args.cognito, args.cognito_workers, config)
+
+
+if __name__ == "__main__":
+    main()
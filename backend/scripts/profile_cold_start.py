@@ -0,0 +1,123 @@
+"""
+Mesure le coût d'import (cold start) de chaque handler Lambda.
+
+Chaque module de backend/lambda est importé dans un interpréteur neuf avec
+`python -X importtime` : le script affiche le temps d'import total par handler
+et les imports de premier niveau les plus coûteux.
+
+Usage:
+    python profile_cold_start.py                 # tous les handlers
+    python profile_cold_start.py tickets wallet  # filtrer par chemin
+    python profile_cold_start.py --top 8 --runs 3
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+LAMBDA_DIR = os.path.join(BACKEND_DIR, 'lambda')
+
+# Dossiers vendorisés / non-handlers
+SKIP_DIRS = {'__pycache__', 'node_modules', 'qrcode', 'tests', 'contact-form'}
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+PROBE = """
+import importlib.util, sys, time
+sys.path.insert(0, {backend!r})
+sys.path.insert(0, {handler_dir!r})
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('handler_under_test', {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print('TOTAL_MS=%.1f' % ((time.perf_counter() - start) * 1000))
+"""
+
+
+def find_handlers(filters):
+    handlers = []
+    for root, dirs, files in os.walk(LAMBDA_DIR):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+        for name in sorted(files):
+            if not name.endswith('.py') or name.startswith('__'):
+                continue
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, LAMBDA_DIR)
+            if filters and not any(f in rel for f in filters):
+                continue
+            with open(path, encoding='utf-8') as f:
+                source = f.read()
+            if re.search(r'^def (lambda_)?handler\(', source, re.M):
+                handlers.append((rel, path))
+    return handlers
+
+
+def profile(path):
+    """Retourne (total_ms, [(cumulative_ms, module)]) ou lève RuntimeError."""
+    code = PROBE.format(backend=BACKEND_DIR, handler_dir=os.path.dirname(path), path=path)
+    region = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION') or 'us-east-1'
+    # botocore lit AWS_DEFAULT_REGION (AWS_REGION n'est défini que dans Lambda)
+    env = {**os.environ, 'AWS_REGION': region, 'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', region)}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, env=env, timeout=120
+    )
+    total = re.search(r'TOTAL_MS=([\d.]+)', result.stdout)
+    if result.returncode != 0 or not total:
+        # Les lignes "import time:" sont entrelacées avec la trace : garder la vraie erreur
+        errors = [line for line in result.stderr.strip().splitlines() if not line.startswith('import time:')]
+        raise RuntimeError((errors or ['?'])[-1])
+
+    top_level = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        # Indentation d'un seul espace = import de premier niveau
+        if match and len(match.group(3)) <= 1:
+            top_level.append((int(match.group(2)) / 1000, match.group(4)))
+    top_level.sort(reverse=True)
+    return float(total.group(1)), top_level
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('filters', nargs='*', help="Sous-chaînes du chemin des handlers à mesurer")
+    parser.add_argument('--top', type=int, default=5, help="Nombre d'imports coûteux affichés par handler")
+    parser.add_argument('--runs', type=int, default=1, help="Mesures par handler (la médiane est gardée)")
+    args = parser.parse_args()
+
+    handlers = find_handlers(args.filters)
+    if not handlers:
+        print("Aucun handler trouvé.")
+        return
+
+    print(f"⏱️  Profil d'import de {len(handlers)} handlers ({args.runs} mesure(s) chacun)\n")
+    results = []
+    for rel, path in handlers:
+        try:
+            runs = [profile(path) for _ in range(args.runs)]
+        except RuntimeError as e:
+            results.append((None, rel, [], str(e)))
+            continue
+        runs.sort(key=lambda r: r[0])
+        total, top = runs[len(runs) // 2]
+        results.append((total, rel, top, None))
+
+    results.sort(key=lambda r: (r[0] is None, -(r[0] or 0)))
+    for total, rel, top, err in results:
+        if err:
+            print(f"❌ {rel:<40} import impossible: {err}")
+            continue
+        print(f"{total:8.1f} ms  {rel}")
+        for cumulative, module in top[:args.top]:
+            print(f"{'':12}{cumulative:8.1f} ms  {module}")
+
+    measured = [r[0] for r in results if r[0] is not None]
+    if measured:
+        print(f"\nTotal: {len(measured)} handlers, médiane {sorted(measured)[len(measured) // 2]:.1f} ms, max {max(measured):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,15 +3,15 @@
 Script de seeding pour la base de données LimaJS Motors
 Crée des données de test réalistes pour toutes les tables
 IMPORTANT: Respecte le schéma DynamoDB avec clés composites (PK + SK)
+
+Les tables sont écrites en parallèle par bulk_load.write_tables (batch_writer
+par table). Pour de gros volumes, utiliser bulk_load.py directement.
 """
 
-import boto3
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-# Configuration
-REGION = 'us-east-1'
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
+from bulk_load import write_tables
 
 # =============================================================================
 # DONNÉES DE SEED (avec clés composites correctes)
@@ -265,29 +265,19 @@ TRIPS = [
 # SEEDING
 # =============================================================================
 
-def seed_table(table_name, items):
-    table = dynamodb.Table(table_name)
-    print(f"  📥 Seeding {table_name} ({len(items)} items)...")
-    
-    with table.batch_writer() as batch:
-        for item in items:
-            batch.put_item(Item=item)
-    
-    print(f"     ✅ Done")
-    return len(items)
-
 def main():
     print("🌱 LimaJS Motors - Database Seeding")
     print("=" * 50)
     
-    total = 0
-    total += seed_table('limajs-users', USERS)
-    total += seed_table('limajs-buses', BUSES)
-    total += seed_table('limajs-routes', ROUTES)
-    total += seed_table('limajs-schedules', SCHEDULES)
-    total += seed_table('limajs-subscriptions', SUBSCRIPTION_TYPES)
-    total += seed_table('limajs-nfc-cards', NFC_CARDS)
-    total += seed_table('limajs-trips', TRIPS)
+    total = write_tables({
+        'limajs-users': USERS,
+        'limajs-buses': BUSES,
+        'limajs-routes': ROUTES,
+        'limajs-schedules': SCHEDULES,
+        'limajs-subscriptions': SUBSCRIPTION_TYPES,
+        'limajs-nfc-cards': NFC_CARDS,
+        'limajs-trips': TRIPS,
+    })
     
     print("=" * 50)
     print(f"🎉 Seeding complete! {total} total items.")
@@ -4,6 +4,9 @@ Ce script :
 1. Crée les utilisateurs Cognito variés (Passenger, Driver, Admin)
 2. Crée les cartes NFC (Hashed) et les lie aux utilisateurs
 3. Met à jour les profils utilisateurs avec walletBalance, passengerType, etc.
+
+Les comptes sont créés en parallèle et les cartes écrites par lot
+(bulk_load.write_tables).
 """
 
 import boto3
@@ -12,17 +15,22 @@ import time
 import os
 import hashlib
 import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from botocore.exceptions import ClientError
 from decimal import Decimal
 
+from bulk_load import get_table, write_tables
+
 # --- CONFIGURATION ---
 AWS_REGION = "us-east-1"
 USER_POOL_ID = None  # Will be auto-detected
 CLIENT_ID = None     # Will be auto-detected
+COGNITO_WORKERS = 4
 
+# Client partagé entre threads (les clients boto3 sont thread-safe, pas les
+# resources: les profils passent par bulk_load.get_table, une resource par thread)
 cognito = boto3.client('cognito-idp', region_name=AWS_REGION)
-dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
 
 def get_user_pool_id():
     """Récupère dynamiquement l'ID du User Pool LimaJS"""
@@ -80,7 +88,7 @@ def create_cognito_user(email, password, given_name, family_name, phone_number,
 
 def update_dynamo_profile(user_id, role, passenger_type='free', balance=0, nfc_hash=None):
     """Met à jour le profil dans DynamoDB avec les nouveaux champs"""
-    table = dynamodb.Table('limajs-users')
+    table = get_table('limajs-users')
     
     update_expr = "SET #role = :role, passengerType = :ptype, walletBalance = :bal, walletCurrency = :curr, createdAt = :now"
     expr_values = {
@@ -103,9 +111,8 @@ def update_dynamo_profile(user_id, role, passenger_type='free', balance=0, nfc_h
     )
     print(f"   💾 Profil DB mis à jour pour {user_id}")
 
-def create_nfc_card(card_uid, user_id=None, balance=0):
-    """Crée une carte NFC dans la table limajs-nfc-cards"""
-    table = dynamodb.Table('limajs-nfc-cards')
+def build_nfc_card(card_uid, user_id=None, balance=0):
+    """Carte NFC pour limajs-nfc-cards (écrite par lot dans main)"""
     card_hash = hash_nfc_card(card_uid)
     
     item = {
@@ -121,13 +128,23 @@ def create_nfc_card(card_uid, user_id=None, balance=0):
         item['userId'] = user_id
         item['activatedAt'] = datetime.now().isoformat()
 
-    try:
-        table.put_item(Item=item)
-        print(f"   💳 Carte NFC créée: {card_uid} (Hash: {card_hash[:8]}...) - Liée: {'OUI' if user_id else 'NON'}")
-        return card_hash
-    except Exception as e:
-        print(f"   ❌ Erreur création carte NFC: {e}")
+    print(f"   💳 Carte NFC: {card_uid} (Hash: {card_hash[:8]}...) - Liée: {'OUI' if user_id else 'NON'}")
+    return item
+
+def seed_account(account):
+    """Compte Cognito + carte NFC éventuelle + profil DynamoDB d'un compte de test"""
+    email, password, first, last, phone, role, p_type, balance, with_card = account
+    uid = create_cognito_user(email, password, first, last, phone, role, USER_POOL_ID)
+    if not uid:
         return None
+    
+    card = None
+    if with_card:
+        # Une carte NFC pour chaque passager test
+        card = build_nfc_card(f"NFC-{random.randint(10000,99999)}", user_id=uid, balance=0) # Balance is on user wallet mainly
+    
+    update_dynamo_profile(uid, role, passenger_type=p_type, balance=balance, nfc_hash=card['cardId'] if card else None)
+    return card
 
 def main():
     print("🚀 Démarrage du Seeding Complet LimaJS...\n")
@@ -137,48 +154,33 @@ def main():
     USER_POOL_ID = get_user_pool_id()
     print(f"🎯 User Pool détecté: {USER_POOL_ID}")
     
-    # --- 1. ADMIN ---
-    print("\n--- Création Admin ---")
-    admin_id = create_cognito_user(
-        'admin@limajsmotors.com', 'Admin123!', 'Super', 'Admin', '+50900000000', 'admin', USER_POOL_ID
-    )
-    if admin_id:
-        update_dynamo_profile(admin_id, 'admin', passenger_type='staff', balance=0)
-
-    # --- 2. CHAUFFEUR ---
-    print("\n--- Création Chauffeur ---")
-    driver_id = create_cognito_user(
-        'driver@limajsmotors.com', 'Driver123!', 'Jean', 'Chauffeur', '+50911111111', 'driver', USER_POOL_ID
-    )
-    if driver_id:
-        update_dynamo_profile(driver_id, 'driver', passenger_type='staff', balance=0)
-        # Assigner un bus (optionnel)
-        
-    # --- 3. PASSAGERS (Types Variés) ---
-    passengers_config = [
+    # (email, mot de passe, prénom, nom, téléphone, rôle, type passager, solde, carte NFC)
+    accounts = [
+        ('admin@limajsmotors.com', 'Admin123!', 'Super', 'Admin', '+50900000000', 'admin', 'staff', 0, False),
+        ('driver@limajsmotors.com', 'Driver123!', 'Jean', 'Chauffeur', '+50911111111', 'driver', 'staff', 0, False),
+    ]
+    # Passagers (types variés)
+    for email, first, last, p_type, balance in [
         ('student1@gmail.com', 'Paul', 'Etudiant', 'student', 500),
         ('student2@gmail.com', 'Marie', 'Etul', 'student', 150),
         ('employee1@gmail.com', 'Pierre', 'Employé', 'employee', 2500),
         ('parent1@gmail.com', 'Sophie', 'Maman', 'parent', 1000),
         ('free1@gmail.com', 'Michel', 'Libre', 'free', 0)
-    ]
+    ]:
+        accounts.append((email, 'Pass123!', first, last, '+50922222222', 'passenger', p_type, balance, True))
+
+    # --- 1. COMPTES (admin, chauffeur, passagers) en parallèle ---
+    # Peu de workers: les API d'administration Cognito ont un quota bas
+    print("\n--- Création des comptes ---")
+    with ThreadPoolExecutor(max_workers=COGNITO_WORKERS) as pool:
+        cards = [card for card in pool.map(seed_account, accounts) if card]
 
-    print("\n--- Création Passagers ---")
-    for email, first, last, p_type, balance in passengers_config:
-        uid = create_cognito_user(email, 'Pass123!', first, last, '+50922222222', 'passenger', USER_POOL_ID)
-        
-        if uid:
-            # Créer une carte NFC pour chaque passager test
-            raw_nfc = f"NFC-{random.randint(10000,99999)}"
-            card_hash = create_nfc_card(raw_nfc, user_id=uid, balance=0) # Balance is on user wallet mainly
-            
-            update_dynamo_profile(uid, 'passenger', passenger_type=p_type, balance=balance, nfc_hash=card_hash)
-
-    # --- 4. CARTES NFC VIERGES (Stock) ---
+    # --- 2. CARTES NFC VIERGES (Stock) ---
     print("\n--- Création Cartes NFC Vierges (Stock) ---")
     for i in range(5):
-        raw_nfc = f"STOCK-{random.randint(10000,99999)}"
-        create_nfc_card(raw_nfc, user_id=None, balance=0)
+        cards.append(build_nfc_card(f"STOCK-{random.randint(10000,99999)}", user_id=None, balance=0))
+
+    write_tables({'limajs-nfc-cards': cards})
 
     print("\n✅ Seeding terminé avec succès !")
 
@@ -70,6 +70,22 @@ def enable_ttl(table_name, attribute_name):
         else:
             print(f"   ❌ Erreur TTL: {e}")
 
+def enable_stream(table_name, view_type='NEW_AND_OLD_IMAGES'):
+    """Active le stream d'une table existante (create_table ne touche pas aux tables déjà créées)."""
+    print(f"   🌊 Vérification du stream de {table_name}...")
+    try:
+        spec = dynamodb.describe_table(TableName=table_name)['Table'].get('StreamSpecification', {})
+        if spec.get('StreamEnabled'):
+            print(f"   ✅ Stream déjà actif ({spec.get('StreamViewType')}).")
+            return
+        dynamodb.update_table(
+            TableName=table_name,
+            StreamSpecification={'StreamEnabled': True, 'StreamViewType': view_type}
+        )
+        print("   ✅ Stream activé.")
+    except ClientError as e:
+        print(f"   ❌ Erreur stream: {e}")
+
 def update_env_files(tables):
     print("\n📝 Mise à jour des fichiers d'environnement...")
     
@@ -139,9 +155,13 @@ def main():
             }
         ],
         'BillingMode': 'PROVISIONED',
-        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+        # Stream -> lambda/admin/directory.py (annuaire admin des utilisateurs)
+        'StreamSpecification': {'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
     }
-    if create_table(users_def): tables_created.append('limajs-users')
+    if create_table(users_def):
+        enable_stream('limajs-users')
+        tables_created.append('limajs-users')
 
     # 2. BUSES
     buses_def = {
@@ -371,9 +391,31 @@ def main():
             }
         ],
         'BillingMode': 'PROVISIONED',
-        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+        # Stream -> lambda/nfc/stream.py (journal des changements pour l'index de validation)
+        'StreamSpecification': {'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
+    }
+    if create_table(nfc_def):
+        enable_stream('limajs-nfc-cards')
+        enable_ttl('limajs-nfc-cards', 'ttl')  # Anciennes entrées CHANGELOG, avant limajs-nfc-changelog
+        tables_created.append('limajs-nfc-cards')
+
+    # 8b. NFC CHANGELOG (journal des changements de statut, hors des GSI des cartes)
+    nfc_changelog_def = {
+        'TableName': 'limajs-nfc-changelog',
+        'KeySchema': [
+            {'AttributeName': 'partition', 'KeyType': 'HASH'},
+            {'AttributeName': 'changeId', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'partition', 'AttributeType': 'S'},
+            {'AttributeName': 'changeId', 'AttributeType': 'S'}
+        ],
+        'BillingMode': 'PAY_PER_REQUEST'
     }
-    if create_table(nfc_def): tables_created.append('limajs-nfc-cards')
+    if create_table(nfc_changelog_def):
+        enable_ttl('limajs-nfc-changelog', 'ttl')
+        tables_created.append('limajs-nfc-changelog')
 
     # 9. TRIPS
     trips_def = {
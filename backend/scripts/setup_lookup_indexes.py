@@ -0,0 +1,125 @@
+"""
+Crée les GSI KEYS_ONLY utilisés par les recherches secondaires de shared/db
+(declare_lookup), pour que les recherches par identifiant ne passent plus
+par des Scan.
+
+Crée aussi push-token-index (profils ayant un token FCM, répartis par
+pushShard) utilisé par les broadcasts de notifications/push, et renseigne
+pushShard sur les profils existants.
+
+Usage:
+    python setup_lookup_indexes.py
+"""
+
+import boto3
+import sys
+import zlib
+
+# Configure stdout for Windows
+sys.stdout.reconfigure(encoding='utf-8')
+
+dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+
+# (table, index, attribut indexé)
+LOOKUP_INDEXES = [
+    ('limajs-nfc-cards', 'card-id-index', 'cardId'),
+    ('limajs-subscriptions', 'payment-index', 'paymentId'),
+    ('limajs-payments', 'payment-id-index', 'paymentId'),  # paiements et recharges wallet (userId, paymentId)
+]
+
+
+def create_lookup_index(table_name, index_name, attribute):
+    print(f"Checking GSI '{index_name}' on {table_name}...")
+    try:
+        response = dynamodb.describe_table(TableName=table_name)
+        table = response['Table']
+        gsi_names = [g['IndexName'] for g in table.get('GlobalSecondaryIndexes', [])]
+
+        if index_name in gsi_names:
+            print(f"GSI '{index_name}' already exists.")
+            return
+
+        index = {
+            'IndexName': index_name,
+            'KeySchema': [{'AttributeName': attribute, 'KeyType': 'HASH'}],
+            # Seules les clés sont nécessaires pour résoudre la clé primaire
+            'Projection': {'ProjectionType': 'KEYS_ONLY'}
+        }
+        if table.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+            index['ProvisionedThroughput'] = {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 2}
+
+        print(f"Creating GSI '{index_name}'...")
+        dynamodb.update_table(
+            TableName=table_name,
+            AttributeDefinitions=[{'AttributeName': attribute, 'AttributeType': 'S'}],
+            GlobalSecondaryIndexUpdates=[{'Create': index}]
+        )
+        print(f"GSI creation initiated for {table_name}. This may take a few minutes.")
+
+    except Exception as e:
+        print(f"Error creating GSI '{index_name}' on {table_name}: {e}")
+
+
+PUSH_TOKEN_SHARDS = 16  # = PUSH_TOKEN_SHARDS de notifications/push
+
+
+def create_push_token_index():
+    """GSI creux pushShard -> userId, avec les attributs lus par le broadcast."""
+    print("Checking GSI 'push-token-index' on limajs-users...")
+    try:
+        table = dynamodb.describe_table(TableName='limajs-users')['Table']
+        if 'push-token-index' in [g['IndexName'] for g in table.get('GlobalSecondaryIndexes', [])]:
+            print("GSI 'push-token-index' already exists.")
+            return
+
+        index = {
+            'IndexName': 'push-token-index',
+            'KeySchema': [
+                {'AttributeName': 'pushShard', 'KeyType': 'HASH'},
+                {'AttributeName': 'userId', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['fcmToken', 'role']}
+        }
+        if table.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+            index['ProvisionedThroughput'] = {'ReadCapacityUnits': 10, 'WriteCapacityUnits': 5}
+
+        dynamodb.update_table(
+            TableName='limajs-users',
+            AttributeDefinitions=[
+                {'AttributeName': 'pushShard', 'AttributeType': 'S'},
+                {'AttributeName': 'userId', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexUpdates=[{'Create': index}]
+        )
+        print("GSI creation initiated for limajs-users. This may take a few minutes.")
+    except Exception as e:
+        print(f"Error creating GSI 'push-token-index': {e}")
+
+
+def backfill_push_shards():
+    """Renseigne pushShard sur les profils ayant déjà un token."""
+    paginator = dynamodb.get_paginator('scan')
+    updated = 0
+    for page in paginator.paginate(
+        TableName='limajs-users',
+        FilterExpression='attribute_exists(fcmToken) AND attribute_not_exists(pushShard)',
+        ProjectionExpression='userId, #type',
+        ExpressionAttributeNames={'#type': 'type'}
+    ):
+        for item in page['Items']:
+            user_id = item['userId']['S']
+            dynamodb.update_item(
+                TableName='limajs-users',
+                Key={'userId': item['userId'], 'type': item['type']},
+                UpdateExpression='SET pushShard = :shard',
+                ExpressionAttributeValues={':shard': {'S': f"PUSH#{zlib.crc32(user_id.encode()) % PUSH_TOKEN_SHARDS:02d}"}}
+            )
+            updated += 1
+    print(f"pushShard set on {updated} existing profiles.")
+
+
+if __name__ == "__main__":
+    for table_name, index_name, attribute in LOOKUP_INDEXES:
+        create_lookup_index(table_name, index_name, attribute)
+    create_push_token_index()
+    backfill_push_shards()
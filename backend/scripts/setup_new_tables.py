@@ -47,6 +47,21 @@ def create_table(table_def):
         return False
 
 
+def enable_ttl(table_name, attribute='ttl'):
+    """Active l'expiration automatique (marqueurs d'idempotence du wallet)."""
+    try:
+        dynamodb.update_time_to_live(
+            TableName=table_name,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': attribute}
+        )
+        print(f"   ⏱️ TTL activé sur {table_name}.{attribute}")
+    except ClientError as e:
+        if 'already enabled' in str(e):
+            print(f"   ✅ TTL déjà actif sur {table_name}")
+        else:
+            print(f"   ❌ Erreur TTL : {e}")
+
+
 def main():
     print("🚀 Création des nouvelles tables DynamoDB\n")
     
@@ -115,6 +130,7 @@ def main():
         'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
     }
     create_table(wallet_tx_def)
+    enable_ttl('limajs-wallet-transactions')
     
     # 3. PASSENGER TRIPS (for trip history)
     passenger_trips_def = {
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Met en place la synchronisation de l'annuaire admin (shared.user_directory).
+
+1. Active le stream NEW_AND_OLD_IMAGES de limajs-users et affiche son ARN
+   (à fournir au déploiement CDK : USERS_TABLE_STREAM_ARN ; le workflow de
+   déploiement le lit lui-même sur la table)
+2. Avec --trigger-arn : attache la Lambda userDirectoryCognito comme trigger
+   post-confirmation du User Pool importé. UpdateUserPool remet à zéro les
+   paramètres non fournis : la configuration actuelle du pool est donc
+   relue et renvoyée telle quelle, seul LambdaConfig.PostConfirmation change.
+
+Ensuite, remplir l'annuaire une première fois avec sync_user_directory.py.
+Tant qu'il est vide, GET /admin/users lit Cognito directement.
+
+Usage:
+    python setup_user_directory.py
+    python setup_user_directory.py --user-pool-id us-east-1_XXXX --trigger-arn arn:aws:lambda:...
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import boto3
+
+# Configure stdout for Windows
+sys.stdout.reconfigure(encoding='utf-8')
+
+REGION = 'us-east-1'
+TABLE_USERS = 'limajs-users'
+
+# Champs de DescribeUserPool acceptés par UpdateUserPool
+USER_POOL_SETTINGS = (
+    'Policies', 'DeletionProtection', 'LambdaConfig', 'AutoVerifiedAttributes',
+    'SmsVerificationMessage', 'EmailVerificationMessage', 'EmailVerificationSubject',
+    'VerificationMessageTemplate', 'SmsAuthenticationMessage', 'UserAttributeUpdateSettings',
+    'MfaConfiguration', 'DeviceConfiguration', 'EmailConfiguration', 'SmsConfiguration',
+    'UserPoolTags', 'AdminCreateUserConfig', 'UserPoolAddOns', 'AccountRecoverySetting'
+)
+
+
+def enable_users_stream():
+    """Active le stream de limajs-users si besoin ; retourne son ARN."""
+    dynamodb = boto3.client('dynamodb', region_name=REGION)
+    table = dynamodb.describe_table(TableName=TABLE_USERS)['Table']
+    spec = table.get('StreamSpecification', {})
+
+    if spec.get('StreamEnabled'):
+        if spec.get('StreamViewType') != 'NEW_AND_OLD_IMAGES':
+            print(f"⚠️ Stream {spec.get('StreamViewType')} déjà actif : l'annuaire a besoin de NEW_AND_OLD_IMAGES")
+        else:
+            print(f"Stream already enabled on {TABLE_USERS}.")
+        return table['LatestStreamArn']
+
+    print(f"Enabling stream on {TABLE_USERS}...")
+    dynamodb.update_table(
+        TableName=TABLE_USERS,
+        StreamSpecification={'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
+    )
+    dynamodb.get_waiter('table_exists').wait(TableName=TABLE_USERS)
+    for _ in range(30):
+        table = dynamodb.describe_table(TableName=TABLE_USERS)['Table']
+        if table.get('LatestStreamArn'):
+            return table['LatestStreamArn']
+        time.sleep(2)
+    raise RuntimeError(f"Stream ARN of {TABLE_USERS} not available")
+
+
+def attach_post_confirmation(user_pool_id, trigger_arn):
+    """Attache trigger_arn en post-confirmation sans toucher au reste du pool."""
+    cognito = boto3.client('cognito-idp', region_name=REGION)
+    pool = cognito.describe_user_pool(UserPoolId=user_pool_id)['UserPool']
+
+    lambda_config = pool.get('LambdaConfig', {})
+    if lambda_config.get('PostConfirmation') == trigger_arn:
+        print("Post-confirmation trigger already attached.")
+        return
+    if lambda_config.get('PostConfirmation'):
+        print(f"⚠️ Remplacement du trigger post-confirmation {lambda_config['PostConfirmation']}")
+
+    settings = {key: pool[key] for key in USER_POOL_SETTINGS if key in pool}
+    settings['LambdaConfig'] = {**lambda_config, 'PostConfirmation': trigger_arn}
+    # Lecture seule dans DescribeUserPool, refusé par UpdateUserPool
+    settings.get('AdminCreateUserConfig', {}).pop('UnusedAccountValidityDays', None)
+    cognito.update_user_pool(UserPoolId=user_pool_id, **settings)
+    print(f"✅ Trigger post-confirmation attaché à {user_pool_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-pool-id', default=os.environ.get('COGNITO_USER_POOL_ID'))
+    parser.add_argument('--trigger-arn', help="ARN de la Lambda userDirectoryCognito (sortie UserDirectoryTriggerArn)")
+    args = parser.parse_args()
+
+    stream_arn = enable_users_stream()
+    print(f"✅ USERS_TABLE_STREAM_ARN={stream_arn}")
+
+    if args.trigger_arn:
+        if not args.user_pool_id:
+            parser.error("--user-pool-id (ou COGNITO_USER_POOL_ID) requis avec --trigger-arn")
+        attach_post_confirmation(args.user_pool_id, args.trigger_arn)
+
+
+if __name__ == '__main__':
+    main()
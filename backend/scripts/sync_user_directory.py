@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Reconstruit l'annuaire admin des utilisateurs (shared.user_directory).
+
+Parcourt tous les comptes Cognito (ListUsers page par page, en suivant
+PaginationToken, relances adaptatives sur limitation de débit), complète
+chaque compte avec son profil limajs-users (BatchGetItem), puis écrit les
+entrées d'annuaire. Les entrées qui ne correspondent plus à aucun compte
+sont ensuite supprimées.
+
+À lancer une fois à la mise en place, puis seulement en cas de doute : le
+stream de limajs-users et le trigger Cognito tiennent l'annuaire à jour.
+
+Usage:
+    python sync_user_directory.py --user-pool-id us-east-1_XXXX
+    python sync_user_directory.py --dry-run
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import boto3
+from botocore.config import Config
+from boto3.dynamodb.conditions import Key
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.db import batch_get_items, get_table
+from shared.user_directory import (
+    DIRECTORY_PREFIX, LIST_FIELD, SEARCH_FIELDS, TABLE_USERS,
+    apply_changes, directory_entries, from_cognito
+)
+
+# Configure stdout for Windows
+sys.stdout.reconfigure(encoding='utf-8')
+
+REGION = 'us-east-1'
+ROLES = ('PASSENGER', 'DRIVER', 'ADMIN')
+
+
+def iter_cognito_pages(user_pool_id):
+    """Pages de 60 comptes Cognito (limite de ListUsers)."""
+    cognito = boto3.client('cognito-idp', region_name=REGION,
+                           config=Config(retries={'max_attempts': 10, 'mode': 'adaptive'}))
+    for page in cognito.get_paginator('list_users').paginate(UserPoolId=user_pool_id, PaginationParameters={'PageSize': 60}):
+        yield page.get('Users', [])
+
+
+def merge_profiles(cognito_users):
+    """Comptes Cognito complétés par leur profil (le profil fait foi)."""
+    accounts = [from_cognito(user) for user in cognito_users]
+    accounts = [account for account in accounts if account.get('userId')]
+    keys = [{'userId': account['userId'], 'type': 'PROFILE'} for account in accounts]
+    profiles = {item['userId']: item for item in batch_get_items(TABLE_USERS, keys)} if keys else {}
+    merged = []
+    for account in accounts:
+        profile = profiles.get(account['userId'], {})
+        merged.append({**account, **{k: v for k, v in profile.items() if v not in (None, '')}})
+    return merged
+
+
+def remove_stale(expected, partitions, dry_run):
+    """Supprime les entrées absentes de `expected` ; retourne leur nombre."""
+    table = get_table(TABLE_USERS)
+    stale = []
+    for partition in partitions:
+        kwargs = {'KeyConditionExpression': Key('userId').eq(partition), 'ProjectionExpression': 'userId, #type',
+                  'ExpressionAttributeNames': {'#type': 'type'}}
+        while True:
+            response = table.query(**kwargs)
+            stale += [(item['userId'], item['type']) for item in response['Items']
+                      if (item['userId'], item['type']) not in expected]
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    if stale and not dry_run:
+        apply_changes([({key: None for key in stale}, {})])
+    return len(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-pool-id', default=os.environ.get('COGNITO_USER_POOL_ID'))
+    parser.add_argument('--dry-run', action='store_true', help="compte les entrées sans rien écrire")
+    args = parser.parse_args()
+    if not args.user_pool_id:
+        parser.error("--user-pool-id (ou COGNITO_USER_POOL_ID) requis")
+
+    start = time.time()
+    expected = set()
+    roles = set(ROLES)
+    users = writes = 0
+
+    for cognito_users in iter_cognito_pages(args.user_pool_id):
+        changes = []
+        for profile in merge_profiles(cognito_users):
+            entries = directory_entries(profile)
+            expected.update(entries)
+            roles.add(profile.get('role') or 'PASSENGER')
+            changes.append(({}, entries))
+        users += len(changes)
+        writes += sum(len(new) for _, new in changes)
+        if not args.dry_run:
+            apply_changes(changes)
+        print(f"   {users} comptes...", end='\r')
+
+    partitions = [f"{DIRECTORY_PREFIX}{field}" for field in (LIST_FIELD,) + SEARCH_FIELDS]
+    partitions += [f"{DIRECTORY_PREFIX}role#{role}" for role in sorted(roles)]
+    removed = remove_stale(expected, partitions, args.dry_run)
+
+    action = "à écrire" if args.dry_run else "écrites"
+    print(f"\n✅ {users} comptes, {writes} entrées {action}, {removed} entrées obsolètes"
+          f"{' à supprimer' if args.dry_run else ' supprimées'} ({time.time() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Caches en mémoire partagés par les handlers (durée de vie du conteneur Lambda).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Cache LRU borné en octets, avec expiration par entrée.
+
+    Chaque entrée porte sa taille (len de la valeur si bytes/str, sinon
+    fournie par l'appelant) et un timestamp d'expiration optionnel.
+    Les entrées les moins récemment utilisées sont évincées dès que la
+    taille totale dépasse `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, max_items=None):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Retourne la valeur si présente et non expirée."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None, size=None):
+        """Insère une valeur. Les valeurs plus grandes que le cache sont ignorées."""
+        if size is None:
+            size = len(value) if isinstance(value, (bytes, bytearray, str)) else 1
+
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (value, size, expires_at)
+            self._size += size
+            self._evict()
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def _evict(self):
+        while self._entries and (
+            self._size > self.max_bytes
+            or (self.max_items is not None and len(self._entries) > self.max_items)
+        ):
+            key = next(iter(self._entries))
+            self._remove(key)
@@ -0,0 +1,71 @@
+"""
+Registre paresseux des clients AWS.
+
+Les clients boto3 sont créés au premier usage (et non à l'import du module),
+puis réutilisés pendant toute la vie du conteneur Lambda. Un handler qui ne
+touche jamais S3 ne paie donc jamais la création du client S3 au cold start.
+"""
+
+import os
+import threading
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _create(kind, service, kwargs):
+    import boto3
+    kwargs.setdefault('region_name', REGION)
+    factory = boto3.resource if kind == 'resource' else boto3.client
+    return factory(service, **kwargs)
+
+
+def _get(kind, service, kwargs):
+    key = (kind, service, tuple(sorted(kwargs.items())))
+    instance = _clients.get(key)
+    if instance is None:
+        with _lock:
+            instance = _clients.get(key)
+            if instance is None:
+                instance = _create(kind, service, dict(kwargs))
+                _clients[key] = instance
+    return instance
+
+
+def get_client(service, **kwargs):
+    """Client boto3 partagé (ex: get_client('s3'))."""
+    return _get('client', service, kwargs)
+
+
+def get_resource(service, **kwargs):
+    """Resource boto3 partagée (ex: get_resource('dynamodb'))."""
+    return _get('resource', service, kwargs)
+
+
+def register_client(service, instance, kind='client', **kwargs):
+    """Impose l'instance servie pour `service` (stand-in local des benchmarks)."""
+    with _lock:
+        _clients[(kind, service, tuple(sorted(kwargs.items())))] = instance
+
+
+def reset_clients():
+    """Oublie les clients créés (tests, changement de credentials)."""
+    with _lock:
+        _clients.clear()
+
+
+class LazyClient:
+    """
+    Proxy vers un client créé au premier appel de méthode.
+    Permet de garder `s3 = LazyClient('s3')` au niveau module sans coût à l'import.
+    """
+
+    def __init__(self, service, **kwargs):
+        self._service = service
+        self._kwargs = kwargs
+
+    def __getattr__(self, name):
+        return getattr(get_client(self._service, **self._kwargs), name)
+
@@ -1,25 +1,44 @@
-import boto3
 import os
+import time
 from decimal import Decimal
 from boto3.dynamodb.conditions import Key, Attr
 
-# Client DynamoDB
-dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+from shared.cache import LRUCache
+from shared.clients import get_resource
+from shared import metrics
+
+def get_dynamodb():
+    """Resource DynamoDB, créée au premier usage (pas au cold start)."""
+    return get_resource('dynamodb')
+
+def __getattr__(name):
+    # Compatibilité: `from shared.db import dynamodb`
+    if name == 'dynamodb':
+        return get_dynamodb()
+    raise AttributeError(name)
 
 def get_table(table_name):
     """Récupère une table DynamoDB."""
-    return dynamodb.Table(table_name)
+    return get_dynamodb().Table(table_name)
+
+def _call(table_name, operation, method, **kwargs):
+    """Appel DynamoDB mesuré (latence + unités consommées, voir shared/metrics)."""
+    kwargs['ReturnConsumedCapacity'] = 'TOTAL'
+    with metrics.timer(f"dynamodb.{operation}"):
+        response = method(**kwargs)
+    metrics.record_capacity(table_name, response.get('ConsumedCapacity'))
+    return response
 
 def put_item(table_name, item):
     """Insère ou met à jour un item."""
     table = get_table(table_name)
-    table.put_item(Item=item)
+    _call(table_name, 'PutItem', table.put_item, Item=item)
     return item
 
 def get_item(table_name, key):
     """Récupère un item par sa clé primaire."""
     table = get_table(table_name)
-    response = table.get_item(Key=key)
+    response = _call(table_name, 'GetItem', table.get_item, Key=key)
     return response.get('Item')
 
 def query_items(table_name, key_condition, filter_expression=None, index_name=None):
@@ -36,7 +55,7 @@ def query_items(table_name, key_condition, filter_expression=None, index_name=No
     if index_name:
         kwargs['IndexName'] = index_name
     
-    response = table.query(**kwargs)
+    response = _call(table_name, 'Query', table.query, **kwargs)
     return response.get('Items', [])
 
 def scan_items(table_name, filter_expression=None, limit=10):
@@ -50,13 +69,30 @@ def scan_items(table_name, filter_expression=None, limit=10):
     if filter_expression:
         kwargs['FilterExpression'] = filter_expression
     
-    response = table.scan(**kwargs)
+    response = _call(table_name, 'Scan', table.scan, **kwargs)
     return response.get('Items', [])
 
+def batch_get_items(table_name, keys, projection=None):
+    """BatchGetItem par lots de 100 clés, avec reprise des clés non traitées."""
+    items = []
+    for start in range(0, len(keys), 100):
+        request = {table_name: {'Keys': keys[start:start + 100]}}
+        if projection:
+            request[table_name]['ProjectionExpression'] = projection
+        attempt = 0
+        while request:
+            response = _call(table_name, 'BatchGetItem', get_dynamodb().batch_get_item, RequestItems=request)
+            items.extend(response.get('Responses', {}).get(table_name, []))
+            request = response.get('UnprocessedKeys') or None
+            if request:
+                attempt += 1
+                time.sleep(min(0.05 * (2 ** attempt), 1))
+    return items
+
 def delete_item(table_name, key):
     """Supprime un item."""
     table = get_table(table_name)
-    table.delete_item(Key=key)
+    _call(table_name, 'DeleteItem', table.delete_item, Key=key)
     return True
 
 def update_item(table_name, key, update_expression, expression_values, expression_names=None):
@@ -73,9 +109,87 @@ def update_item(table_name, key, update_expression, expression_values, expressio
     if expression_names:
         kwargs['ExpressionAttributeNames'] = expression_names
     
-    response = table.update_item(**kwargs)
+    response = _call(table_name, 'UpdateItem', table.update_item, **kwargs)
     return response.get('Attributes')
 
+# =============================================================================
+# RECHERCHES SECONDAIRES (attribut -> clé primaire complète via GSI)
+# =============================================================================
+
+_LOOKUPS = {}
+_lookup_cache = LRUCache(max_bytes=4096, max_items=4096)
+
+def declare_lookup(name, table_name, attribute, key_attributes, index_name=None):
+    """
+    Déclare un motif d'accès par attribut secondaire.
+    
+    - attribute: attribut recherché (ex: 'cardId')
+    - key_attributes: attributs de la clé primaire de la table (ex: ['userId', 'cardId'])
+    - index_name: GSI (idéalement KEYS_ONLY) indexé sur `attribute`;
+      None si `attribute` est déjà la clé de partition de la table.
+    """
+    _LOOKUPS[name] = {
+        'table': table_name,
+        'attribute': attribute,
+        'key_attributes': key_attributes,
+        'index': index_name
+    }
+
+def resolve_key(name, value):
+    """
+    Résout la clé primaire d'un item par un attribut secondaire (Query, jamais Scan).
+    Les résolutions positives sont mémorisées: ces clés ne changent pas.
+    """
+    cached = _lookup_cache.get((name, value))
+    if cached is not None:
+        return dict(cached)
+    
+    lookup = _LOOKUPS[name]
+    kwargs = {
+        'KeyConditionExpression': Key(lookup['attribute']).eq(value),
+        'Limit': 1
+    }
+    if lookup['index']:
+        kwargs['IndexName'] = lookup['index']
+    
+    response = _call(lookup['table'], 'Query', get_table(lookup['table']).query, **kwargs)
+    items = response.get('Items', [])
+    if not items:
+        return None
+    
+    key = {attr: items[0][attr] for attr in lookup['key_attributes']}
+    _lookup_cache.set((name, value), key)
+    return dict(key)
+
+def get_item_by(name, value):
+    """Récupère un item complet par un attribut secondaire déclaré."""
+    key = resolve_key(name, value)
+    if not key:
+        return None
+    
+    item = get_item(_LOOKUPS[name]['table'], key)
+    if item is None:
+        # Item supprimé depuis la mise en cache
+        forget_key(name, value)
+    return item
+
+def forget_key(name, value):
+    _lookup_cache.delete((name, value))
+
+declare_lookup(
+    'nfc-card', os.environ.get('TABLE_NFC', 'limajs-nfc-cards'),
+    'cardId', ['userId', 'cardId'], index_name='card-id-index'
+)
+# Paiements d'abonnement et recharges wallet (limajs-payments: userId, paymentId)
+declare_lookup(
+    'payment', os.environ.get('TABLE_PAYMENTS', 'limajs-payments'),
+    'paymentId', ['userId', 'paymentId'], index_name='payment-id-index'
+)
+declare_lookup(
+    'subscription-payment', os.environ.get('TABLE_SUBSCRIPTIONS', 'limajs-subscriptions'),
+    'paymentId', ['userId', 'subscriptionId'], index_name='payment-index'
+)
+
 # Converter pour DynamoDB (float -> Decimal)
 def convert_floats(obj):
     """Convertit les float en Decimal pour DynamoDB."""
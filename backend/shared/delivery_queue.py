@@ -0,0 +1,149 @@
+"""
+File de livraison des emails et notifications push.
+
+Les handlers déposent des jobs {kind, payload} au lieu d'appeler Resend ou
+FCM pendant la requête ; la Lambda lambda/notifications/worker.py les
+consomme par lots, en parallèle.
+
+- Production : SQS (DELIVERY_QUEUE_URL), dépôt par lots de 10
+- Tests / local : file en mémoire du process (DELIVERY_QUEUE_URL vide),
+  vidée par drain_local()
+
+Un job en échec est redéposé avec un délai exponentiel ; après
+DELIVERY_MAX_ATTEMPTS tentatives, ou sur PermanentDeliveryError, il part
+dans la file des lettres mortes (DELIVERY_DLQ_URL, ou `dead_letters` en local).
+"""
+
+import json
+import os
+import random
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from shared.clients import get_client
+from shared.metrics import increment
+
+DELIVERY_QUEUE_URL = os.environ.get('DELIVERY_QUEUE_URL', '')
+DELIVERY_DLQ_URL = os.environ.get('DELIVERY_DLQ_URL', '')
+DELIVERY_MAX_ATTEMPTS = int(os.environ.get('DELIVERY_MAX_ATTEMPTS', '5'))
+DELIVERY_CONCURRENCY = int(os.environ.get('DELIVERY_CONCURRENCY', '8'))
+DELIVERY_BACKOFF_BASE = 30  # s, doublé à chaque tentative
+DELIVERY_BACKOFF_MAX = 900  # délai maximal accepté par SQS
+SQS_BATCH_MAX = 10
+
+# Fonctions de livraison par type de job (voir job_handler)
+_handlers = {}
+
+# Backend local
+local_queue = deque()
+dead_letters = []
+
+
+class PermanentDeliveryError(Exception):
+    """Échec définitif : le job part directement en lettre morte."""
+
+
+def job_handler(kind):
+    """
+    Déclare la fonction qui livre les jobs `kind`. Elle reçoit le payload et
+    l'identifiant du job, conservé d'une tentative à l'autre (clé d'idempotence).
+    """
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload, delay=0):
+    """Dépose un job ; retourne son identifiant."""
+    return enqueue_many([(kind, payload)], delay)[0]
+
+
+def enqueue_many(jobs, delay=0):
+    """Dépose des jobs [(kind, payload)] ; retourne leurs identifiants."""
+    messages = [
+        {'id': str(uuid.uuid4()), 'kind': kind, 'payload': payload, 'attempt': 0,
+         'enqueuedAt': datetime.utcnow().isoformat()}
+        for kind, payload in jobs
+    ]
+    _send(DELIVERY_QUEUE_URL, messages, delay, local_queue)
+    increment('DeliveryEnqueued', len(messages))
+    return [message['id'] for message in messages]
+
+
+def _send(queue_url, messages, delay, local):
+    if not queue_url:
+        # Délais ignorés en local: drain_local() traite tout immédiatement
+        local.extend(messages)
+        return
+
+    sqs = get_client('sqs')
+    for i in range(0, len(messages), SQS_BATCH_MAX):
+        batch = messages[i:i + SQS_BATCH_MAX]
+        response = sqs.send_message_batch(
+            QueueUrl=queue_url,
+            Entries=[
+                {'Id': str(n), 'MessageBody': json.dumps(message, default=str),
+                 'DelaySeconds': min(int(delay), DELIVERY_BACKOFF_MAX)}
+                for n, message in enumerate(batch)
+            ]
+        )
+        if response.get('Failed'):
+            raise RuntimeError(f"SQS rejected {len(response['Failed'])} message(s): {response['Failed'][0]}")
+
+
+def backoff(attempt):
+    """Délai avant la tentative `attempt + 1` (exponentiel, avec gigue)."""
+    return int(min(DELIVERY_BACKOFF_MAX, DELIVERY_BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1))
+
+
+def _deliver(message):
+    """Livre un message ; retourne 'done', 'retry', 'dead' ou 'unacked'."""
+    try:
+        handler = _handlers.get(message.get('kind'))
+        if handler is None:
+            raise PermanentDeliveryError(f"Unknown job kind: {message.get('kind')}")
+        handler(message['payload'], message.get('id'))
+        return 'done'
+    except Exception as e:
+        failed = dict(message, attempt=message.get('attempt', 0) + 1, lastError=str(e)[:500])
+        permanent = isinstance(e, PermanentDeliveryError) or failed['attempt'] >= DELIVERY_MAX_ATTEMPTS
+        print(f"⚠️ Job {message.get('kind')} {message.get('id')} (tentative {failed['attempt']}): {e}")
+        try:
+            if permanent:
+                _send(DELIVERY_DLQ_URL, [failed], 0, dead_letters)
+                return 'dead'
+            _send(DELIVERY_QUEUE_URL, [failed], backoff(failed['attempt']), local_queue)
+            return 'retry'
+        except Exception as requeue_error:
+            # Laissé à la file source: SQS le présentera à nouveau
+            print(f"❌ Requeue impossible pour {message.get('id')}: {requeue_error}")
+            return 'unacked'
+
+
+def process_batch(messages, concurrency=DELIVERY_CONCURRENCY):
+    """
+    Livre des messages en parallèle. Retourne les index des messages non
+    acquittés (à laisser dans la file source).
+    """
+    if not messages:
+        return []
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(messages))) as pool:
+        outcomes = list(pool.map(_deliver, messages))
+
+    increment('DeliveryDone', outcomes.count('done'))
+    increment('DeliveryRetried', outcomes.count('retry'))
+    increment('DeliveryDeadLettered', outcomes.count('dead'))
+    return [i for i, outcome in enumerate(outcomes) if outcome == 'unacked']
+
+
+def drain_local(batch_size=SQS_BATCH_MAX):
+    """Vide la file locale par lots (tests, scripts) ; retourne le nombre de messages traités."""
+    processed = 0
+    while local_queue:
+        batch = [local_queue.popleft() for _ in range(min(batch_size, len(local_queue)))]
+        process_batch(batch)
+        processed += len(batch)
+    return processed
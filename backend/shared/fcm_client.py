@@ -0,0 +1,139 @@
+"""
+Client Firebase Cloud Messaging (API legacy HTTP).
+
+- Une session HTTP partagée par conteneur (connexions keep-alive réutilisées,
+  pool dimensionné sur FCM_CONCURRENCY, relances sur 5xx avec backoff)
+- Clé serveur lue une fois dans Secrets Manager (cache de shared.secrets)
+- Envoi multicast : jusqu'à FCM_MULTICAST_MAX tokens par requête
+  (`registration_ids`), plusieurs requêtes en parallèle
+
+Les tokens rejetés définitivement par FCM (NotRegistered, ...) sont renvoyés
+à l'appelant pour qu'il les retire des profils.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from shared.metrics import timer
+from shared.secrets import get_secret
+
+FCM_ENDPOINT = os.environ.get('FCM_ENDPOINT', 'https://fcm.googleapis.com/fcm/send')
+FCM_MULTICAST_MAX = 500
+FCM_CONCURRENCY = int(os.environ.get('FCM_CONCURRENCY', '8'))
+FCM_TIMEOUT = (3, 10)  # connexion, lecture (s)
+
+# Erreurs FCM signifiant que le token ne sera plus jamais valide
+INVALID_TOKEN_ERRORS = {'NotRegistered', 'InvalidRegistration', 'MismatchSenderId'}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Session requests partagée (créée au premier envoi)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(
+                    total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504],
+                    allowed_methods=['POST'], respect_retry_after_header=True
+                )
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=FCM_CONCURRENCY, max_retries=retry))
+                _session = session
+    return _session
+
+
+def get_server_key():
+    secret_name = os.environ.get('SECRET_NAME', 'limajs/backend/production')
+    secrets = get_secret(secret_name)
+    # Gestion cas string vs dict
+    return secrets.get('FCM_SERVER_KEY') if isinstance(secrets, dict) else secrets
+
+
+def send_multicast(tokens, title, body, data=None):
+    """
+    Envoie une notification à au plus FCM_MULTICAST_MAX tokens en une requête.
+    Retourne {'sent': n, 'failed': n, 'invalid': [tokens]}.
+    """
+    if len(tokens) > FCM_MULTICAST_MAX:
+        raise ValueError(f"At most {FCM_MULTICAST_MAX} tokens per multicast")
+
+    outcome = {'sent': 0, 'failed': 0, 'invalid': []}
+    if not tokens:
+        return outcome
+
+    fcm_key = get_server_key()
+    if not fcm_key:
+        print("⚠️ FCM_SERVER_KEY not configured")
+        outcome['failed'] = len(tokens)
+        return outcome
+
+    payload = {
+        'registration_ids': list(tokens),
+        'notification': {'title': title, 'body': body},
+        'data': data or {}
+    }
+
+    try:
+        with timer('http.fcm'):
+            response = get_session().post(
+                FCM_ENDPOINT,
+                headers={'Authorization': f'key={fcm_key}', 'Content-Type': 'application/json'},
+                json=payload,
+                timeout=FCM_TIMEOUT
+            )
+    except Exception as e:
+        print(f"Error sending push: {e}")
+        outcome['failed'] = len(tokens)
+        return outcome
+
+    if response.status_code != 200:
+        print(f"FCM Error: {response.status_code} - {response.text[:200]}")
+        outcome['failed'] = len(tokens)
+        return outcome
+
+    # Un résultat par token, dans l'ordre de registration_ids
+    for token, result in zip(tokens, response.json().get('results', [])):
+        if 'message_id' in result:
+            outcome['sent'] += 1
+        elif result.get('error') in INVALID_TOKEN_ERRORS:
+            outcome['invalid'].append(token)
+        else:
+            outcome['failed'] += 1
+    return outcome
+
+
+def send_to_tokens(tokens, title, body, data=None, concurrency=FCM_CONCURRENCY):
+    """Découpe `tokens` en lots multicast envoyés en parallèle ; agrège les résultats."""
+    tokens = list(tokens)
+    batches = [tokens[i:i + FCM_MULTICAST_MAX] for i in range(0, len(tokens), FCM_MULTICAST_MAX)]
+    total = {'sent': 0, 'failed': 0, 'invalid': []}
+    if not batches:
+        return total
+
+    if len(batches) == 1:
+        results = [send_multicast(batches[0], title, body, data)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+            results = list(pool.map(lambda batch: send_multicast(batch, title, body, data), batches))
+
+    for result in results:
+        total['sent'] += result['sent']
+        total['failed'] += result['failed']
+        total['invalid'] += result['invalid']
+    return total
+
+
+def send_push(token, title, body, data=None):
+    """Envoi à un seul appareil. Retourne 'sent', 'invalid' ou 'failed'."""
+    result = send_multicast([token], title, body, data)
+    if result['sent']:
+        return 'sent'
+    return 'invalid' if result['invalid'] else 'failed'
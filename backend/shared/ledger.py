@@ -0,0 +1,436 @@
+"""
+Grand livre du wallet.
+
+Chaque mouvement est appliqué dans une seule transaction DynamoDB
+(TransactWriteItems) :
+    - ADD atomique sur walletBalance du profil (condition de solde pour un débit)
+    - écriture de l'entrée dans limajs-wallet-transactions
+    - marqueur d'idempotence (une même clé ne peut être appliquée qu'une fois)
+
+Des snapshots de solde (transactionId = 'SNAPSHOT#<asOf>') sont pris toutes les
+SNAPSHOT_INTERVAL entrées : le solde à une date donnée se calcule à partir du
+snapshot le plus proche au lieu de relire tout l'historique.
+
+Les profils antérieurs au grand livre ont un walletBalance sans entrées
+correspondantes : un snapshot d'ouverture (SNAPSHOT#0000-01-01T00:00:00),
+égal au solde du profil moins la somme des entrées existantes, sert de point
+de départ au lieu de 0. Il est écrit par scripts/backfill_wallet_snapshots.py,
+ou à la première lecture d'un compte qui n'a encore aucun snapshot.
+"""
+
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+from shared.clients import get_client
+from shared.db import get_table
+
+TABLE_USERS = os.environ.get('TABLE_USERS', 'limajs-users')
+TABLE_WALLET_TX = os.environ.get('TABLE_WALLET_TX', 'limajs-wallet-transactions')
+SNAPSHOT_INTERVAL = int(os.environ.get('WALLET_SNAPSHOT_INTERVAL', 100))
+SNAPSHOT_LAG = 5  # secondes: laisse aux transactions en vol le temps d'être visibles
+IDEMPOTENCY_TTL = 7 * 86400
+MAX_CONFLICT_RETRIES = 3
+
+SNAPSHOT_PREFIX = 'SNAPSHOT#'
+OPENING_AS_OF = '0000-01-01T00:00:00'  # trié avant toute entrée et tout snapshot
+IDEMPOTENCY_PREFIX = 'IDEMPOTENCY#'
+
+serializer = TypeSerializer()
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def serialize_item(item):
+    return {key: serializer.serialize(value) for key, value in item.items()}
+
+
+def _profile_key(user_id):
+    return {'userId': user_id, 'type': 'PROFILE'}
+
+
+def new_transaction_id():
+    """Identifiant triable chronologiquement."""
+    return f"tx-{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
+
+
+def build_entry_actions(user_id, entry_type, amount, description, related_id=None, idempotency_key=None, created_at=None, transaction_id=None):
+    """
+    Actions TransactWriteItems d'une entrée (hors mise à jour du solde).
+    Retourne (entry, actions).
+    """
+    created_at = created_at or datetime.utcnow().isoformat()
+    entry = {
+        'transactionId': transaction_id or new_transaction_id(),
+        'userId': user_id,
+        'type': entry_type,  # credit or debit
+        'amount': amount,
+        'description': description,
+        'relatedId': related_id,
+        'createdAt': created_at
+    }
+    if idempotency_key:
+        entry['idempotencyKey'] = idempotency_key
+
+    actions = [{
+        'Put': {
+            'TableName': TABLE_WALLET_TX,
+            'Item': serialize_item(entry),
+            'ConditionExpression': 'attribute_not_exists(transactionId)'
+        }
+    }]
+
+    if idempotency_key:
+        actions.append({
+            'Put': {
+                'TableName': TABLE_WALLET_TX,
+                'Item': serialize_item({
+                    'userId': user_id,
+                    'transactionId': f"{IDEMPOTENCY_PREFIX}{idempotency_key}",
+                    'entryId': entry['transactionId'],
+                    'ttl': int(time.time()) + IDEMPOTENCY_TTL
+                }),
+                'ConditionExpression': 'attribute_not_exists(transactionId)'
+            }
+        })
+
+    return entry, actions
+
+
+def build_balance_action(user_id, delta, entries_count=1, required_balance=None):
+    """Mise à jour atomique du solde (ADD) avec condition de solde optionnelle."""
+    update = {
+        'TableName': TABLE_USERS,
+        'Key': serialize_item(_profile_key(user_id)),
+        'UpdateExpression': 'ADD walletBalance :delta, walletEntriesSinceSnapshot :count '
+                            'SET walletCurrency = if_not_exists(walletCurrency, :currency), lastWalletUpdate = :now',
+        'ExpressionAttributeValues': serialize_item({
+            ':delta': delta,
+            ':count': entries_count,
+            ':currency': 'HTG',
+            ':now': datetime.utcnow().isoformat()
+        })
+    }
+    if required_balance is not None:
+        update['ConditionExpression'] = 'walletBalance >= :required'
+        update['ExpressionAttributeValues'][':required'] = serializer.serialize(required_balance)
+    return {'Update': update}
+
+
+def transact(actions):
+    """TransactWriteItems avec nouvelles tentatives sur conflit de transaction."""
+    for attempt in range(MAX_CONFLICT_RETRIES + 1):
+        try:
+            # Client bas niveau: les actions sont déjà au format DynamoDB JSON
+            # (le client d'une resource les re-sérialiserait)
+            get_client('dynamodb').transact_write_items(TransactItems=actions)
+            return
+        except ClientError as e:
+            reasons = [r.get('Code') for r in e.response.get('CancellationReasons', [])]
+            if 'TransactionConflict' in reasons and attempt < MAX_CONFLICT_RETRIES:
+                time.sleep(0.05 * (2 ** attempt))
+                continue
+            raise
+
+
+def cancellation_reasons(exc):
+    return [r.get('Code') for r in exc.response.get('CancellationReasons', [])]
+
+
+def get_idempotent_entry(user_id, idempotency_key):
+    """Entrée déjà appliquée pour cette clé d'idempotence (ou None)."""
+    table = get_table(TABLE_WALLET_TX)
+    marker = table.get_item(Key={'userId': user_id, 'transactionId': f"{IDEMPOTENCY_PREFIX}{idempotency_key}"}).get('Item')
+    if not marker:
+        return None
+    return table.get_item(Key={'userId': user_id, 'transactionId': marker['entryId']}).get('Item')
+
+
+def post_entry(user_id, entry_type, amount, description, related_id=None, idempotency_key=None):
+    """
+    Applique un crédit ou un débit.
+    Retourne {'transactionId', 'newBalance', 'replayed'}.
+    Lève InsufficientFunds si le solde ne couvre pas un débit.
+    """
+    amount = Decimal(str(amount))
+    delta = amount if entry_type == 'credit' else -amount
+
+    entry, actions = build_entry_actions(user_id, entry_type, amount, description, related_id, idempotency_key)
+    actions.insert(0, build_balance_action(
+        user_id, delta,
+        required_balance=amount if entry_type == 'debit' else None
+    ))
+
+    try:
+        transact(actions)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        reasons = cancellation_reasons(e)
+        # Ordre des actions: [solde, entrée, marqueur d'idempotence]
+        if idempotency_key and len(reasons) > 2 and reasons[2] == 'ConditionalCheckFailed':
+            existing = get_idempotent_entry(user_id, idempotency_key)
+            return {
+                'transactionId': existing['transactionId'] if existing else None,
+                'newBalance': get_balance(user_id),
+                'replayed': True
+            }
+        if reasons and reasons[0] == 'ConditionalCheckFailed':
+            raise InsufficientFunds(f"Balance below {amount}")
+        raise
+
+    profile = get_table(TABLE_USERS).get_item(Key=_profile_key(user_id), ConsistentRead=True).get('Item', {})
+    maybe_snapshot(user_id, profile)
+
+    return {
+        'transactionId': entry['transactionId'],
+        'newBalance': Decimal(str(profile.get('walletBalance', 0))),
+        'replayed': False
+    }
+
+
+def post_batch(user_id, entries):
+    """
+    Applique plusieurs entrées d'un même utilisateur avec un seul ADD sur le solde
+    par transaction (jusqu'à 100 actions par TransactWriteItems).
+
+    Chaque entrée est un dict: type, amount, description, relatedId,
+    idempotencyKey, transactionId (optionnels) et `actions` - actions
+    TransactWriteItems supplémentaires qui doivent réussir avec l'entrée
+    (ex: passage d'un paiement à 'approved').
+
+    Une entrée dont une condition échoue est écartée et le reste du lot est
+    rejoué. Retourne une liste de résultats dans l'ordre des entrées:
+    {'status': 'applied'|'replayed'|'rejected'|'insufficient_funds', 'transactionId'}.
+    """
+    results = [None] * len(entries)
+    pending = list(range(len(entries)))
+
+    while pending:
+        # Découpage pour rester sous la limite de 100 actions par transaction
+        chunk, actions, owners, delta = [], [], [], Decimal('0')
+        for index in pending:
+            spec = entries[index]
+            entry_actions = 2 + len(spec.get('actions', []))
+            if len(actions) + entry_actions >= 100:
+                break
+            amount = Decimal(str(spec['amount']))
+            entry, built = build_entry_actions(
+                user_id, spec['type'], amount, spec.get('description'),
+                spec.get('relatedId'), spec.get('idempotencyKey'),
+                transaction_id=spec.get('transactionId')
+            )
+            spec['transactionId'] = entry['transactionId']
+            built += spec.get('actions', [])
+            actions += built
+            owners += [(index, kind) for kind in ['entry'] + (['idempotency'] if spec.get('idempotencyKey') else []) + ['extra'] * len(spec.get('actions', []))]
+            delta += amount if spec['type'] == 'credit' else -amount
+            chunk.append(index)
+
+        required = -delta if delta < 0 else None
+        actions.insert(0, build_balance_action(user_id, delta, len(chunk), required_balance=required))
+        owners.insert(0, (None, 'balance'))
+
+        try:
+            transact(actions)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = cancellation_reasons(e)
+            failed = {}
+            for (index, kind), code in zip(owners, reasons):
+                if code == 'ConditionalCheckFailed' and index is not None:
+                    failed.setdefault(index, kind)
+            if not failed:
+                if reasons and reasons[0] == 'ConditionalCheckFailed':
+                    # Solde insuffisant pour le lot entier: les débits sont refusés
+                    for index in chunk:
+                        if entries[index]['type'] == 'debit':
+                            results[index] = {'status': 'insufficient_funds', 'transactionId': None}
+                    pending = [i for i in pending if results[i] is None]
+                    continue
+                raise
+            for index, kind in failed.items():
+                if kind == 'idempotency':
+                    existing = get_idempotent_entry(user_id, entries[index]['idempotencyKey'])
+                    results[index] = {'status': 'replayed', 'transactionId': existing['transactionId'] if existing else None}
+                else:
+                    results[index] = {'status': 'rejected', 'transactionId': None}
+            pending = [i for i in pending if results[i] is None]
+            continue
+
+        for index in chunk:
+            results[index] = {'status': 'applied', 'transactionId': entries[index]['transactionId']}
+        pending = [i for i in pending if results[i] is None]
+
+    profile = get_table(TABLE_USERS).get_item(Key=_profile_key(user_id), ConsistentRead=True).get('Item', {})
+    maybe_snapshot(user_id, profile)
+    for result in results:
+        result['newBalance'] = Decimal(str(profile.get('walletBalance', 0)))
+    return results
+
+
+def credit(user_id, amount, description, related_id=None, idempotency_key=None):
+    return post_entry(user_id, 'credit', amount, description, related_id, idempotency_key)
+
+
+def debit(user_id, amount, description, related_id=None, idempotency_key=None):
+    return post_entry(user_id, 'debit', amount, description, related_id, idempotency_key)
+
+
+def get_balance(user_id, consistent=True):
+    profile = get_table(TABLE_USERS).get_item(Key=_profile_key(user_id), ConsistentRead=consistent).get('Item', {})
+    return Decimal(str(profile.get('walletBalance', 0)))
+
+
+# =============================================================================
+# SNAPSHOTS
+# =============================================================================
+
+def latest_snapshot(user_id, as_of=None):
+    """Dernier snapshot pris à `as_of` ou avant."""
+    upper = f"{SNAPSHOT_PREFIX}{as_of}" if as_of else f"{SNAPSHOT_PREFIX}~"
+    response = get_table(TABLE_WALLET_TX).query(
+        KeyConditionExpression=Key('userId').eq(user_id) & Key('transactionId').between(SNAPSHOT_PREFIX, upper),
+        ScanIndexForward=False,
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return items[0] if items else None
+
+
+def opening_snapshot(user_id):
+    """
+    Snapshot d'ouverture: solde du profil moins la somme des entrées du grand
+    livre, de sorte que le rejeu de toutes les entrées retombe sur walletBalance.
+
+    Il n'est enregistré que si le solde n'a pas bougé depuis SNAPSHOT_LAG
+    secondes (une entrée en vol fausserait la différence) ; sinon il est
+    recalculé à la lecture suivante.
+    """
+    profile = get_table(TABLE_USERS).get_item(Key=_profile_key(user_id), ConsistentRead=True).get('Item', {})
+    balance = Decimal(str(profile.get('walletBalance', 0)))
+    for entry in iter_entries(user_id):
+        balance -= signed_amount(entry)
+
+    snapshot = {
+        'userId': user_id,
+        'transactionId': f"{SNAPSHOT_PREFIX}{OPENING_AS_OF}",
+        'balance': balance,
+        'asOf': OPENING_AS_OF,
+        'entryCount': 0,
+        'opening': True,
+        'snapshotAt': datetime.utcnow().isoformat()
+    }
+
+    settled_before = (datetime.utcnow() - timedelta(seconds=SNAPSHOT_LAG)).isoformat()
+    if profile.get('lastWalletUpdate', '') <= settled_before:
+        try:
+            get_table(TABLE_WALLET_TX).put_item(
+                Item=snapshot,
+                ConditionExpression='attribute_not_exists(transactionId)'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    return snapshot
+
+
+def iter_entries(user_id, after=None, until=None):
+    """Entrées du grand livre dans (after, until], par ordre chronologique (GSI user-date)."""
+    condition = Key('userId').eq(user_id)
+    if after or until:
+        condition = condition & Key('createdAt').between(after or '0', until or '~')
+
+    kwargs = {
+        'IndexName': 'user-date',
+        'KeyConditionExpression': condition,
+        'ScanIndexForward': True
+    }
+    table = get_table(TABLE_WALLET_TX)
+    while True:
+        response = table.query(**kwargs)
+        for item in response.get('Items', []):
+            if after and item['createdAt'] == after:
+                continue
+            yield item
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def signed_amount(entry):
+    amount = Decimal(str(entry.get('amount', 0)))
+    return amount if entry.get('type') == 'credit' else -amount
+
+
+def balance_at(user_id, as_of):
+    """Solde après toutes les entrées créées jusqu'à `as_of` inclus."""
+    snapshot = latest_snapshot(user_id, as_of) or opening_snapshot(user_id)
+    balance = Decimal(str(snapshot['balance']))
+    for entry in iter_entries(user_id, after=snapshot['asOf'], until=as_of):
+        balance += signed_amount(entry)
+    return balance
+
+
+def take_snapshot(user_id):
+    """Consolide les entrées depuis le dernier snapshot."""
+    previous = latest_snapshot(user_id) or opening_snapshot(user_id)
+    as_of = (datetime.utcnow() - timedelta(seconds=SNAPSHOT_LAG)).isoformat()
+
+    balance = Decimal(str(previous['balance']))
+    count = 0
+    for entry in iter_entries(user_id, after=previous['asOf'], until=as_of):
+        balance += signed_amount(entry)
+        count += 1
+
+    if count == 0:
+        return previous
+
+    snapshot = {
+        'userId': user_id,
+        'transactionId': f"{SNAPSHOT_PREFIX}{as_of}",
+        'balance': balance,
+        'asOf': as_of,
+        'entryCount': count + int(previous.get('entryCount', 0)),
+        'snapshotAt': datetime.utcnow().isoformat()
+    }
+    get_table(TABLE_WALLET_TX).put_item(Item=snapshot)
+    get_table(TABLE_USERS).update_item(
+        Key=_profile_key(user_id),
+        UpdateExpression='ADD walletEntriesSinceSnapshot :consumed',
+        ExpressionAttributeValues={':consumed': -count}
+    )
+    return snapshot
+
+
+def maybe_snapshot(user_id, profile):
+    if int(profile.get('walletEntriesSinceSnapshot', 0)) < SNAPSHOT_INTERVAL:
+        return
+    try:
+        take_snapshot(user_id)
+    except Exception as e:
+        # Le snapshot est une optimisation: il sera repris au prochain mouvement
+        print(f"⚠️ Snapshot wallet {user_id} échoué: {e}")
+
+
+def reconcile(user_id):
+    """Compare le solde du profil au solde recalculé depuis le grand livre."""
+    now = datetime.utcnow().isoformat()
+    ledger_balance = balance_at(user_id, now)
+    profile_balance = get_balance(user_id)
+    return {
+        'userId': user_id,
+        'profileBalance': profile_balance,
+        'ledgerBalance': ledger_balance,
+        'difference': profile_balance - ledger_balance,
+        'checkedAt': now
+    }
@@ -0,0 +1,220 @@
+"""
+Instrumentation des requêtes: latences par étape et métriques CloudWatch.
+
+- @instrument('tickets') sur un handler Lambda : mesure la durée totale,
+  le code de retour et le cold start, puis émet un document EMF.
+- with timer('qr.render'): ... mesure une étape (appels DynamoDB, HTTP, rendu).
+- record_capacity(table, consumed) cumule les unités consommées
+  (ReturnConsumedCapacity, voir shared/db).
+
+Les métriques sont écrites en CloudWatch Embedded Metric Format : une ligne
+JSON par invocation, que CloudWatch Logs convertit en métriques. Hors AWS,
+METRICS_OUTPUT=<fichier> écrit ces mêmes lignes dans un fichier (JSON lines),
+METRICS_OUTPUT=off désactive l'émission.
+
+EMF accepte au plus 100 valeurs par métrique : au-delà (ex: un broadcast
+WebSocket qui chronomètre chaque post_to_connection), une étape est résumée
+par un échantillon de EMF_MAX_VALUES mesures (réservoir) plus ses
+statistiques exactes `<nom>.count/.sum/.min/.max`.
+"""
+
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'LimaJS/Backend')
+METRICS_OUTPUT = os.environ.get('METRICS_OUTPUT', 'stdout')
+EMF_MAX_VALUES = 100  # limite EMF de valeurs par métrique
+
+_lock = threading.Lock()
+_current = None  # collecteur de l'invocation en cours (une invocation à la fois par conteneur)
+_cold_start = True
+
+
+class Timing:
+    """Statistiques d'une étape + échantillon borné de ses mesures."""
+
+    __slots__ = ('count', 'sum', 'min', 'max', 'sample')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.sample = []
+
+    def add(self, ms):
+        self.count += 1
+        self.sum += ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = ms if self.max is None else max(self.max, ms)
+        if len(self.sample) < EMF_MAX_VALUES:
+            self.sample.append(ms)
+        else:
+            # Échantillonnage par réservoir : chaque mesure a la même probabilité d'être gardée
+            slot = random.randrange(self.count)
+            if slot < EMF_MAX_VALUES:
+                self.sample[slot] = ms
+
+
+class Collector:
+    """Mesures d'une invocation."""
+
+    def __init__(self, service):
+        self.service = service
+        self.timings = {}    # nom -> Timing
+        self.counters = {}   # nom -> valeur
+        self.capacity = {}   # table -> unités consommées
+        self.properties = {}
+
+    def add_timing(self, name, ms):
+        with _lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = Timing()
+            timing.add(round(ms, 3))
+
+    def increment(self, name, value=1):
+        with _lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_capacity(self, table, units):
+        with _lock:
+            self.capacity[table] = self.capacity.get(table, 0) + units
+
+    def to_emf(self):
+        """Document EMF (jusqu'à EMF_MAX_VALUES valeurs par métrique)."""
+        metrics = []
+        document = {'Service': self.service}
+
+        for name, timing in self.timings.items():
+            metrics.append({'Name': name, 'Unit': 'Milliseconds'})
+            document[name] = timing.sample if len(timing.sample) > 1 else timing.sample[0]
+            document[f"{name}.count"] = timing.count
+            if timing.count > len(timing.sample):
+                document[f"{name}.sum"] = round(timing.sum, 3)
+                document[f"{name}.min"] = timing.min
+                document[f"{name}.max"] = timing.max
+
+        for name, value in self.counters.items():
+            metrics.append({'Name': name, 'Unit': 'Count'})
+            document[name] = value
+
+        if self.capacity:
+            total = sum(self.capacity.values())
+            metrics.append({'Name': 'ConsumedCapacity', 'Unit': 'Count'})
+            document['ConsumedCapacity'] = round(total, 2)
+            document['capacityByTable'] = {t: round(u, 2) for t, u in self.capacity.items()}
+
+        document.update(self.properties)
+        document['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['Service']],
+                'Metrics': metrics
+            }]
+        }
+        return document
+
+
+def current():
+    return _current
+
+
+def add_timing(name, ms):
+    if _current is not None:
+        _current.add_timing(name, ms)
+
+
+def increment(name, value=1):
+    if _current is not None:
+        _current.increment(name, value)
+
+
+def set_property(name, value):
+    """Propriété non agrégée (visible dans Logs Insights, pas une dimension)."""
+    if _current is not None:
+        _current.properties[name] = value
+
+
+def record_capacity(table, consumed):
+    """Cumule un bloc ConsumedCapacity (dict ou liste) renvoyé par DynamoDB."""
+    if _current is None or not consumed:
+        return
+    for entry in consumed if isinstance(consumed, list) else [consumed]:
+        _current.add_capacity(entry.get('TableName', table), float(entry.get('CapacityUnits', 0)))
+
+
+@contextmanager
+def timer(name):
+    """Mesure la durée du bloc (ms) sous `name`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, (time.perf_counter() - started) * 1000)
+
+
+def timed(name):
+    """Décorateur équivalent à `with timer(name)`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def emit(document):
+    if METRICS_OUTPUT == 'off':
+        return
+    line = json.dumps(document, default=str, separators=(',', ':'))
+    if METRICS_OUTPUT == 'stdout':
+        print(line)
+    else:
+        with open(METRICS_OUTPUT, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def instrument(service):
+    """
+    Décorateur de handler Lambda: ouvre un collecteur pour l'invocation et
+    émet le document EMF à la fin (y compris en cas d'exception).
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _current, _cold_start
+            collector = Collector(service)
+            collector.properties['coldStart'] = _cold_start
+            _cold_start = False
+            if isinstance(event, dict):
+                collector.properties['route'] = event.get('routeKey') or event.get('rawPath') or event.get('path')
+            request_id = getattr(context, 'aws_request_id', None)
+            if request_id:
+                collector.properties['requestId'] = request_id
+
+            previous, _current = _current, collector
+            started = time.perf_counter()
+            try:
+                response = handler(event, context)
+                if isinstance(response, dict) and 'statusCode' in response:
+                    collector.properties['statusCode'] = response['statusCode']
+                    if response['statusCode'] >= 500:
+                        collector.increment('Errors')
+                return response
+            except Exception:
+                collector.increment('Errors')
+                raise
+            finally:
+                collector.add_timing('Latency', (time.perf_counter() - started) * 1000)
+                _current = previous
+                emit(collector.to_emf())
+        return wrapper
+    return decorator
@@ -0,0 +1,293 @@
+"""
+Moteur de validation NFC à faible latence.
+
+- Index compact en mémoire: hash UID -> (userId, cardId, status), rempli à la
+  demande et rafraîchi par incréments depuis le journal des changements
+  (table limajs-nfc-changelog, alimentée par le stream DynamoDB de la table
+  NFC et par les handlers qui changent un statut). Table séparée : le journal
+  n'apparaît dans aucun GSI des cartes.
+- Liste de refus (cartes bloquées) en filtre de Bloom: une réponse négative
+  est certaine, une réponse positive est confirmée par une lecture fraîche.
+  Un filtre ne peut pas retirer d'élément : il est reconstruit quand le
+  journal signale un déblocage, et au plus tard toutes les
+  DENYLIST_REBUILD_SECONDS.
+- Écriture de `lastUsed` différée et regroupée, hors du chemin tap -> bip ;
+  vidée de façon bloquante seulement à l'arrêt du conteneur (SIGTERM).
+"""
+
+import hashlib
+import math
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from boto3.dynamodb.conditions import Key
+
+from shared.db import get_table
+from shared.cache import LRUCache
+
+TABLE_NFC_CHANGELOG = os.environ.get('TABLE_NFC_CHANGELOG', 'limajs-nfc-changelog')
+CHANGELOG_PK = 'CHANGELOG'
+CHANGELOG_RETENTION = 86400  # 24h (attribut ttl des entrées du journal)
+CHANGELOG_OVERLAP = 10  # secondes relues à chaque rafraîchissement (écritures tardives)
+DENYLIST_REBUILD_SECONDS = 3600  # reconstruction périodique du filtre de Bloom
+
+
+class BloomFilter:
+    """Filtre de Bloom simple (double hachage sur blake2b)."""
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.num_bits = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class UsageWriter:
+    """
+    Tampon des mises à jour `lastUsed`.
+    Plusieurs taps d'une même carte sont fusionnés, puis écrits en lot
+    dans un pool de threads dès que le tampon est plein ou trop ancien,
+    sans bloquer la requête. Si le conteneur est gelé avant la fin,
+    l'écriture reprend au dégel ; à l'arrêt du conteneur (SIGTERM, voir
+    flush_on_shutdown) le tampon est vidé en attendant les écritures.
+    """
+
+    def __init__(self, table_name, max_batch=25, max_delay=5, workers=4):
+        self.table_name = table_name
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = {}  # (userId, cardId) -> timestamp ISO
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def record(self, user_id, card_id, used_at):
+        with self._lock:
+            self._pending[(user_id, card_id)] = used_at
+            if self._oldest is None:
+                self._oldest = time.time()
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        with self._lock:
+            due = self._pending and (
+                len(self._pending) >= self.max_batch
+                or time.time() - self._oldest >= self.max_delay
+            )
+        if due:
+            self.flush()
+
+    def flush(self, wait=False):
+        with self._lock:
+            batch, self._pending, self._oldest = self._pending, {}, None
+        if not batch:
+            return []
+
+        table = get_table(self.table_name)
+        futures = [
+            self._executor.submit(self._write, table, key, used_at)
+            for key, used_at in batch.items()
+        ]
+        if wait:
+            for future in futures:
+                future.result()
+        return futures
+
+    def flush_on_shutdown(self):
+        """Vide le tampon (bloquant) à la réception de SIGTERM, puis chaîne le handler précédent."""
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def handler(signum, frame):
+            self.flush(wait=True)
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL:
+                raise SystemExit(0)
+
+        try:
+            signal.signal(signal.SIGTERM, handler)
+        except ValueError:
+            # Import hors du thread principal : pas de handler de signal possible
+            pass
+
+    @staticmethod
+    def _write(table, key, used_at):
+        try:
+            table.update_item(
+                Key={'userId': key[0], 'cardId': key[1]},
+                UpdateExpression='SET lastUsed = :now',
+                ExpressionAttributeValues={':now': used_at}
+            )
+        except Exception as e:
+            print(f"⚠️ Erreur mise à jour lastUsed {key[1]}: {e}")
+
+
+class NfcCardIndex:
+    """Index des cartes NFC propre au conteneur Lambda."""
+
+    def __init__(self, table_name, refresh_seconds=30, max_entries=200000, denylist_capacity=100000,
+                 denylist_rebuild_seconds=DENYLIST_REBUILD_SECONDS, changelog_table=TABLE_NFC_CHANGELOG):
+        self.table_name = table_name
+        self.changelog_table = changelog_table
+        self.refresh_seconds = refresh_seconds
+        self.denylist_capacity = denylist_capacity
+        self.denylist_rebuild_seconds = denylist_rebuild_seconds
+        self._cards = LRUCache(max_bytes=max_entries, max_items=max_entries)
+        self._denylist = None
+        self._denylist_built_at = 0
+        self._denylist_stale = False
+        self._last_refresh = 0
+        self._lock = threading.Lock()
+        self.usage = UsageWriter(table_name)
+
+    # --- Chargement / rafraîchissement ---
+
+    def load_denylist(self, blocked=()):
+        """
+        Charge toutes les cartes bloquées (GSI status-index) dans un nouveau
+        filtre de Bloom. `blocked` : blocages déjà lus dans le journal, que le
+        GSI (cohérence à terme) peut ne pas encore refléter.
+        """
+        table = get_table(self.table_name)
+        denylist = BloomFilter(capacity=self.denylist_capacity)
+        for uid_hash in blocked:
+            denylist.add(uid_hash)
+        kwargs = {
+            'IndexName': 'status-index',
+            'KeyConditionExpression': Key('status').eq('BLOCKED'),
+            'ProjectionExpression': 'nfcUidHash'
+        }
+        while True:
+            response = table.query(**kwargs)
+            for item in response.get('Items', []):
+                if item.get('nfcUidHash'):
+                    denylist.add(item['nfcUidHash'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        self._denylist = denylist
+        self._denylist_built_at = time.time()
+        self._denylist_stale = False
+
+    def refresh(self, force=False):
+        """Applique les changements publiés depuis le dernier rafraîchissement."""
+        now = time.time()
+        if not force and now - self._last_refresh < self.refresh_seconds:
+            return
+
+        with self._lock:
+            if not force and now - self._last_refresh < self.refresh_seconds:
+                return
+
+            # Conteneur gelé plus longtemps que la rétention du journal: tout recharger
+            if self._denylist is None or now - self._last_refresh > CHANGELOG_RETENTION - CHANGELOG_OVERLAP:
+                self._cards.clear()
+                self.load_denylist()
+                self._last_refresh = now
+                return
+
+            since = datetime.utcfromtimestamp(self._last_refresh - CHANGELOG_OVERLAP).isoformat()
+            table = get_table(self.changelog_table)
+            kwargs = {'KeyConditionExpression': Key('partition').eq(CHANGELOG_PK) & Key('changeId').gt(since)}
+            blocked = set()
+            while True:
+                response = table.query(**kwargs)
+                for change in response.get('Items', []):
+                    self.apply_change(change.get('uidHash'), change.get('ownerId'), change.get('changedCardId'), change.get('cardStatus'))
+                    if change.get('cardStatus') == 'BLOCKED' and change.get('uidHash'):
+                        blocked.add(change['uidHash'])
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+            # Carte débloquée (ou filtre ancien) : sans reconstruction, chaque tap
+            # d'une carte débloquée repasserait par une lecture fraîche
+            if self._denylist_stale or now - self._denylist_built_at > self.denylist_rebuild_seconds:
+                self.load_denylist(blocked)
+            self._last_refresh = now
+
+    def apply_change(self, uid_hash, user_id, card_id, status):
+        """Met à jour l'index et la liste de refus pour une carte."""
+        if not uid_hash:
+            return
+        if status == 'DELETED':
+            self._cards.delete(uid_hash)
+            return
+        self._cards.set(uid_hash, (user_id, card_id, status))
+        if self._denylist is None:
+            return
+        if status == 'BLOCKED':
+            self._denylist.add(uid_hash)
+        elif uid_hash in self._denylist:
+            self._denylist_stale = True
+
+    # --- Chemin de validation ---
+
+    def _fetch(self, uid_hash):
+        """Lecture fraîche via le GSI nfc-uid-index."""
+        response = get_table(self.table_name).query(
+            IndexName='nfc-uid-index',
+            KeyConditionExpression=Key('nfcUidHash').eq(uid_hash)
+        )
+        items = response.get('Items', [])
+        if not items:
+            return None
+        card = items[0]
+        entry = (card['userId'], card['cardId'], card['status'])
+        self._cards.set(uid_hash, entry)
+        return entry
+
+    def lookup(self, uid_hash):
+        """
+        Retourne (userId, cardId, status) ou None si la carte est inconnue.
+        Aucun appel réseau pour une carte déjà vue et absente de la liste de refus.
+        """
+        self.refresh()
+
+        entry = self._cards.get(uid_hash)
+        if entry is None:
+            return self._fetch(uid_hash)
+
+        # Positif du filtre: carte peut-être bloquée (ou faux positif) -> confirmer
+        if entry[2] == 'ACTIVE' and uid_hash in self._denylist:
+            return self._fetch(uid_hash)
+
+        return entry
+
+    def record_use(self, user_id, card_id):
+        used_at = datetime.utcnow().isoformat()
+        self.usage.record(user_id, card_id, used_at)
+        return used_at
+
+
+def build_change_entry(card, status=None):
+    """Entrée du journal des changements pour une carte (table TABLE_NFC_CHANGELOG)."""
+    now = datetime.utcnow()
+    return {
+        'partition': CHANGELOG_PK,
+        'changeId': f"{now.isoformat()}#{card['cardId']}",
+        'uidHash': card.get('nfcUidHash'),
+        'ownerId': card.get('userId'),
+        'changedCardId': card['cardId'],
+        'cardStatus': status or card.get('status'),
+        'ttl': int((now + timedelta(seconds=CHANGELOG_RETENTION)).timestamp())
+    }
@@ -0,0 +1,124 @@
+"""
+Pagination des historiques (Query DynamoDB).
+
+- Curseur opaque signé (HMAC-SHA256): le client ne peut ni lire ni forger la
+  clé de départ, et un curseur n'est valable que pour son `scope` (ex: userId).
+- Boucle de lecture: la Query est relancée jusqu'à obtenir `limit` éléments
+  (après FilterExpression) ou épuiser un budget d'unités de lecture.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+
+from shared import secrets
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+DEFAULT_READ_BUDGET = float(os.environ.get('PAGINATION_READ_BUDGET', 25))  # RCU par requête API
+MIN_PAGE_SIZE = 25
+
+_signing_key = None
+
+# Clé provisionnée par l'infra (secret généré) : vérifiée dès le démarrage
+secrets.require_signing_key('PAGINATION_CURSOR_KEY')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def get_signing_key():
+    global _signing_key
+    if _signing_key is None:
+        _signing_key = secrets.get_signing_key('PAGINATION_CURSOR_KEY')
+    return _signing_key
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _sign(payload, scope):
+    return hmac.new(get_signing_key(), scope.encode() + b'|' + payload, hashlib.sha256).digest()[:16]
+
+
+def encode_cursor(last_key, scope=''):
+    """LastEvaluatedKey -> curseur opaque."""
+    if not last_key:
+        return None
+    payload = json.dumps(last_key, separators=(',', ':'), sort_keys=True, default=str).encode()
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload, scope))}"
+
+
+def decode_cursor(cursor, scope=''):
+    """Curseur -> ExclusiveStartKey. Lève InvalidCursor si altéré ou d'un autre scope."""
+    if not cursor:
+        return None
+    try:
+        payload_part, signature_part = cursor.split('.', 1)
+        payload = _b64decode(payload_part)
+        signature = _b64decode(signature_part)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if not hmac.compare_digest(_sign(payload, scope), signature):
+        raise InvalidCursor("Invalid cursor")
+    return json.loads(payload)
+
+
+def parse_limit(params, default=DEFAULT_LIMIT):
+    try:
+        limit = int(params.get('limit', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def paginate(table, limit, cursor=None, scope='', key_attributes=None, read_budget=DEFAULT_READ_BUDGET, **query_kwargs):
+    """
+    Exécute une Query paginée.
+
+    - key_attributes: attributs de clé de la table ET de l'index interrogé.
+      Permet de lire par pages plus grandes que `limit` (utile avec un
+      FilterExpression) et de reprendre juste après le dernier élément renvoyé.
+    - read_budget: unités de lecture consommées au-delà desquelles on rend
+      une page partielle (avec curseur) plutôt que de continuer.
+
+    Retourne (items, next_cursor).
+    """
+    kwargs = dict(query_kwargs)
+    kwargs['ReturnConsumedCapacity'] = 'TOTAL'
+    start_key = decode_cursor(cursor, scope)
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+
+    items = []
+    consumed = 0.0
+    while True:
+        remaining = limit - len(items)
+        kwargs['Limit'] = max(remaining, MIN_PAGE_SIZE) if key_attributes else remaining
+
+        response = table.query(**kwargs)
+        consumed += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
+        page = response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+
+        if len(page) >= remaining:
+            items.extend(page[:remaining])
+            if len(page) > remaining or last_key:
+                # Reprise juste après le dernier élément rendu
+                last_key = {attr: items[-1][attr] for attr in key_attributes} if key_attributes else last_key
+            return items, encode_cursor(last_key, scope)
+
+        items.extend(page)
+        if not last_key:
+            return items, None
+        if consumed >= read_budget:
+            return items, encode_cursor(last_key, scope)
+        kwargs['ExclusiveStartKey'] = last_key
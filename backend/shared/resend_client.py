@@ -1,17 +1,85 @@
 """
 Client Resend pour l'envoi d'emails
 Supporte les pièces jointes (factures PDF)
+
+- Une session HTTP partagée par conteneur (keep-alive : une seule poignée de
+  main TLS pour tout un lot d'emails, relances sur 429/5xx avec backoff)
+- Chaque requête porte une Idempotency-Key (celle de l'appelant, sinon une
+  clé générée) : une relance après un 5xx n'envoie pas l'email deux fois
+- send_batch : jusqu'à RESEND_BATCH_MAX emails par requête (/emails/batch)
+- Clé API lue dans le secret de l'application (RESEND_API_KEY en variable
+  d'environnement pour le local) : une rotation est prise en compte sans redéploiement
 """
 
 import os
 import json
-import requests
+import threading
+import uuid
+
+from shared.metrics import timer
+from shared.secrets import get_config
+from shared.templates import render
 
-RESEND_API_KEY = os.environ.get('RESEND_API_KEY', '')
 FROM_EMAIL = os.environ.get('FROM_EMAIL', 'noreply@limajs.com')
+RESEND_API_URL = os.environ.get('RESEND_API_URL', 'https://api.resend.com')
+RESEND_BATCH_MAX = 100
+RESEND_POOL_SIZE = int(os.environ.get('RESEND_POOL_SIZE', '10'))
+RESEND_TIMEOUT = (3, 10)  # connexion, lecture (s)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Session requests partagée (créée au premier envoi)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                # POST relancé: chaque appel porte une Idempotency-Key (voir _headers), reprise telle quelle
+                retry = Retry(
+                    total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=['POST'], respect_retry_after_header=True
+                )
+                session = requests.Session()
+                session.headers.update({'Content-Type': 'application/json'})
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=RESEND_POOL_SIZE, max_retries=retry))
+                _session = session
+    return _session
+
+
+def get_api_key():
+    return get_config('RESEND_API_KEY', '')
+
+
+def _headers(idempotency_key=None):
+    """En-têtes d'un appel ; sans clé fournie, une clé propre à l'appel protège ses relances."""
+    return {
+        'Authorization': f'Bearer {get_api_key()}',
+        'Idempotency-Key': idempotency_key or str(uuid.uuid4())
+    }
 
 
-def send_email(to: str, subject: str, html: str, attachments: list = None, text: str = None) -> dict:
+def _payload(to, subject, html, attachments=None, text=None):
+    payload = {
+        'from': FROM_EMAIL,
+        'to': [to] if isinstance(to, str) else to,
+        'subject': subject,
+        'html': html
+    }
+    if text:
+        payload['text'] = text
+    if attachments:
+        payload['attachments'] = attachments
+    return payload
+
+
+def send_email(to: str, subject: str, html: str, attachments: list = None, text: str = None,
+               idempotency_key: str = None) -> dict:
     """
     Envoie un email via Resend API
     
@@ -21,37 +89,26 @@ def send_email(to: str, subject: str, html: str, attachments: list = None, text:
         html: Contenu HTML
         attachments: Liste de pièces jointes [{filename, content (base64), type}]
         text: Contenu texte (optionnel)
+        idempotency_key: Clé d'idempotence Resend (optionnel : stable d'un appel
+            à l'autre, elle protège aussi les relances de l'appelant ; sinon générée)
     
     Returns:
         Response dict from Resend API
     """
-    if not RESEND_API_KEY:
+    if not get_api_key():
         print("⚠️ RESEND_API_KEY not configured, email not sent")
         return {'error': 'API key not configured'}
     
-    payload = {
-        'from': FROM_EMAIL,
-        'to': [to] if isinstance(to, str) else to,
-        'subject': subject,
-        'html': html
-    }
-    
-    if text:
-        payload['text'] = text
-    
-    if attachments:
-        payload['attachments'] = attachments
+    payload = _payload(to, subject, html, attachments, text)
     
     try:
-        response = requests.post(
-            'https://api.resend.com/emails',
-            headers={
-                'Authorization': f'Bearer {RESEND_API_KEY}',
-                'Content-Type': 'application/json'
-            },
-            json=payload,
-            timeout=10
-        )
+        with timer('http.resend'):
+            response = get_session().post(
+                f"{RESEND_API_URL}/emails",
+                headers=_headers(idempotency_key),
+                json=payload,
+                timeout=RESEND_TIMEOUT
+            )
         
         result = response.json()
         
@@ -67,97 +124,96 @@ def send_email(to: str, subject: str, html: str, attachments: list = None, text:
         return {'error': str(e)}
 
 
+def send_batch(messages: list, idempotency_key: str = None) -> list:
+    """
+    Envoie plusieurs emails via l'endpoint batch de Resend
+    
+    Args:
+        messages: [{to, subject, html, text?, attachments?}]
+        idempotency_key: Préfixe de clé d'idempotence (suffixé par le numéro de lot)
+    
+    Returns:
+        Un résultat par message, dans l'ordre: {'success': True, 'id'} ou {'error'}
+    
+    L'endpoint batch n'accepte pas de pièces jointes : ces messages partent
+    un par un via send_email (sur la même session).
+    """
+    results = [None] * len(messages)
+    if not get_api_key():
+        print("⚠️ RESEND_API_KEY not configured, emails not sent")
+        return [{'error': 'API key not configured'} for _ in messages]
+    
+    batchable = []
+    for i, message in enumerate(messages):
+        if message.get('attachments'):
+            key = f"{idempotency_key}-{i}" if idempotency_key else None
+            results[i] = send_email(idempotency_key=key, **message)
+        else:
+            batchable.append(i)
+    
+    for start in range(0, len(batchable), RESEND_BATCH_MAX):
+        indexes = batchable[start:start + RESEND_BATCH_MAX]
+        payload = [
+            _payload(messages[i]['to'], messages[i]['subject'], messages[i]['html'], text=messages[i].get('text'))
+            for i in indexes
+        ]
+        key = f"{idempotency_key}-batch-{start // RESEND_BATCH_MAX}" if idempotency_key else None
+        try:
+            with timer('http.resend'):
+                response = get_session().post(
+                    f"{RESEND_API_URL}/emails/batch",
+                    headers=_headers(key),
+                    json=payload,
+                    timeout=RESEND_TIMEOUT
+                )
+            result = response.json()
+            if response.status_code in [200, 201]:
+                # Les identifiants sont renvoyés dans l'ordre des messages
+                for i, sent in zip(indexes, result.get('data', [])):
+                    results[i] = {'success': True, 'id': sent.get('id')}
+                print(f"✅ Batch of {len(indexes)} emails sent")
+            else:
+                print(f"❌ Failed to send batch: {result}")
+                for i in indexes:
+                    results[i] = {'error': result.get('message', 'Unknown error')}
+        except Exception as e:
+            print(f"❌ Batch email error: {e}")
+            for i in indexes:
+                results[i] = {'error': str(e)}
+    
+    # Réponse incomplète: les messages sans identifiant sont signalés en échec
+    return [result or {'error': 'No result returned'} for result in results]
+
+
 def send_payment_received_email(user: dict, payment: dict):
     """Email de confirmation de réception de preuve de paiement"""
-    html = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; background: #f4f4f4; padding: 20px; }}
-            .container {{ max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; padding: 30px; }}
-            h1 {{ color: #2563EB; }}
-            .success {{ background: #D1FAE5; border-left: 4px solid #10B981; padding: 15px; margin: 20px 0; }}
-            .footer {{ color: #9CA3AF; font-size: 12px; margin-top: 30px; text-align: center; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>LimaJS Motors</h1>
-            <p>Bonjour {user.get('firstName', 'Client')},</p>
-            
-            <div class="success">
-                <strong>✅ Nous avons bien reçu votre preuve de paiement !</strong>
-            </div>
-            
-            <p>Votre demande est en cours de traitement. Nous vous confirmerons dans les plus brefs délais.</p>
-            
-            <h3>Détails:</h3>
-            <ul>
-                <li><strong>Référence:</strong> {payment.get('paymentId')}</li>
-                <li><strong>Montant:</strong> {payment.get('amount')} {payment.get('currency', 'HTG')}</li>
-                <li><strong>Date:</strong> {payment.get('submittedAt', '')[:10]}</li>
-            </ul>
-            
-            <p>Si vous avez des questions, n'hésitez pas à nous contacter.</p>
-            
-            <div class="footer">
-                <p>Merci pour votre confiance!</p>
-                <p>LimaJS Motors - Transport Collectif</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
+    email = render(
+        'payment_received',
+        first_name=user.get('firstName', 'Client'),
+        reference=payment.get('paymentId'),
+        amount=payment.get('amount'),
+        currency=payment.get('currency', 'HTG'),
+        date=payment.get('submittedAt', '')[:10]
+    )
     
     return send_email(
         to=user.get('email'),
-        subject="✅ Preuve de paiement reçue - LimaJS Motors",
-        html=html
+        subject=email['subject'],
+        html=email['html'],
+        text=email['text']
     )
 
 
 def send_payment_approved_email(user: dict, payment: dict, invoice_pdf: bytes = None):
     """Email de confirmation d'approbation du paiement"""
-    html = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; background: #f4f4f4; padding: 20px; }}
-            .container {{ max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; padding: 30px; }}
-            h1 {{ color: #2563EB; }}
-            .approved {{ background: #D1FAE5; border: 2px solid #10B981; padding: 20px; margin: 20px 0; border-radius: 10px; text-align: center; }}
-            .approved h2 {{ color: #10B981; margin: 0; }}
-            .footer {{ color: #9CA3AF; font-size: 12px; margin-top: 30px; text-align: center; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>LimaJS Motors</h1>
-            <p>Bonjour {user.get('firstName', 'Client')},</p>
-            
-            <div class="approved">
-                <h2>🎉 Paiement Approuvé!</h2>
-            </div>
-            
-            <p>Votre paiement a été vérifié et approuvé. Votre abonnement est maintenant actif!</p>
-            
-            <h3>Détails:</h3>
-            <ul>
-                <li><strong>Référence:</strong> {payment.get('paymentId')}</li>
-                <li><strong>Montant:</strong> {payment.get('amount')} {payment.get('currency', 'HTG')}</li>
-                <li><strong>Type:</strong> {payment.get('subscriptionType', 'Abonnement')}</li>
-            </ul>
-            
-            <p>Vous trouverez votre facture en pièce jointe.</p>
-            
-            <div class="footer">
-                <p>Merci pour votre confiance!</p>
-                <p>LimaJS Motors - Transport Collectif</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
+    email = render(
+        'payment_approved',
+        first_name=user.get('firstName', 'Client'),
+        reference=payment.get('paymentId'),
+        amount=payment.get('amount'),
+        currency=payment.get('currency', 'HTG'),
+        plan=payment.get('subscriptionType', 'Abonnement')
+    )
     
     attachments = None
     if invoice_pdf:
@@ -170,57 +226,27 @@ def send_payment_approved_email(user: dict, payment: dict, invoice_pdf: bytes =
     
     return send_email(
         to=user.get('email'),
-        subject="🎉 Paiement approuvé - LimaJS Motors",
-        html=html,
-        attachments=attachments
+        subject=email['subject'],
+        html=email['html'],
+        attachments=attachments,
+        text=email['text']
     )
 
 
 def send_payment_rejected_email(user: dict, payment: dict, reason: str = None):
     """Email de notification de rejet du paiement"""
-    html = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; background: #f4f4f4; padding: 20px; }}
-            .container {{ max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; padding: 30px; }}
-            h1 {{ color: #2563EB; }}
-            .rejected {{ background: #FEE2E2; border-left: 4px solid #EF4444; padding: 15px; margin: 20px 0; }}
-            .btn {{ display: inline-block; background: #2563EB; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px; margin-top: 20px; }}
-            .footer {{ color: #9CA3AF; font-size: 12px; margin-top: 30px; text-align: center; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>LimaJS Motors</h1>
-            <p>Bonjour {user.get('firstName', 'Client')},</p>
-            
-            <div class="rejected">
-                <strong>❌ Votre paiement n'a pas pu être validé</strong>
-            </div>
-            
-            <p><strong>Raison:</strong> {reason or 'Preuve de paiement invalide ou illisible'}</p>
-            
-            <h3>Détails:</h3>
-            <ul>
-                <li><strong>Référence:</strong> {payment.get('paymentId')}</li>
-                <li><strong>Montant:</strong> {payment.get('amount')} {payment.get('currency', 'HTG')}</li>
-            </ul>
-            
-            <p>Veuillez soumettre une nouvelle preuve de paiement.</p>
-            
-            <a href="https://app.limajsmotors.com/subscription" class="btn">Réessayer</a>
-            
-            <div class="footer">
-                <p>LimaJS Motors - Transport Collectif</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
+    email = render(
+        'payment_rejected',
+        first_name=user.get('firstName', 'Client'),
+        reason=reason or 'Preuve de paiement invalide ou illisible',
+        reference=payment.get('paymentId'),
+        amount=payment.get('amount'),
+        currency=payment.get('currency', 'HTG')
+    )
     
     return send_email(
         to=user.get('email'),
-        subject="❌ Paiement non validé - LimaJS Motors",
-        html=html
+        subject=email['subject'],
+        html=email['html'],
+        text=email['text']
     )
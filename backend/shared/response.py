@@ -1,4 +1,24 @@
-import json
+import base64
+import functools
+import gzip
+import hashlib
+import os
+
+from shared.serialization import dumps, RawJSON, preserialize
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*", # À restreindre en prod
+    "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match,Idempotency-Key",
+    "Access-Control-Allow-Methods": "OPTIONS,POST,GET,PUT,DELETE",
+    "Access-Control-Expose-Headers": "ETag,Content-Encoding"
+}
 
 def api_response(status_code, body):
     """
@@ -9,13 +29,46 @@ def api_response(status_code, body):
         "statusCode": status_code,
         "headers": {
             "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*", # À restreindre en prod
-            "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
-            "Access-Control-Allow-Methods": "OPTIONS,POST,GET,PUT,DELETE"
+            **CORS_HEADERS
         },
-        "body": json.dumps(body, default=str) # default=str pour gérer datetime/decimal
+        "body": dumps(body)  # Decimal -> nombre, datetime -> ISO (voir shared/serialization)
     }
 
+def binary_response(status_code, data, content_type, headers=None):
+    """
+    Réponse binaire (image, PDF...) encodée en base64 pour API Gateway.
+    """
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": content_type,
+            **CORS_HEADERS,
+            **(headers or {})
+        },
+        "body": base64.b64encode(data).decode(),
+        "isBase64Encoded": True
+    }
+
+def not_modified(etag, headers=None):
+    """Réponse 304 (le client a déjà la bonne version)."""
+    return {
+        "statusCode": 304,
+        "headers": {
+            "ETag": etag,
+            **CORS_HEADERS,
+            **(headers or {})
+        },
+        "body": ""
+    }
+
+def etag_matches(event, etag):
+    """Vérifie si le header If-None-Match correspond à l'ETag courant."""
+    if_none_match = get_header(event, 'If-None-Match')
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
 def success(data=None, message="Success"):
     return api_response(200, {
         "success": True,
@@ -69,6 +122,28 @@ def get_user_sub(event):
     
     return user_sub
 
+def get_user_groups(event):
+    """Groupes Cognito de l'appelant (claim cognito:groups, liste ou chaîne "[A B]")."""
+    groups = get_user_claims(event).get('cognito:groups') or []
+    if isinstance(groups, str):
+        groups = groups.strip('[]').replace(',', ' ').split()
+    return {group.upper() for group in groups}
+
+def user_has_role(event, *roles):
+    """
+    Vérifie que l'appelant a l'un des rôles : groupe Cognito, sinon rôle du
+    profil limajs-users (PROFILE.role).
+    """
+    roles = {role.upper() for role in roles}
+    if get_user_groups(event) & roles:
+        return True
+    user_sub = get_user_sub(event)
+    if not user_sub:
+        return False
+    from shared.db import get_item
+    profile = get_item(os.environ.get('TABLE_USERS', 'limajs-users'), {'userId': f"USER#{user_sub}", 'type': 'PROFILE'}) or {}
+    return str(profile.get('role', '')).upper() in roles
+
 def get_http_method(event):
     """
     Get HTTP method from API Gateway event.
@@ -96,6 +171,18 @@ def get_path_parameters(event):
     """
     return event.get('pathParameters') or {}
 
+def get_header(event, name, default=None):
+    """
+    Lit un header HTTP sans tenir compte de la casse.
+    (HTTP API v2 met les headers en minuscules, REST API les conserve tels quels)
+    """
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return default
+
 def get_route_key(event):
     """
     Get route key from HTTP API v2 event (e.g., 'GET /users/me').
@@ -103,3 +190,92 @@ def get_route_key(event):
     """
     return event.get('routeKey')
 
+# =============================================================================
+# COMPRESSION ET GET CONDITIONNEL
+# =============================================================================
+
+def body_etag(body):
+    """ETag fort calculé sur le corps (non compressé)."""
+    if isinstance(body, str):
+        body = body.encode()
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def _etag_base(tag):
+    """Retire le préfixe faible et le suffixe d'encodage ("hash-gzip" -> "hash")."""
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    for suffix in ('-gzip"', '-br"'):
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+def negotiate_encoding(event):
+    """Choisit l'encodage selon Accept-Encoding (br si disponible, puis gzip)."""
+    accept = (get_header(event, 'Accept-Encoding') or '').lower()
+    accepted = {}
+    for part in accept.split(','):
+        token, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            accepted[token] = q
+    for encoding in (('br',) if brotli else ()) + ('gzip',):
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+def finalize_response(event, response):
+    """
+    Post-traitement d'une réponse JSON pour un GET :
+    - ETag fort + 304 si If-None-Match correspond
+    - compression gzip/brotli (corps base64, isBase64Encoded) si le client l'accepte
+    """
+    if not isinstance(response, dict) or response.get('isBase64Encoded'):
+        return response
+    if get_http_method(event) not in ('GET', 'HEAD') or response.get('statusCode') != 200:
+        return response
+
+    body = response.get('body') or ''
+    data = body.encode() if isinstance(body, str) else body
+    headers = dict(response.get('headers') or {})
+    etag = headers.get('ETag') or body_etag(data)
+
+    if_none_match = get_header(event, 'If-None-Match')
+    if if_none_match:
+        candidates = [_etag_base(tag) for tag in if_none_match.split(',')]
+        if '*' in candidates or _etag_base(etag) in candidates:
+            return not_modified(etag, {k: v for k, v in headers.items() if k in ('Cache-Control', 'Vary')})
+
+    headers['ETag'] = etag
+    headers['Vary'] = 'Accept-Encoding'
+
+    encoding = negotiate_encoding(event) if len(data) >= COMPRESSION_MIN_BYTES else None
+    if not encoding:
+        return {**response, 'headers': headers}
+
+    # Représentation différente -> ETag distinct (RFC 9110)
+    headers['ETag'] = etag[:-1] + f'-{encoding}"'
+    headers['Content-Encoding'] = encoding
+    return {
+        **response,
+        'headers': headers,
+        'body': base64.b64encode(compress_body(data, encoding)).decode(),
+        'isBase64Encoded': True
+    }
+
+def optimize_response(handler):
+    """Décorateur de handler Lambda: applique finalize_response à la réponse."""
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        return finalize_response(event, handler(event, context))
+    return wrapper
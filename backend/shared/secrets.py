@@ -1,51 +1,203 @@
-import boto3
+"""
+Accès aux secrets (AWS Secrets Manager).
+
+- Client Secrets Manager partagé (shared.clients), créé au premier accès
+- Cache par conteneur avec durée de vie SECRETS_TTL : au-delà, la valeur en
+  cache est encore servie pendant que le secret est relu en arrière-plan
+  (stale-while-revalidate). Une clé tournée (FCM, Resend) est donc prise en
+  compte sans cold start, et sans attente pour la requête en cours.
+- Au-delà de SECRETS_MAX_STALE, relecture synchrone ; si elle échoue, la
+  dernière valeur connue reste servie
+- prefetch_secrets : lecture groupée à l'init (BatchGetSecretValue)
+- Hors AWS (tests, scripts) : SECRETS_LOCAL_FILE (JSON {nom: valeur}) ou
+  SECRETS_LOCAL (même JSON dans la variable) remplacent Secrets Manager
+
+Dans Lambda, le thread de rafraîchissement ne progresse que pendant une
+invocation : au pire, la relecture se termine à l'invocation suivante.
+
+Usage:
+    secrets = get_secret('limajs/backend/production')
+    key = get_config('RESEND_API_KEY')
+"""
+
 import json
 import os
-from botocore.exceptions import ClientError
+import threading
+import time
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from shared.clients import get_client
 
-# Cache simple en mémoire (durée de vie du conteneur Lambda)
+SECRET_NAME = os.environ.get('SECRET_NAME', 'limajs/backend/production')
+SECRETS_TTL = int(os.environ.get('SECRETS_TTL', '300'))  # s
+SECRETS_MAX_STALE = int(os.environ.get('SECRETS_MAX_STALE', '3600'))  # s
+SECRETS_LOCAL_FILE = os.environ.get('SECRETS_LOCAL_FILE', '')
+SECRETS_BATCH_MAX = 20  # limite de BatchGetSecretValue (SecretIdList)
+
+# nom -> (valeur, lu à)
 _SECRETS_CACHE = {}
+_refreshing = set()
+_lock = threading.Lock()
+_local = None
+
+
+def _local_secrets():
+    """Secrets locaux (fichier ou variable d'environnement), None si non configurés."""
+    global _local
+    if _local is None:
+        if SECRETS_LOCAL_FILE:
+            with open(SECRETS_LOCAL_FILE) as f:
+                _local = json.load(f)
+        elif os.environ.get('SECRETS_LOCAL'):
+            _local = json.loads(os.environ['SECRETS_LOCAL'])
+        else:
+            _local = {}
+    return _local or None
+
+
+def _decode(response):
+    """Valeur d'une réponse Secrets Manager : dict si JSON, sinon chaîne (ou bytes)."""
+    if 'SecretString' not in response:
+        return response.get('SecretBinary')
+    secret = response['SecretString']
+    try:
+        # Tenter de parser le JSON si c'est un dictionnaire de secrets
+        return json.loads(secret)
+    except json.JSONDecodeError:
+        return secret
+
+
+def _store(secret_name, value):
+    with _lock:
+        _SECRETS_CACHE[secret_name] = (value, time.monotonic())
+
+
+def _fetch(secret_name):
+    response = get_client('secretsmanager').get_secret_value(SecretId=secret_name)
+    value = _decode(response)
+    _store(secret_name, value)
+    return value
+
+
+def _refresh(secret_name):
+    try:
+        _fetch(secret_name)
+    except (ClientError, BotoCoreError) as e:
+        print(f"⚠️ Rafraîchissement du secret {secret_name} impossible: {e}")
+    finally:
+        with _lock:
+            _refreshing.discard(secret_name)
+
+
+def _refresh_in_background(secret_name):
+    with _lock:
+        if secret_name in _refreshing:
+            return
+        _refreshing.add(secret_name)
+    threading.Thread(target=_refresh, args=(secret_name,), daemon=True).start()
+
 
 def get_secret(secret_name):
     """
-    Récupère un secret depuis AWS Secrets Manager.
-    Utilise un cache local pour optimiser les performances et coûts.
+    Récupère un secret (dict si le secret est un JSON, sinon chaîne).
+    Servi depuis le cache ; relu en arrière-plan après SECRETS_TTL.
     """
-    global _SECRETS_CACHE
-    
-    # 1. Vérifier le cache
-    if secret_name in _SECRETS_CACHE:
-        return _SECRETS_CACHE[secret_name]
+    local = _local_secrets()
+    if local is not None:
+        return local.get(secret_name)
 
-    region_name = os.environ.get('AWS_REGION', 'us-east-1')
-
-    # 2. Créer client Secrets Manager
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
+    cached = _SECRETS_CACHE.get(secret_name)
+    if cached:
+        value, fetched_at = cached
+        age = time.monotonic() - fetched_at
+        if age < SECRETS_TTL:
+            return value
+        if age < SECRETS_MAX_STALE:
+            _refresh_in_background(secret_name)
+            return value
 
     try:
-        # 3. Appel API AWS
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-    except ClientError as e:
+        return _fetch(secret_name)
+    except (ClientError, BotoCoreError) as e:
+        if cached:
+            print(f"⚠️ Secret {secret_name} non relu ({e}), dernière valeur conservée")
+            return cached[0]
         print(f"❌ Erreur lors de la récupération du secret {secret_name}: {e}")
-        raise e
-    else:
-        # 4. Décoder et mettre en cache
-        if 'SecretString' in get_secret_value_response:
-            secret = get_secret_value_response['SecretString']
-            try:
-                # Tenter de parser le JSON si c'est un dictionnaire de secrets
-                secret_dict = json.loads(secret)
-                _SECRETS_CACHE[secret_name] = secret_dict
-                return secret_dict
-            except json.JSONDecodeError:
-                # Sinon retourner la chaîne brute
-                _SECRETS_CACHE[secret_name] = secret
-                return secret
-                
-    return None
+        raise
+
+
+def prefetch_secrets(secret_names):
+    """
+    Charge plusieurs secrets en cache en un minimum d'appels (à appeler à
+    l'init du module). Sans effet hors AWS ; un échec est seulement signalé,
+    get_secret relira le secret au premier usage.
+    """
+    names = [name for name in dict.fromkeys(secret_names) if name]
+    if not names or _local_secrets() is not None:
+        return
+
+    client = get_client('secretsmanager')
+    for i in range(0, len(names), SECRETS_BATCH_MAX):
+        try:
+            response = client.batch_get_secret_value(SecretIdList=names[i:i + SECRETS_BATCH_MAX])
+        except (ClientError, BotoCoreError) as e:
+            print(f"⚠️ Préchargement des secrets impossible: {e}")
+            return
+        for entry in response.get('SecretValues', []):
+            _store(entry['Name'], _decode(entry))
+        for failure in response.get('Errors', []):
+            print(f"⚠️ Secret {failure.get('SecretId')} non préchargé: {failure.get('Message')}")
+
+
+def get_config(key, default=None, secret_name=SECRET_NAME):
+    """
+    Valeur de configuration : variable d'environnement `key` si définie
+    (surcharge locale), sinon clé `key` du secret de l'application.
+    """
+    value = os.environ.get(key)
+    if value:
+        return value
+    try:
+        secrets = get_secret(secret_name)
+    except (ClientError, BotoCoreError):
+        return default
+    return secrets.get(key, default) if isinstance(secrets, dict) else default
+
+
+def get_signing_key(name):
+    """
+    Clé HMAC `name` (ex: PAGINATION_CURSOR_KEY), en bytes :
+    - variable d'environnement `name` (local, tests)
+    - sinon secret généré par l'infra, nommé par la variable `<name>_SECRET`
+    - sinon clé `name` du secret de l'application
+    Lève RuntimeError si aucune source ne la fournit.
+    """
+    key = os.environ.get(name)
+    if not key and os.environ.get(f"{name}_SECRET"):
+        key = get_secret(os.environ[f"{name}_SECRET"])
+    if not key:
+        key = get_config(name)
+    if not key:
+        raise RuntimeError(f"{name} not configured")
+    return str(key).encode()
+
+
+def require_signing_key(name):
+    """
+    Vérification à l'init du module (dans Lambda) : une clé non provisionnée
+    fait échouer le démarrage du conteneur plutôt que chaque requête.
+    """
+    if os.environ.get('AWS_LAMBDA_FUNCTION_NAME') and not (os.environ.get(name) or os.environ.get(f"{name}_SECRET")):
+        raise RuntimeError(f"{name} not provisioned (set {name}_SECRET)")
+
+
+def invalidate_secret(secret_name=None):
+    """Oublie un secret (ou tout le cache) : relu au prochain accès."""
+    global _local
+    with _lock:
+        if secret_name is None:
+            _SECRETS_CACHE.clear()
+            _local = None
+        else:
+            _SECRETS_CACHE.pop(secret_name, None)
@@ -0,0 +1,95 @@
+"""
+Sérialisation JSON des réponses API.
+
+orjson est utilisé s'il est installé (plusieurs fois plus rapide que json),
+sinon la bibliothèque standard. Les deux produisent le même JSON :
+    - Decimal (DynamoDB) -> int si entier, float sinon (les montants restent numériques)
+    - datetime / date -> ISO 8601
+    - set / frozenset (DynamoDB SS/NS) -> liste
+    - bytes / Binary (DynamoDB B) -> base64
+Le moteur peut être forcé via JSON_SERIALIZER=orjson|json.
+"""
+
+import base64
+import json
+import os
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RawJSON(str):
+    """JSON déjà sérialisé (ex: réponse mise en cache), inséré tel quel."""
+
+
+def default(obj):
+    """Conversion des types non natifs JSON."""
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=str)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (bytes, bytearray)):
+        return base64.b64encode(obj).decode()
+    # Attribut DynamoDB de type B (str() rendrait des bytes). boto3 n'est pas
+    # importé ici (cold start) : sans boto3.dynamodb.types chargé, pas de Binary.
+    dynamodb_types = sys.modules.get('boto3.dynamodb.types')
+    if dynamodb_types is not None and isinstance(obj, dynamodb_types.Binary):
+        return base64.b64encode(obj.value).decode()
+    return str(obj)
+
+
+def _dumps_orjson(obj):
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def _dumps_json(obj):
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':'))
+
+
+_SERIALIZERS = {'json': _dumps_json}
+if orjson is not None:
+    _SERIALIZERS['orjson'] = _dumps_orjson
+
+_dumps = _SERIALIZERS.get(os.environ.get('JSON_SERIALIZER', ''), _SERIALIZERS.get('orjson', _dumps_json))
+
+
+def register_serializer(name, fn, activate=False):
+    """Ajoute un moteur de sérialisation (fn: obj -> str)."""
+    global _dumps
+    _SERIALIZERS[name] = fn
+    if activate:
+        _dumps = fn
+
+
+def use_serializer(name):
+    global _dumps
+    _dumps = _SERIALIZERS[name]
+
+
+def dumps(obj):
+    """
+    Sérialise `obj` en JSON (str).
+    Les valeurs RawJSON de premier niveau d'un dict sont insérées sans
+    re-sérialisation (enveloppe {"success", "data"} autour d'un cache).
+    """
+    if isinstance(obj, RawJSON):
+        return str(obj)
+    if isinstance(obj, dict) and any(isinstance(v, RawJSON) for v in obj.values()):
+        parts = [
+            f"{_dumps(str(k))}:{v if isinstance(v, RawJSON) else _dumps(v)}"
+            for k, v in obj.items()
+        ]
+        return '{' + ','.join(parts) + '}'
+    return _dumps(obj)
+
+
+def preserialize(obj):
+    """Sérialise une fois pour réutiliser le résultat dans plusieurs réponses."""
+    return RawJSON(dumps(obj))
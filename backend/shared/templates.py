@@ -0,0 +1,218 @@
+"""
+Templates des emails transactionnels.
+
+Chaque template est compilé une fois par conteneur (au premier rendu) :
+la source est découpée en fragments statiques et en noms de variables
+(`{{ nom }}`), et un rendu se limite à joindre les fragments avec les
+valeurs échappées. Le CSS, la mise en page commune et le texte fixe ne
+sont donc plus reconstruits à chaque envoi.
+
+La version texte (alternative plain-text) est dérivée automatiquement du
+HTML à la compilation, puis rendue de la même façon.
+
+Usage:
+    email = render('payment_received', first_name='Marie', reference='PAY#...', ...)
+    send_email(to, email['subject'], email['html'], text=email['text'])
+"""
+
+import html
+import re
+import threading
+
+PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+class Template:
+    """Source compilée en fragments statiques alternés avec des variables."""
+
+    def __init__(self, source, escape=True):
+        parts = PLACEHOLDER.split(source)
+        # parts = [statique, variable, statique, variable, ..., statique]
+        self.static = parts[0::2]
+        self.variables = parts[1::2]
+        self.escape = escape
+
+    def render(self, values):
+        chunks = [self.static[0]]
+        for name, static in zip(self.variables, self.static[1:]):
+            value = values[name]
+            value = '' if value is None else str(value)
+            chunks.append(html.escape(value) if self.escape else value)
+            chunks.append(static)
+        return ''.join(chunks)
+
+
+def html_to_text(source):
+    """Texte brut lisible à partir du HTML d'un email (liens conservés)."""
+    text = re.sub(r'(?is)<(head|style|script)\b.*?</\1>', '', source)
+    text = re.sub(r'(?is)<a\b[^>]*href="([^"]+)"[^>]*>(.*?)</a>', r'\2 : \1', text)
+    text = re.sub(r'(?i)<li\b[^>]*>', '- ', text)
+    text = re.sub(r'(?i)<br\s*/?>|</(p|div|h[1-6]|li|ul|tr)>', '\n', text)
+    text = re.sub(r'<[^>]+>', '', text)
+    lines = [' '.join(line.split()) for line in text.splitlines()]
+    # Une ligne vide au plus entre deux paragraphes
+    text = re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+    text = re.sub(r'\n\n(?=- )', '\n', text)
+    return html.unescape(text) + '\n'
+
+
+# --- Mise en page commune ---
+
+BASE_CSS = """
+            body { font-family: Arial, sans-serif; background: #f4f4f4; padding: 20px; }
+            .container { max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; padding: 30px; }
+            h1 { color: #2563EB; }
+            .btn { display: inline-block; background: #2563EB; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px; margin-top: 20px; }
+            .footer { color: #9CA3AF; font-size: 12px; margin-top: 30px; text-align: center; }"""
+
+FOOTER_THANKS = """
+                <p>Merci pour votre confiance!</p>
+                <p>LimaJS Motors - Transport Collectif</p>"""
+
+FOOTER_PLAIN = """
+                <p>LimaJS Motors - Transport Collectif</p>"""
+
+
+def layout(content, css='', footer=FOOTER_THANKS):
+    return f"""
+    <html>
+    <head>
+        <style>{BASE_CSS}{css}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>LimaJS Motors</h1>
+            <p>Bonjour {{{{ first_name }}}},</p>
+{content}
+            <div class="footer">{footer}
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+
+# nom -> (sujet, HTML)
+SOURCES = {
+    'subscription_reminder': ('{{ subject }}', layout("""
+            <div class="warning {{ urgency_class }}">
+                <strong>Votre abonnement {{ plan }} expire {{ urgency }}.</strong>
+            </div>
+
+            <p>Pour continuer à profiter de nos services de transport, veuillez renouveler votre abonnement.</p>
+
+            <h3>Détails:</h3>
+            <ul>
+                <li><strong>Type:</strong> {{ plan_type }}</li>
+                <li><strong>Prix:</strong> {{ price }} {{ currency }}</li>
+                <li><strong>Expiration:</strong> {{ end_date }}</li>
+            </ul>
+
+            <p>Vous trouverez la facture en pièce jointe.</p>
+
+            <p><strong>Période de grâce:</strong> Vous disposez d'une semaine après l'expiration pour renouveler sans interruption de service.</p>
+
+            <a href="https://app.limajsmotors.com/subscription" class="btn">Renouveler maintenant</a>
+""", css="""
+            .warning { background: #FEF3C7; border-left: 4px solid #F59E0B; padding: 15px; margin: 20px 0; }
+            .urgent { background: #FEE2E2; border-left: 4px solid #EF4444; }""",
+        footer="""
+                <p>Merci de votre confiance!</p>
+                <p>LimaJS Motors - Transport Collectif</p>""")),
+
+    'payment_received': ('✅ Preuve de paiement reçue - LimaJS Motors', layout("""
+            <div class="success">
+                <strong>✅ Nous avons bien reçu votre preuve de paiement !</strong>
+            </div>
+
+            <p>Votre demande est en cours de traitement. Nous vous confirmerons dans les plus brefs délais.</p>
+
+            <h3>Détails:</h3>
+            <ul>
+                <li><strong>Référence:</strong> {{ reference }}</li>
+                <li><strong>Montant:</strong> {{ amount }} {{ currency }}</li>
+                <li><strong>Date:</strong> {{ date }}</li>
+            </ul>
+
+            <p>Si vous avez des questions, n'hésitez pas à nous contacter.</p>
+""", css="""
+            .success { background: #D1FAE5; border-left: 4px solid #10B981; padding: 15px; margin: 20px 0; }""")),
+
+    'payment_approved': ('🎉 Paiement approuvé - LimaJS Motors', layout("""
+            <div class="approved">
+                <h2>🎉 Paiement Approuvé!</h2>
+            </div>
+
+            <p>Votre paiement a été vérifié et approuvé. Votre abonnement est maintenant actif!</p>
+
+            <h3>Détails:</h3>
+            <ul>
+                <li><strong>Référence:</strong> {{ reference }}</li>
+                <li><strong>Montant:</strong> {{ amount }} {{ currency }}</li>
+                <li><strong>Type:</strong> {{ plan }}</li>
+            </ul>
+
+            <p>Vous trouverez votre facture en pièce jointe.</p>
+""", css="""
+            .approved { background: #D1FAE5; border: 2px solid #10B981; padding: 20px; margin: 20px 0; border-radius: 10px; text-align: center; }
+            .approved h2 { color: #10B981; margin: 0; }""")),
+
+    'payment_rejected': ('❌ Paiement non validé - LimaJS Motors', layout("""
+            <div class="rejected">
+                <strong>❌ Votre paiement n'a pas pu être validé</strong>
+            </div>
+
+            <p><strong>Raison:</strong> {{ reason }}</p>
+
+            <h3>Détails:</h3>
+            <ul>
+                <li><strong>Référence:</strong> {{ reference }}</li>
+                <li><strong>Montant:</strong> {{ amount }} {{ currency }}</li>
+            </ul>
+
+            <p>Veuillez soumettre une nouvelle preuve de paiement.</p>
+
+            <a href="https://app.limajsmotors.com/subscription" class="btn">Réessayer</a>
+""", css="""
+            .rejected { background: #FEE2E2; border-left: 4px solid #EF4444; padding: 15px; margin: 20px 0; }""",
+        footer=FOOTER_PLAIN)),
+
+    # Code Cognito (styles en ligne, sans la mise en page commune)
+    'verification_code': ('{{ subject }}', """
+        <div style="font-family: sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
+            <h1 style="color: #333;">Bienvenue chez LimaJS !</h1>
+            <p>Voici votre code de vérification :</p>
+            <div style="background-color: #f4f4f4; padding: 15px; text-align: center; border-radius: 5px; font-size: 24px; font-weight: bold; letter-spacing: 5px;">
+                {{ code }}
+            </div>
+            <p style="color: #666; font-size: 12px; margin-top: 20px;">Ce code expirera dans quelques minutes.</p>
+        </div>
+        """),
+}
+
+_compiled = {}
+_lock = threading.Lock()
+
+
+def get_template(name):
+    """(sujet, html, texte) compilés, construits au premier usage."""
+    compiled = _compiled.get(name)
+    if compiled is None:
+        with _lock:
+            compiled = _compiled.get(name)
+            if compiled is None:
+                subject, source = SOURCES[name]
+                compiled = (
+                    Template(subject, escape=False),
+                    Template(source),
+                    Template(html_to_text(source), escape=False)
+                )
+                _compiled[name] = compiled
+    return compiled
+
+
+def render(name, **values):
+    """Rend un template : {'subject', 'html', 'text'}."""
+    subject, body, text = get_template(name)
+    return {'subject': subject.render(values), 'html': body.render(values), 'text': text.render(values)}
@@ -0,0 +1,236 @@
+"""
+Annuaire des utilisateurs pour la console admin.
+
+Projection des profils (limajs-users) et des attributs Cognito, rangée dans
+la table des utilisateurs sous des partitions dédiées, triées par valeur
+normalisée, pour répondre aux recherches par préfixe sans appeler l'API
+Cognito (ListUsers : 60 résultats par page, débit limité) :
+
+    userId = DIRECTORY#all    type = <nom>#<userId>          (liste complète, par nom)
+    userId = DIRECTORY#role#DRIVER   type = <nom>#<userId>   (liste par rôle)
+    userId = DIRECTORY#name   type = <mots du nom>#<userId>  ("marie dupont", "dupont")
+    userId = DIRECTORY#email  type = <email>#<userId>
+    userId = DIRECTORY#phone  type = <chiffres>#<userId>     (avec et sans indicatif)
+
+Chaque entrée porte le résumé affiché par la console (nom, email, rôle,
+statut...). Les attributs indexés de limajs-users y sont renommés pour que
+les entrées n'apparaissent ni dans role-index, ni dans email-index, ni dans
+phone-index : role -> userRole, email -> userEmail, phone -> userPhone.
+
+Synchronisation :
+- stream DynamoDB de limajs-users (lambda/admin/directory.py) : profils créés,
+  modifiés, suspendus ou supprimés
+- trigger Cognito post-confirmation : attributs Cognito du compte
+- scripts/sync_user_directory.py : reconstruction complète (Cognito paginé)
+
+Tant que l'annuaire est vide (avant la première reconstruction),
+directory_ready() est faux et l'API admin lit Cognito directement.
+"""
+
+import os
+import re
+import unicodedata
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from shared.db import get_table
+from shared.pagination import paginate
+
+TABLE_USERS = os.environ.get('TABLE_USERS', 'limajs-users')
+
+DIRECTORY_PREFIX = 'DIRECTORY#'
+LIST_FIELD = 'all'
+SEARCH_FIELDS = ('name', 'email', 'phone')
+PHONE_COUNTRY_CODE = '509'  # Haïti : numéros aussi indexés sans indicatif
+MIN_PHONE_PREFIX = 3
+
+# Attributs du profil recopiés dans les entrées (le rôle devient userRole)
+SUMMARY_FIELDS = ('name', 'email', 'phone', 'status', 'createdAt', 'username')
+# Champs clés d'un GSI de limajs-users -> nom dans les entrées
+ENTRY_ATTRIBUTES = {'email': 'userEmail', 'phone': 'userPhone'}
+
+# Attributs Cognito -> champs du profil
+COGNITO_ATTRIBUTES = {
+    'email': 'email',
+    'name': 'name',
+    'phone_number': 'phone',
+    'custom:role': 'role',
+}
+
+
+def normalize_name(value):
+    """Minuscules, sans accents ni ponctuation : 'Jean-Érick  Noël' -> 'jean erick noel'."""
+    text = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode().lower()
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text).split())
+
+
+def normalize_email(value):
+    return str(value or '').strip().lower()
+
+
+def normalize_phone(value):
+    return re.sub(r'\D', '', str(value or ''))
+
+
+NORMALIZERS = {'name': normalize_name, 'email': normalize_email, 'phone': normalize_phone}
+
+
+def _terms(field, value):
+    """Valeurs indexées d'un champ (plusieurs pour le nom et le téléphone)."""
+    normalized = NORMALIZERS[field](value)
+    if not normalized:
+        return []
+    if field == 'name':
+        # Chaque suffixe de mots : une recherche peut commencer par le prénom ou le nom
+        words = normalized.split()
+        return [' '.join(words[i:]) for i in range(len(words))]
+    if field == 'phone' and normalized.startswith(PHONE_COUNTRY_CODE) and len(normalized) > 8:
+        return [normalized, normalized[len(PHONE_COUNTRY_CODE):]]
+    return [normalized]
+
+
+def from_cognito(user):
+    """Utilisateur Cognito (ListUsers / trigger) -> champs du profil."""
+    attributes = user.get('Attributes') or user.get('UserAttributes') or []
+    if isinstance(attributes, list):
+        attributes = {attr['Name']: attr['Value'] for attr in attributes}
+    profile = {field: attributes[name] for name, field in COGNITO_ATTRIBUTES.items() if attributes.get(name)}
+    if attributes.get('sub'):
+        profile['userId'] = f"USER#{attributes['sub']}"
+    if user.get('Username'):
+        profile['username'] = user['Username']
+    if 'Enabled' in user:
+        profile['enabled'] = user['Enabled']
+    if user.get('UserCreateDate'):
+        profile['createdAt'] = user['UserCreateDate'].isoformat()
+    return profile
+
+
+def directory_entries(profile):
+    """Entrées d'annuaire d'un profil ({} si ce n'est pas un profil utilisateur)."""
+    user_id = profile.get('userId') or ''
+    if not user_id.startswith('USER#') or profile.get('type', 'PROFILE') != 'PROFILE':
+        return {}
+
+    summary = {ENTRY_ATTRIBUTES.get(field, field): profile[field]
+               for field in SUMMARY_FIELDS if profile.get(field) not in (None, '')}
+    summary['memberId'] = user_id
+    summary['userRole'] = profile.get('role') or 'PASSENGER'
+    summary['enabled'] = (bool(profile.get('enabled', True)) and profile.get('isActive', True) is not False
+                          and profile.get('status') != 'SUSPENDED')
+
+    entries = {}
+    sort_name = normalize_name(profile.get('name')) or normalize_email(profile.get('email'))
+    keys = [(LIST_FIELD, sort_name), (f"role#{summary['userRole']}", sort_name)]
+    keys += [(field, term) for field in SEARCH_FIELDS for term in _terms(field, profile.get(field))]
+    for field, term in keys:
+        key = (f"{DIRECTORY_PREFIX}{field}", f"{term}#{user_id}")
+        entries[key] = {'userId': key[0], 'type': key[1], **summary}
+    return entries
+
+
+def apply_changes(changes):
+    """
+    Écrit les différences d'annuaire [(anciennes entrées, nouvelles entrées)] :
+    entrées disparues supprimées, entrées nouvelles ou modifiées réécrites.
+    Retourne le nombre d'écritures.
+    """
+    writes = 0
+    with get_table(TABLE_USERS).batch_writer(overwrite_by_pkeys=['userId', 'type']) as batch:
+        for old, new in changes:
+            for key in old.keys() - new.keys():
+                batch.delete_item(Key={'userId': key[0], 'type': key[1]})
+                writes += 1
+            for key, entry in new.items():
+                if old.get(key) != entry:
+                    batch.put_item(Item=entry)
+                    writes += 1
+    return writes
+
+
+def sync_user(profile, previous=None):
+    """Met l'annuaire à jour pour un profil (previous : son état précédent, si connu)."""
+    return apply_changes([(directory_entries(previous or {}), directory_entries(profile))])
+
+
+def search_users(query='', role=None, field=None, limit=50, cursor=None):
+    """
+    Liste ou recherche par préfixe dans l'annuaire.
+
+    - query vide : tous les utilisateurs (ou ceux du rôle), par nom
+    - field : 'name', 'email' ou 'phone' ; deviné depuis query si absent
+      (@ -> email, chiffres -> téléphone, sinon nom)
+    - role : PASSENGER, DRIVER, ADMIN
+
+    Retourne (users, next_cursor). Lève ValueError si la recherche est invalide,
+    shared.pagination.InvalidCursor si le curseur est altéré.
+    """
+    query = (query or '').strip()
+    if query and not field:
+        digits = normalize_phone(query)
+        if '@' in query:
+            field = 'email'
+        elif digits and re.fullmatch(r'[\d\s+().-]+', query):
+            field = 'phone'
+        else:
+            field = 'name'
+    if field and field not in SEARCH_FIELDS:
+        raise ValueError(f"field must be one of {', '.join(SEARCH_FIELDS)}")
+
+    role = (role or '').upper()
+    term = NORMALIZERS[field](query) if query else ''
+    if query and field == 'phone' and len(term) < MIN_PHONE_PREFIX:
+        raise ValueError(f"Phone search needs at least {MIN_PHONE_PREFIX} digits")
+
+    if term:
+        partition = f"{DIRECTORY_PREFIX}{field}"
+        condition = Key('userId').eq(partition) & Key('type').begins_with(term)
+    else:
+        partition = f"{DIRECTORY_PREFIX}role#{role}" if role else f"{DIRECTORY_PREFIX}{LIST_FIELD}"
+        condition = Key('userId').eq(partition)
+    query_kwargs = {'KeyConditionExpression': condition}
+    # Recherche + rôle : le rôle filtre les résultats de la recherche
+    filtered = bool(term and role)
+    if filtered:
+        query_kwargs['FilterExpression'] = Attr('userRole').eq(role)
+
+    items, next_cursor = paginate(
+        get_table(TABLE_USERS), limit, cursor,
+        scope=f"directory:{partition}:{term}:{role}",
+        key_attributes=['userId', 'type'] if filtered else None,
+        **query_kwargs
+    )
+
+    users, seen = [], set()
+    for item in items:
+        # Un nom peut correspondre par plusieurs de ses suffixes ("jean jean")
+        if item['memberId'] in seen:
+            continue
+        seen.add(item['memberId'])
+        users.append(to_user(item))
+    return users, next_cursor
+
+
+_ready = False
+
+
+def directory_ready():
+    """Vrai dès que l'annuaire contient une entrée (mémorisé par conteneur)."""
+    global _ready
+    if not _ready:
+        response = get_table(TABLE_USERS).query(
+            KeyConditionExpression=Key('userId').eq(f"{DIRECTORY_PREFIX}{LIST_FIELD}"),
+            Limit=1
+        )
+        _ready = bool(response['Items'])
+    return _ready
+
+
+def to_user(entry):
+    """Entrée d'annuaire -> utilisateur renvoyé par l'API admin."""
+    user = {field: entry[ENTRY_ATTRIBUTES.get(field, field)]
+            for field in SUMMARY_FIELDS if ENTRY_ATTRIBUTES.get(field, field) in entry}
+    user['userId'] = entry['memberId']
+    user['role'] = entry.get('userRole')
+    user['enabled'] = entry.get('enabled', True)
+    return user
@@ -12,6 +12,8 @@ import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import * as iam from 'aws-cdk-lib/aws-iam';
 import * as events from 'aws-cdk-lib/aws-events';
 import * as targets from 'aws-cdk-lib/aws-events-targets';
+import * as lambdaEventSources from 'aws-cdk-lib/aws-lambda-event-sources';
+import * as sqs from 'aws-cdk-lib/aws-sqs';
 import * as path from 'path';
 
 export class LimajsMotorsStack extends cdk.Stack {
@@ -53,6 +55,12 @@ export class LimajsMotorsStack extends cdk.Stack {
         const tableTrips = process.env.TABLE_TRIPS || 'limajs-trips';
         const tableGpsPositions = process.env.TABLE_GPS_POSITIONS || 'limajs-gps-positions';
         const tableConnections = process.env.TABLE_CONNECTIONS || 'limajs-websocket-connections';
+        // Stream of limajs-nfc-cards (NEW_AND_OLD_IMAGES), feeds the NFC validation index changelog
+        const nfcTableStreamArn = process.env.NFC_TABLE_STREAM_ARN || '';
+        // Stream of limajs-users (scripts/setup_user_directory.py), feeds the admin user directory
+        const usersTableStreamArn = process.env.USERS_TABLE_STREAM_ARN || '';
+        // Single router Lambda for all HTTP routes (one warm container shared across domains)
+        const useApiRouter = process.env.USE_API_ROUTER === 'true';
 
         // --- 1. S3 Frontend ---
         // NOTE: Do NOT change removalPolicy or autoDeleteObjects on existing bucket
@@ -73,6 +81,11 @@ export class LimajsMotorsStack extends cdk.Stack {
             removalPolicy: cdk.RemovalPolicy.RETAIN,
             cors: [{ allowedMethods: [s3.HttpMethods.GET, s3.HttpMethods.PUT], allowedOrigins: ['*'], allowedHeaders: ['*'] }]
         });
+        // QR PNGs cached by tickets/crud (QR_CACHE_BACKEND=s3): tickets live 15 minutes
+        invoicesBucket.addLifecycleRule({ prefix: 'qr-cache/', expiration: cdk.Duration.days(1) });
+        // S3 rather than dynamodb: a PNG on the ticket item would be read back by every
+        // GET /tickets/my through user-tickets-index (projection ALL)
+        const qrCacheEnv = { QR_CACHE_BACKEND: 's3', QR_CACHE_BUCKET: invoicesBucket.bucketName };
 
         // Create Origin Access Identity (OAI) for CloudFront
         const originAccessIdentity = new cloudfront.OriginAccessIdentity(this, 'OAI');
@@ -129,11 +142,24 @@ export class LimajsMotorsStack extends cdk.Stack {
             })),
         });
 
+        // Generated signing keys: created once, kept across deploys (unlike apiSecrets, rewritten on every deploy).
+        // Lambdas receive the secret name (<KEY>_SECRET) and read the value through shared/secrets.
+        const signingKeySecret = (id: string, secretName: string, description: string) =>
+            new secretsmanager.Secret(this, id, {
+                secretName,
+                description,
+                generateSecretString: { passwordLength: 64, excludePunctuation: true },
+            });
+        const paginationCursorKey = signingKeySecret(
+            'PaginationCursorKeySecret', 'limajs/backend/pagination-cursor-key', 'HMAC key for pagination cursors');
+        const nfcBundleSigningKey = signingKeySecret(
+            'NfcBundleSigningKeySecret', 'limajs/backend/nfc-bundle-signing-key', 'HMAC key for offline NFC bundles (shared with driver apps)');
+
         // --- 3. Existing Resources (DynamoDB Tables) ---
         const tableNames = [
             'limajs-users', 'limajs-buses', 'limajs-routes', 'limajs-schedules',
             'limajs-subscriptions', 'limajs-payments', 'limajs-tickets',
-            'limajs-nfc-cards', 'limajs-trips', 'limajs-gps-positions',
+            'limajs-nfc-cards', 'limajs-nfc-changelog', 'limajs-trips', 'limajs-gps-positions',
             'limajs-websocket-connections', 'limajs-notifications',
             // New tables for wallet/invoices
             'limajs-invoices', 'limajs-wallet-transactions', 'limajs-passenger-trips'
@@ -144,6 +170,16 @@ export class LimajsMotorsStack extends cdk.Stack {
             tables[tableName] = dynamodb.Table.fromTableName(this, `Table_${tableName}`, tableName);
         }
 
+        // Delivery queue: emails and push jobs, drained by the delivery worker.
+        // Retries/backoff are handled by the worker; the redrive policy only catches crashed batches.
+        const deliveryDeadLetterQueue = new sqs.Queue(this, 'DeliveryDeadLetterQueue', {
+            retentionPeriod: cdk.Duration.days(14),
+        });
+        const deliveryQueue = new sqs.Queue(this, 'DeliveryQueue', {
+            visibilityTimeout: cdk.Duration.seconds(180),
+            deadLetterQueue: { queue: deliveryDeadLetterQueue, maxReceiveCount: 10 },
+        });
+
         // --- 4. Python Backend Lambdas ---
         const backendCodePath = process.env.BACKEND_CODE_PATH || path.join(__dirname, '../../backend');
 
@@ -155,9 +191,11 @@ export class LimajsMotorsStack extends cdk.Stack {
                 timeout: cdk.Duration.seconds(timeout),
                 environment: {
                     SECRET_NAME: apiSecrets.secretName,
+                    PAGINATION_CURSOR_KEY_SECRET: paginationCursorKey.secretName,
+                    NFC_BUNDLE_SIGNING_KEY_SECRET: nfcBundleSigningKey.secretName,
                     INVOICE_BUCKET: invoicesBucket.bucketName,
                     FROM_EMAIL: fromEmail,
-                    RESEND_API_KEY: resendApiKey,
+                    // RESEND_API_KEY lu dans apiSecrets (rotation sans redéploiement)
                     // Cognito configuration for auth lambdas
                     COGNITO_USER_POOL_ID: cognitoUserPoolId,
                     COGNITO_CLIENT_ID: cognitoClientId,
@@ -166,6 +204,9 @@ export class LimajsMotorsStack extends cdk.Stack {
                     WEBSOCKET_API_ID: websocketApiId,
                     // AWS Location
                     AWS_LOCATION_TRACKER_NAME: locationTrackerName,
+                    // Delivery queue (shared/delivery_queue.py)
+                    DELIVERY_QUEUE_URL: deliveryQueue.queueUrl,
+                    DELIVERY_DLQ_URL: deliveryDeadLetterQueue.queueUrl,
                     AWS_NODEJS_CONNECTION_REUSE_ENABLED: '1',
                     ...env
                 },
@@ -173,6 +214,13 @@ export class LimajsMotorsStack extends cdk.Stack {
             });
 
             apiSecrets.grantRead(fn);
+            paginationCursorKey.grantRead(fn);
+            nfcBundleSigningKey.grantRead(fn);
+            // Préchargement groupé (shared.secrets.prefetch_secrets): action sans ressource
+            fn.addToRolePolicy(new iam.PolicyStatement({
+                actions: ['secretsmanager:BatchGetSecretValue'],
+                resources: ['*']
+            }));
             for (const table of Object.values(tables)) {
                 table.grantReadWriteData(fn);
                 fn.addToRolePolicy(new iam.PolicyStatement({
@@ -181,6 +229,8 @@ export class LimajsMotorsStack extends cdk.Stack {
                 }));
             }
             invoicesBucket.grantReadWrite(fn);
+            deliveryQueue.grantSendMessages(fn);
+            deliveryDeadLetterQueue.grantSendMessages(fn);
 
             fn.addToRolePolicy(new iam.PolicyStatement({
                 actions: [
@@ -231,10 +281,15 @@ export class LimajsMotorsStack extends cdk.Stack {
             'tripsCrud': createLambda('FnTripsCrud', 'lambda/trips/crud.lambda_handler'),
             'paymentsCrud': createLambda('FnPaymentsCrud', 'lambda/payments/crud.lambda_handler'),
             'subscriptionsCrud': createLambda('FnSubscriptionsCrud', 'lambda/subscriptions/crud.lambda_handler'),
-            'ticketsCrud': createLambda('FnTicketsCrud', 'lambda/tickets/crud.lambda_handler'),
+            'ticketsCrud': createLambda('FnTicketsCrud', 'lambda/tickets/crud.lambda_handler', qrCacheEnv),
             'nfcCrud': createLambda('FnNfcCrud', 'lambda/nfc/crud.lambda_handler'),
+            'nfcStream': createLambda('FnNfcStream', 'lambda/nfc/stream.lambda_handler'),
+            'nfcBundleJob': createLambda('FnNfcBundleJob', 'lambda/nfc/bundle.handler', { NFC_BUNDLE_BUCKET: invoicesBucket.bucketName }, 120),
+            'nfcBundle': createLambda('FnNfcBundle', 'lambda/nfc/bundle.lambda_handler', { NFC_BUNDLE_BUCKET: invoicesBucket.bucketName }),
             'adminUsers': createLambda('FnAdminUsers', 'lambda/admin/users.lambda_handler'),
             'adminReports': createLambda('FnAdminReports', 'lambda/admin/reports.lambda_handler'),
+            'userDirectory': createLambda('FnUserDirectory', 'lambda/admin/directory.lambda_handler', {}, 60),
+            'userDirectoryCognito': createLambda('FnUserDirectoryCognito', 'lambda/admin/directory.cognito_handler'),
             'wsConnect': createLambda('FnWsConnect', 'lambda/websocket/connect.lambda_handler'),
             'wsDisconnect': createLambda('FnWsDisconnect', 'lambda/websocket/disconnect.lambda_handler'),
             'wsSubscribe': createLambda('FnWsSubscribe', 'lambda/websocket/subscribe.lambda_handler'),
@@ -242,12 +297,22 @@ export class LimajsMotorsStack extends cdk.Stack {
             'gpsIngest': createLambda('FnGpsIngest', 'lambda/gps/ingest.lambda_handler'),
             'contactForm': contactLambda,
             // --- NEW: Wallet, History, Invoices ---
-            'walletCrud': createLambda('FnWalletCrud', 'lambda/wallet/crud.handler'),
+            'walletCrud': createLambda('FnWalletCrud', 'lambda/wallet/crud.handler', {}, 60),
             'tripsHistory': createLambda('FnTripsHistory', 'lambda/trips/history.handler'),
             'paymentsHistory': createLambda('FnPaymentsHistory', 'lambda/payments/history.handler'),
+            'invoicesDownload': createLambda('FnInvoicesDownload', 'lambda/invoices/download.lambda_handler'),
             'subscriptionReminder': createLambda('FnSubscriptionReminder', 'lambda/subscriptions/reminder.handler', {}, 60),
+            'deliveryWorker': createLambda('FnDeliveryWorker', 'lambda/notifications/worker.lambda_handler', {}, 120),
+            'notificationsPush': createLambda('FnNotificationsPush', 'lambda/notifications/push.lambda_handler', {}, 300),
         };
 
+        // Broadcasts relaunch their own function when time runs short (notifications/push.continue_broadcast).
+        // ARN pattern instead of grantInvoke(self): avoids a role <-> function dependency cycle
+        lambdas.notificationsPush.addToRolePolicy(new iam.PolicyStatement({
+            actions: ['lambda:InvokeFunction'],
+            resources: [`arn:aws:lambda:us-east-1:513729761883:function:${this.stackName}-FnNotificationsPush*`]
+        }));
+
         // Grant Admin permissions to Admin Users Lambda
         lambdas.adminUsers.addToRolePolicy(new iam.PolicyStatement({
             actions: [
@@ -259,6 +324,59 @@ export class LimajsMotorsStack extends cdk.Stack {
             resources: [`arn:aws:cognito-idp:us-east-1:513729761883:userpool/${cognitoUserPoolId}`]
         }));
 
+        // Optional consolidated router: same code and permissions as the domain Lambdas
+        const apiRouter = useApiRouter
+            ? createLambda('FnApiRouter', 'lambda/router/main.lambda_handler', qrCacheEnv, 60)
+            : undefined;
+        if (apiRouter) {
+            apiRouter.addToRolePolicy(new iam.PolicyStatement({
+                actions: ['cognito-idp:ListUsers', 'cognito-idp:AdminDisableUser', 'cognito-idp:AdminEnableUser'],
+                resources: [`arn:aws:cognito-idp:us-east-1:513729761883:userpool/${cognitoUserPoolId}`]
+            }));
+        }
+        // Push stays on its own function: broadcasts need its timeout and re-invoke it by ARN
+        const routeTarget = (fn: lambda.Function) =>
+            (apiRouter && fn !== contactLambda && fn !== lambdas.notificationsPush ? apiRouter : fn);
+
+        // NFC changelog: DynamoDB stream -> index refresh of the validation containers
+        if (nfcTableStreamArn) {
+            const nfcTable = dynamodb.Table.fromTableAttributes(this, 'Table_limajs-nfc-cards_stream', {
+                tableName: 'limajs-nfc-cards',
+                tableStreamArn: nfcTableStreamArn
+            });
+            lambdas.nfcStream.addEventSource(new lambdaEventSources.DynamoEventSource(nfcTable, {
+                startingPosition: lambda.StartingPosition.LATEST,
+                batchSize: 100,
+                retryAttempts: 3
+            }));
+        }
+
+        // Admin user directory: profiles stream + Cognito post-confirmation trigger.
+        // The pool is imported: the trigger is attached after deploy by scripts/setup_user_directory.py
+        // (deploy workflow, from the UserDirectoryTriggerArn output)
+        if (usersTableStreamArn) {
+            const usersTable = dynamodb.Table.fromTableAttributes(this, 'Table_limajs-users_stream', {
+                tableName: 'limajs-users',
+                tableStreamArn: usersTableStreamArn
+            });
+            lambdas.userDirectory.addEventSource(new lambdaEventSources.DynamoEventSource(usersTable, {
+                startingPosition: lambda.StartingPosition.LATEST,
+                batchSize: 100,
+                retryAttempts: 3
+            }));
+        }
+        lambdas.userDirectoryCognito.addPermission('CognitoInvoke', {
+            principal: new iam.ServicePrincipal('cognito-idp.amazonaws.com'),
+            sourceArn: `arn:aws:cognito-idp:us-east-1:513729761883:userpool/${cognitoUserPoolId}`
+        });
+
+        // Delivery worker: batches of emails/push, partial batch failures reported to SQS
+        lambdas.deliveryWorker.addEventSource(new lambdaEventSources.SqsEventSource(deliveryQueue, {
+            batchSize: 50,
+            maxBatchingWindow: cdk.Duration.seconds(2),
+            reportBatchItemFailures: true
+        }));
+
         // --- 5. EventBridge Rule for Daily Subscription Reminders ---
         const reminderRule = new events.Rule(this, 'SubscriptionReminderRule', {
             schedule: events.Schedule.cron({ minute: '0', hour: '13' }), // 8h Haiti = 13h UTC
@@ -266,10 +384,18 @@ export class LimajsMotorsStack extends cdk.Stack {
         });
         reminderRule.addTarget(new targets.LambdaFunction(lambdas.subscriptionReminder));
 
+        // Offline NFC whitelist bundle for driver devices
+        const nfcBundleRule = new events.Rule(this, 'NfcBundleRule', {
+            schedule: events.Schedule.rate(cdk.Duration.minutes(5)),
+            description: 'Rebuild the signed offline NFC card bundle (full + deltas)',
+        });
+        nfcBundleRule.addTarget(new targets.LambdaFunction(lambdas.nfcBundleJob));
+
         // --- 6. API Gateway (HTTP API) with Cognito JWT Authorizer ---
         const httpApi = new apigwv2.HttpApi(this, 'LimajsMotorsApi', {
             corsPreflight: {
-                allowHeaders: ['Content-Type', 'Authorization', 'X-Amz-Date', 'X-Api-Key'],
+                allowHeaders: ['Content-Type', 'Authorization', 'X-Amz-Date', 'X-Api-Key', 'Idempotency-Key', 'If-None-Match'],
+                exposeHeaders: ['ETag', 'Content-Encoding'],
                 allowMethods: [apigwv2.CorsHttpMethod.ANY],
                 allowOrigins: ['*'],
             },
@@ -288,7 +414,7 @@ export class LimajsMotorsStack extends cdk.Stack {
             httpApi.addRoutes({
                 path,
                 methods: [method],
-                integration: new apigwv2_integrations.HttpLambdaIntegration(`${id}_${path.replace(/\//g, '')}_${method}`, fn)
+                integration: new apigwv2_integrations.HttpLambdaIntegration(`${id}_${path.replace(/\//g, '')}_${method}`, routeTarget(fn))
             });
         };
 
@@ -297,7 +423,7 @@ export class LimajsMotorsStack extends cdk.Stack {
             httpApi.addRoutes({
                 path,
                 methods: [method],
-                integration: new apigwv2_integrations.HttpLambdaIntegration(`${id}_${path.replace(/\//g, '')}_${method}_auth`, fn),
+                integration: new apigwv2_integrations.HttpLambdaIntegration(`${id}_${path.replace(/\//g, '')}_${method}_auth`, routeTarget(fn)),
                 authorizer: jwtAuthorizer
             });
         };
@@ -337,23 +463,34 @@ export class LimajsMotorsStack extends cdk.Stack {
         addProtectedRoute('/payments/presigned-url', apigwv2.HttpMethod.POST, lambdas.paymentsCrud);
         addProtectedRoute('/payments/upload', apigwv2.HttpMethod.POST, lambdas.paymentsCrud);
         addProtectedRoute('/payments/history', apigwv2.HttpMethod.GET, lambdas.paymentsHistory);
+        addProtectedRoute('/invoices/{id}', apigwv2.HttpMethod.GET, lambdas.invoicesDownload);
 
         // Wallet (Protected)
         addProtectedRoute('/wallet/balance', apigwv2.HttpMethod.GET, lambdas.walletCrud);
         addProtectedRoute('/wallet/transactions', apigwv2.HttpMethod.GET, lambdas.walletCrud);
         addProtectedRoute('/wallet/recharge', apigwv2.HttpMethod.POST, lambdas.walletCrud);
         addProtectedRoute('/wallet/pay', apigwv2.HttpMethod.POST, lambdas.walletCrud);
+        addProtectedRoute('/wallet/recharges/approve', apigwv2.HttpMethod.POST, lambdas.walletCrud);
 
         // Tickets (Protected)
         addProtectedRoute('/tickets/generate', apigwv2.HttpMethod.POST, lambdas.ticketsCrud);
         addProtectedRoute('/tickets/my', apigwv2.HttpMethod.GET, lambdas.ticketsCrud);
         addProtectedRoute('/tickets/validate', apigwv2.HttpMethod.POST, lambdas.ticketsCrud);
         addProtectedRoute('/tickets/{id}', apigwv2.HttpMethod.GET, lambdas.ticketsCrud);
+        addProtectedRoute('/tickets/{id}/qr', apigwv2.HttpMethod.GET, lambdas.ticketsCrud);
 
         // NFC (Protected)
         addProtectedRoute('/nfc/my-card', apigwv2.HttpMethod.GET, lambdas.nfcCrud);
         addProtectedRoute('/nfc/validate', apigwv2.HttpMethod.POST, lambdas.nfcCrud);
         addProtectedRoute('/nfc/recharge', apigwv2.HttpMethod.POST, lambdas.nfcCrud);
+        addProtectedRoute('/nfc/bundle', apigwv2.HttpMethod.GET, lambdas.nfcBundle);
+
+        // Notifications (Protected - send/broadcast require admin role)
+        addProtectedRoute('/notifications/register', apigwv2.HttpMethod.POST, lambdas.notificationsPush);
+        addProtectedRoute('/notifications/topics', apigwv2.HttpMethod.POST, lambdas.notificationsPush);
+        addProtectedRoute('/notifications/send', apigwv2.HttpMethod.POST, lambdas.notificationsPush);
+        addProtectedRoute('/notifications/broadcast', apigwv2.HttpMethod.POST, lambdas.notificationsPush);
+        addProtectedRoute('/notifications/history', apigwv2.HttpMethod.GET, lambdas.notificationsPush);
 
         // Admin (Protected - requires admin role)
         addProtectedRoute('/admin/users', apigwv2.HttpMethod.GET, lambdas.adminUsers);
@@ -369,6 +506,7 @@ export class LimajsMotorsStack extends cdk.Stack {
         new cdk.CfnOutput(this, 'DistributionId', { value: distribution.distributionId });
         new cdk.CfnOutput(this, 'SecretName', { value: apiSecrets.secretName });
         new cdk.CfnOutput(this, 'InvoicesBucketName', { value: invoicesBucket.bucketName });
+        new cdk.CfnOutput(this, 'UserDirectoryTriggerArn', { value: lambdas.userDirectoryCognito.functionArn });
     }
 }
 